@@ -0,0 +1,71 @@
+# Сравнение бэкендов эмбеддингов на локальном корпусе: скорость и совпадение выдачи.
+# Запуск: python scripts/bench_embeddings.py --corpus data/inbox --backend onnx-int8
+# Корпус: файлы каталога режутся на чанки как при индексации; запросами служат
+# первые предложения случайных чанков (или строки из --queries).
+import argparse
+import random
+import time
+
+import numpy as np
+
+from weavelens.models.embeddings import load_embedder
+from weavelens.pipeline.index import _collect_files, chunk_text, read_text_from_path
+
+
+def _encode(model, texts, batch_size):
+    t0 = time.perf_counter()
+    embs = model.encode(texts, batch_size=batch_size, normalize_embeddings=True,
+                        show_progress_bar=False)
+    return np.asarray(embs, dtype=np.float32), time.perf_counter() - t0
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--corpus", required=True, help="каталог с документами")
+    ap.add_argument("--backend", default="onnx-int8", help="onnx | onnx-int8")
+    ap.add_argument("--baseline", default="torch")
+    ap.add_argument("--max-chunks", type=int, default=1000)
+    ap.add_argument("--queries", help="файл с запросами, по одному в строке")
+    ap.add_argument("--n-queries", type=int, default=50)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--batch-size", type=int, default=32)
+    args = ap.parse_args()
+
+    chunks = []
+    for fp in _collect_files([args.corpus]):
+        chunks.extend(chunk_text(read_text_from_path(fp)))
+        if len(chunks) >= args.max_chunks:
+            break
+    chunks = chunks[: args.max_chunks]
+    if not chunks:
+        raise SystemExit("в корпусе нет текста")
+
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    else:
+        rnd = random.Random(0)
+        sample = rnd.sample(chunks, min(args.n_queries, len(chunks)))
+        queries = [c.split(".")[0][:200] for c in sample]
+
+    results = {}
+    for backend in (args.baseline, args.backend):
+        model = load_embedder(backend)
+        _encode(model, chunks[: args.batch_size], args.batch_size)  # прогрев
+        docs, dt = _encode(model, chunks, args.batch_size)
+        qs, _ = _encode(model, queries, args.batch_size)
+        top = np.argsort(-(qs @ docs.T), axis=1)[:, : args.k]
+        results[backend] = (docs, top)
+        print(f"{backend:10s} {len(chunks) / dt:8.1f} chunks/s ({dt:.1f}s, {len(chunks)} chunks)")
+
+    base_docs, base_top = results[args.baseline]
+    docs, top = results[args.backend]
+    cos = float(np.mean(np.sum(base_docs * docs, axis=1)))
+    overlap = float(np.mean([len(set(a) & set(b)) / args.k for a, b in zip(base_top, top)]))
+    top1 = float(np.mean(base_top[:, 0] == top[:, 0]))
+    print(f"mean cosine(baseline, {args.backend}) = {cos:.4f}")
+    print(f"top-{args.k} overlap = {overlap:.3f}, top-1 agreement = {top1:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# Сравнение скорости записи чанков: по одному insert против batch API.
+# Запуск: python scripts/bench_ingest.py --n 2000
+# Пишет во временную коллекцию и удаляет её по завершении.
+import argparse
+import time
+
+from weaviate.classes.config import Configure, DataType, Property
+
+from weavelens.db import weaviate_client as wv
+
+BENCH_COLLECTION = "bench_chunk"
+
+
+def _objects(n: int, tag: str):
+    for i in range(n):
+        props = {
+            "text": f"Синтетический чанк {i} " + "lorem ipsum " * 80,
+            "order": i,
+            "doc_uuid": tag,
+            "path": f"/bench/{tag}.txt",
+            "title": f"{tag}.txt",
+        }
+        yield wv.chunk_uuid(tag, i), props
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=2000, help="число чанков на каждый режим")
+    args = ap.parse_args()
+
+    client = wv.client()
+    try:
+        if client.collections.exists(BENCH_COLLECTION):
+            client.collections.delete(BENCH_COLLECTION)
+        client.collections.create(
+            name=BENCH_COLLECTION,
+            properties=[
+                Property(name="text", data_type=DataType.TEXT),
+                Property(name="order", data_type=DataType.INT),
+                Property(name="doc_uuid", data_type=DataType.TEXT),
+                Property(name="path", data_type=DataType.TEXT),
+                Property(name="title", data_type=DataType.TEXT),
+            ],
+            vectorizer_config=Configure.Vectorizer.none(),
+        )
+        coll = client.collections.get(BENCH_COLLECTION)
+
+        t0 = time.perf_counter()
+        for uid, props in _objects(args.n, "single"):
+            coll.data.insert(properties=props, uuid=uid)
+        single = time.perf_counter() - t0
+
+        errors: list = []
+        t0 = time.perf_counter()
+        written = wv.batch_insert(coll, _objects(args.n, "batch"), errors)
+        batched = time.perf_counter() - t0
+
+        print(f"per-insert: {args.n / single:10.1f} obj/s ({single:.2f}s)")
+        print(
+            f"batched:    {written / batched:10.1f} obj/s ({batched:.2f}s, "
+            f"batch_size={wv.settings.weaviate_batch_size}, "
+            f"concurrency={wv.settings.weaviate_batch_concurrency}, errors={len(errors)})"
+        )
+        print(f"speedup:    x{single / batched:.1f}")
+    finally:
+        if client.collections.exists(BENCH_COLLECTION):
+            client.collections.delete(BENCH_COLLECTION)
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# Пиковая память извлечения+чанкинга: целиком в памяти против потокового режима.
+# Запуск: python scripts/bench_memory.py --mb 512
+# Каждый режим выполняется в отдельном процессе, печатается ru_maxrss.
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def _make_file(path: str, mb: int) -> None:
+    line = ("Синтетический текст для проверки памяти ингеста. " * 20 + "\n").encode("utf-8")
+    target = mb * 1024 * 1024
+    with open(path, "wb") as f:
+        written = 0
+        while written < target:
+            f.write(line)
+            written += len(line)
+
+
+def _run(mode: str, path: str) -> None:
+    from weavelens.pipeline import index
+
+    t0 = time.perf_counter()
+    n = 0
+    if mode == "full":
+        with open(path, "rb") as f:
+            index.sha256_bytes(f.read())
+        n = len(index.chunk_text(index.read_text_from_path(path)))
+    else:
+        index.sha256_file(path)
+        for _ in index._batched(index.iter_chunk_text(index.iter_text_from_path(path)), 200):
+            n += 1
+    dt = time.perf_counter() - t0
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    label = "chunks" if mode == "full" else "batches"
+    print(f"{mode:9s} peak RSS {rss_mb:8.1f} MB  {dt:6.2f}s  {label}={n}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mb", type=int, default=512, help="размер синтетического файла, МБ")
+    ap.add_argument("--mode", choices=["full", "streaming"], help=argparse.SUPPRESS)
+    ap.add_argument("--path", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.mode:
+        _run(args.mode, args.path)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "large.txt")
+        _make_file(path, args.mb)
+        print(f"file: {args.mb} MB")
+        for mode in ("full", "streaming"):
+            subprocess.run(
+                [sys.executable, __file__, "--mode", mode, "--path", path], check=True
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# Задержка поиска: BM25 против vector/hybrid (с учётом кодирования запроса).
+# Запуск: python scripts/bench_search.py --queries queries.txt --k 8 --repeat 3
+# queries.txt — по одному запросу в строке; без файла берётся короткий встроенный набор.
+import argparse
+import statistics
+import time
+
+from weavelens.db import weaviate_client as wv
+from weavelens.models.embeddings import embed_query, get_embedder
+
+DEFAULT_QUERIES = [
+    "как настроить резервное копирование",
+    "что делать, если сервер не отвечает",
+    "требования к паролям пользователей",
+    "порядок согласования отпуска",
+    "how to rotate api keys",
+]
+
+
+def _pct(values, p):
+    values = sorted(values)
+    idx = min(len(values) - 1, max(0, round(p / 100 * (len(values) - 1))))
+    return values[idx] * 1000
+
+
+def _report(name, values):
+    print(f"{name:18s} p50 {_pct(values, 50):8.1f} ms   p95 {_pct(values, 95):8.1f} ms")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--queries", help="файл с запросами, по одному в строке")
+    ap.add_argument("--k", type=int, default=8)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    queries = DEFAULT_QUERIES
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    queries = queries * args.repeat
+
+    get_embedder()  # загрузка модели не входит в замер
+    bm25, embed, vector, hybrid = [], [], [], []
+    try:
+        for q in queries:
+            t0 = time.perf_counter()
+            wv.search_bm25(q, args.k)
+            bm25.append(time.perf_counter() - t0)
+
+            t0 = time.perf_counter()
+            vec = embed_query(q)
+            embed.append(time.perf_counter() - t0)
+
+            t0 = time.perf_counter()
+            wv.search_vector(vec, args.k)
+            vector.append(time.perf_counter() - t0 + embed[-1])
+
+            t0 = time.perf_counter()
+            wv.search_hybrid(q, vec, args.k)
+            hybrid.append(time.perf_counter() - t0 + embed[-1])
+    finally:
+        wv.client().close()
+
+    print(f"queries: {len(queries)}")
+    _report("bm25", bm25)
+    _report("query embedding", embed)
+    _report("vector (+embed)", vector)
+    _report("hybrid (+embed)", hybrid)
+    added = [h - b for h, b in zip(hybrid, bm25)]
+    print(f"hybrid overhead vs bm25: p50 {statistics.median(added) * 1000:.1f} ms, "
+          f"p95 {_pct(added, 95):.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
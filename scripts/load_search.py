@@ -0,0 +1,86 @@
+# Нагрузочный тест /search: N одновременных клиентов, пропускная способность и задержки.
+# Запуск:
+#   python scripts/load_search.py --url http://localhost:8000/api --clients 1,4,16 --duration 10
+# При неблокирующем поиске RPS должен расти с числом клиентов, а не упираться в один запрос.
+import argparse
+import asyncio
+import time
+
+import httpx
+
+DEFAULT_QUERIES = [
+    "как настроить резервное копирование",
+    "что делать, если сервер не отвечает",
+    "требования к паролям пользователей",
+    "порядок согласования отпуска",
+    "how to rotate api keys",
+]
+
+
+def _pct(values, p):
+    values = sorted(values)
+    idx = min(len(values) - 1, max(0, round(p / 100 * (len(values) - 1))))
+    return values[idx] * 1000
+
+
+async def _client(http, url, queries, k, mode, stop_at, lat, errors, offset):
+    i = offset
+    while time.perf_counter() < stop_at:
+        payload = {"q": queries[i % len(queries)], "k": k}
+        if mode:
+            payload["mode"] = mode
+        i += 1
+        t0 = time.perf_counter()
+        try:
+            r = await http.post(url, json=payload)
+            r.raise_for_status()
+            lat.append(time.perf_counter() - t0)
+        except Exception:
+            errors.append(1)
+
+
+async def _run_level(url, queries, k, mode, clients, duration):
+    lat, errors = [], []
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(timeout=60.0, limits=limits) as http:
+        await http.post(url, json={"q": queries[0], "k": k})  # прогрев соединения и кэшей
+        stop_at = time.perf_counter() + duration
+        await asyncio.gather(*(
+            _client(http, url, queries, k, mode, stop_at, lat, errors, n) for n in range(clients)
+        ))
+    rps = len(lat) / duration
+    p50 = _pct(lat, 50) if lat else 0.0
+    p95 = _pct(lat, 95) if lat else 0.0
+    print(
+        f"clients {clients:4d}: {rps:8.1f} req/s   "
+        f"p50 {p50:8.1f} ms   p95 {p95:8.1f} ms   errors {len(errors)}"
+    )
+    return rps
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", default="http://localhost:8000/api", help="база API")
+    ap.add_argument("--clients", default="1,4,16", help="уровни одновременности через запятую")
+    ap.add_argument("--duration", type=float, default=10.0, help="секунд на уровень")
+    ap.add_argument("--queries", help="файл с запросами, по одному в строке")
+    ap.add_argument("--mode", choices=["bm25", "vector", "hybrid"])
+    ap.add_argument("--k", type=int, default=8)
+    args = ap.parse_args()
+
+    queries = DEFAULT_QUERIES
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    url = args.url.rstrip("/") + "/search"
+
+    levels = [int(x) for x in args.clients.split(",") if x.strip()]
+    results = [
+        asyncio.run(_run_level(url, queries, args.k, args.mode, n, args.duration)) for n in levels
+    ]
+    if len(results) > 1 and results[0]:
+        print(f"scaling x{results[-1] / results[0]:.2f} at {levels[-1]} clients vs {levels[0]}")
+
+
+if __name__ == "__main__":
+    main()
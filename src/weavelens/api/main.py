@@ -1,27 +1,106 @@
 from __future__ import annotations
 
+import asyncio
+import contextlib
+import logging
+from contextlib import asynccontextmanager
+
 import uvicorn
 from fastapi import FastAPI
 
 from weavelens.settings import get_settings
 from weavelens.api.routers import health, search, ingest
-from weavelens.api.routers import bot_intent
+from weavelens.api.routers import bot_intent, metrics
+from weavelens.api.readiness import checks as dependency_checks
+from weavelens.api.warmup import preload_models, warm_up
+from weavelens.db import weaviate_async
+from weavelens.llm import ollama_client
+from weavelens.monitoring.logging import setup_logging
+from weavelens.monitoring.metrics import mark_process_dead
 
 
 settings = get_settings()
-app = FastAPI(title="WeaveLens API")
+logger = logging.getLogger("weavelens.api")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # логи weavelens.* (в т.ч. профили запросов) — в stdout воркера
+    setup_logging()
+    await ollama_client.open_client()
+    # прогрев в фоне: процесс уже отвечает на /live, а /ready — 503 до конца прогрева
+    warming = asyncio.create_task(warm_up())
+    checking = asyncio.create_task(dependency_checks.run_forever())
+    watcher = None
+    if settings.ingest_watch and settings.api_workers > 1:
+        logger.warning("INGEST_WATCH is ignored with API_WORKERS > 1; run weavelens-watch instead")
+    elif settings.ingest_watch:
+        from weavelens.pipeline.watch import start_watcher
+
+        watcher = start_watcher(settings.inbox_dir)
+    try:
+        yield
+    finally:
+        for task in (warming, checking):
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        if watcher is not None:
+            thread, stop = watcher
+            stop.set()
+            thread.join(timeout=5.0)
+        await weaviate_async.close_client()
+        await ollama_client.close_client()
+
+
+app = FastAPI(title="WeaveLens API", lifespan=lifespan)
 app.include_router(health.router, prefix=settings.api_prefix, tags=["health"])
 app.include_router(search.router, prefix=settings.api_prefix, tags=["search"])
 app.include_router(ingest.router, prefix=settings.api_prefix, tags=["ingest"])
 app.include_router(bot_intent.router, prefix=settings.api_prefix, tags=["bot"])
+# без префикса: стандартный путь для Prometheus
+app.include_router(metrics.router, tags=["metrics"])
+app.middleware("http")(metrics.route_metrics)
+
+
+def _run_gunicorn(workers: int) -> None:
+    """gunicorn + UvicornWorker с preload: модели грузятся в мастере до fork."""
+    from gunicorn.app.base import BaseApplication
+
+    class _App(BaseApplication):
+        def load_config(self) -> None:
+            self.cfg.set("bind", f"{settings.api_host}:{settings.api_port}")
+            self.cfg.set("workers", workers)
+            self.cfg.set("worker_class", "uvicorn.workers.UvicornWorker")
+            self.cfg.set("preload_app", True)
+            # первый прогрев модели в воркере может быть долгим
+            self.cfg.set("timeout", 300)
+            # метрики воркеров сводятся через PROMETHEUS_MULTIPROC_DIR
+            self.cfg.set("child_exit", lambda server, worker: mark_process_dead(worker.pid))
+
+        def load(self):
+            preload_models()
+            return app
+
+    _App().run()
 
 
 def run() -> None:
+    workers = max(1, settings.api_workers)
+    if workers > 1:
+        try:
+            return _run_gunicorn(workers)
+        except ImportError:
+            logger.warning(
+                "gunicorn is not installed: starting %s uvicorn workers, each loads its own models",
+                workers,
+            )
     uvicorn.run(
         "weavelens.api.main:app",
         host=settings.api_host,
         port=settings.api_port,
         reload=False,
+        workers=workers,
     )
 
 
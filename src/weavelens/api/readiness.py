@@ -0,0 +1,106 @@
+from __future__ import annotations
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Tuple
+
+from weavelens.api.warmup import needs_embedder, warmup
+from weavelens.settings import get_settings
+
+logger = logging.getLogger("weavelens.api")
+
+# на одну проверку; зависшая зависимость не должна тормозить остальные
+CHECK_TIMEOUT_S = 3.0
+
+
+async def _check_weaviate() -> None:
+    from weavelens.db import weaviate_async
+
+    if not await (await weaviate_async.aclient()).is_ready():
+        raise RuntimeError("weaviate is not ready")
+
+
+async def _check_ollama() -> None:
+    from weavelens.llm import ollama_client
+
+    models = await ollama_client.list_models(timeout=CHECK_TIMEOUT_S)
+    model = ollama_client.default_model()
+    # в /api/tags имя может быть с тегом :latest
+    if model not in models and f"{model}:latest" not in models:
+        raise RuntimeError(f"model {model} is not pulled")
+
+
+async def _check_embedder() -> None:
+    from weavelens.models import embeddings
+
+    # модель грузится прогревом; здесь лишь проверяем, что она в памяти
+    if embeddings._model is None:
+        raise RuntimeError("embedding model is not loaded")
+
+
+class DependencyChecks:
+    """Состояние зависимостей, обновляемое в фоне; /ready читает только кэш."""
+
+    def __init__(self) -> None:
+        self.status: Dict[str, Dict[str, Any]] = {}
+
+    def required(self) -> Tuple[str, ...]:
+        s = get_settings()
+        names = ["weaviate"]
+        if needs_embedder(s):
+            names.append("embedder")
+        if s.ready_require_ollama:
+            names.append("ollama")
+        return tuple(names)
+
+    def checks(self) -> Dict[str, Any]:
+        s = get_settings()
+        out: Dict[str, Any] = {"weaviate": _check_weaviate, "ollama": _check_ollama}
+        if needs_embedder(s):
+            out["embedder"] = _check_embedder
+        return out
+
+    async def _run_one(self, name: str, fn) -> None:
+        t0 = time.perf_counter()
+        try:
+            await asyncio.wait_for(fn(), CHECK_TIMEOUT_S)
+            error = None
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+        prev = self.status.get(name, {})
+        if prev.get("ok", True) != (error is None):
+            logger.warning("dependency %s: %s", name, "ok" if error is None else error)
+        self.status[name] = {
+            "ok": error is None,
+            "error": error,
+            "latency_ms": round((time.perf_counter() - t0) * 1000, 1),
+            "checked_at": time.time(),
+        }
+
+    async def run_once(self) -> None:
+        await asyncio.gather(*(self._run_one(n, fn) for n, fn in self.checks().items()))
+
+    async def run_forever(self) -> None:
+        interval = max(1.0, get_settings().ready_check_interval_s)
+        while True:
+            await self.run_once()
+            await asyncio.sleep(interval)
+
+    def report(self) -> Tuple[bool, Dict[str, Any]]:
+        """(готов ли процесс, подробности) — без сетевых вызовов."""
+        stale_after = 3 * max(1.0, get_settings().ready_check_interval_s)
+        now = time.time()
+        deps: Dict[str, Any] = {}
+        ok = warmup.done
+        for name in self.checks():
+            st = dict(self.status.get(name) or {"ok": False, "error": "not checked yet"})
+            if st.get("checked_at") and now - st["checked_at"] > stale_after:
+                st["ok"], st["error"] = False, "check is stale"
+            st["required"] = name in self.required()
+            if st["required"] and not st["ok"]:
+                ok = False
+            deps[name] = st
+        return ok, {"warmup": warmup.to_dict(), "dependencies": deps}
+
+
+checks = DependencyChecks()
@@ -1,15 +1,22 @@
 from __future__ import annotations
 
 import json
+import logging
+import time
 from typing import Literal
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
 
+from weavelens.llm.intent import IntentGuess, classify_model, classify_rules, get_intent_cache
 from weavelens.llm.ollama_client import generate as ollama_generate
+from weavelens.llm.scheduler import SchedulerError, request_deadline
+from weavelens.monitoring.metrics import INTENT_LAT, INTENT_STAGE
+from weavelens.settings import get_settings
 
 
 router = APIRouter()
+logger = logging.getLogger("weavelens.intent")
 
 
 class IntentIn(BaseModel):
@@ -35,15 +42,78 @@ _INTENT_PROMPT = (
 )
 
 
+def _observe(stage: str, action: str, t0: float) -> None:
+    INTENT_STAGE.labels(stage=stage, action=action).inc()
+    INTENT_LAT.labels(stage=stage).observe(time.perf_counter() - t0)
+
+
+def _from_guess(guess: IntentGuess) -> IntentOut:
+    query = "" if guess.action in {"scan", "help", "unknown"} else guess.query
+    return IntentOut(action=guess.action, query=query)
+
+
 @router.post("/bot/intent", response_model=IntentOut)
-async def detect_intent(body: IntentIn) -> IntentOut:
+async def detect_intent(body: IntentIn, request: Request) -> IntentOut:
     text = (body.text or "").strip()
     if not text:
         raise HTTPException(status_code=400, detail="text is empty")
 
+    # Дешёвые стадии первыми: правила → (опционально) модель → LLM
+    t0 = time.perf_counter()
+    settings = get_settings()
+    # неуверенная догадка ранней стадии — запасной ответ, если LLM недоступна
+    fallback = None
+    if settings.intent_rules_enabled:
+        guess = classify_rules(text)
+        if guess is not None and guess.confidence >= settings.intent_rules_min_conf:
+            _observe("rules", guess.action, t0)
+            return _from_guess(guess)
+        fallback = guess
+
+    cache = get_intent_cache()
+    cached = await cache.aget(text)
+    if cached is not None:
+        _observe("cache", cached["action"], t0)
+        return IntentOut(**cached)
+
+    if settings.intent_model_enabled:
+        try:
+            guess = await classify_model(text)
+        except Exception:
+            logger.warning("intent model failed, falling back to LLM", exc_info=True)
+            guess = None
+        if guess is not None and guess.confidence >= settings.intent_model_min_score:
+            _observe("model", guess.action, t0)
+            out = _from_guess(guess)
+            await cache.aset(text, out.model_dump())
+            return out
+        fallback = fallback or guess
+
+    try:
+        client_timeout = request.headers.get("x-request-timeout")
+        deadline = request_deadline(client_timeout, settings.ollama_intent_timeout_s)
+        out = await _detect_intent_llm(text, deadline)
+    except HTTPException:
+        if fallback is not None:
+            _observe("fallback", fallback.action, t0)
+            return _from_guess(fallback)
+        _observe("llm", "error", t0)
+        raise
+    _observe("llm", out.action, t0)
+    if out.action != "unknown":
+        # unknown бывает и от неразобранного ответа — не закрепляем
+        await cache.aset(text, out.model_dump())
+    return out
+
+
+async def _detect_intent_llm(text: str, deadline: float) -> IntentOut:
     prompt = _INTENT_PROMPT + text + "\nJSON:"
     try:
-        raw = await ollama_generate(prompt, None, timeout=30.0)
+        raw = await ollama_generate(prompt, None, kind="intent", deadline=deadline)
+    except SchedulerError as e:
+        raise HTTPException(
+            status_code=e.status_code, detail=f"LLM busy: {e}", headers={"Retry-After": "5"}
+        )
     except Exception as e:
         raise HTTPException(status_code=503, detail=f"LLM unavailable: {e}")
 
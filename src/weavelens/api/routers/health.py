@@ -1,6 +1,9 @@
 
 from __future__ import annotations
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from weavelens.api.readiness import checks
 
 router = APIRouter()
 
@@ -10,7 +13,13 @@ async def live():
 
 @router.get("/ready")
 async def ready():
-    return {"status": "ready"}
+    # Только кэш фоновых проверок: /ready не ходит в зависимости сам.
+    # 503 — пока идёт прогрев или недоступна обязательная зависимость.
+    ok, report = checks.report()
+    if not ok:
+        status = "warming" if not report["warmup"]["warm"] else "unavailable"
+        return JSONResponse(status_code=503, content={"status": status, **report})
+    return {"status": "ready", **report}
 
 @router.get("/health")
 async def health():
@@ -1,33 +1,76 @@
 from __future__ import annotations
 
+import asyncio
 from pathlib import Path
 from typing import List
 
 from fastapi import APIRouter, HTTPException
 
 from weavelens.settings import get_settings
-from weavelens.pipeline.index import scan_and_index
+from weavelens.pipeline.jobs import (
+    ACTIVE_STATES,
+    SNAPSHOT_INTERVAL_S,
+    STALE_AFTER_S,
+    get_job_manager,
+    list_snapshots,
+    load_snapshot,
+    request_cancel,
+)
 
 
 router = APIRouter()
 
 
-@router.post("/ingest/scan")
-async def ingest_scan():
-    """
-    Просканировать входную директорию и проиндексировать поддерживаемые файлы.
-    Возвращает счётчики, совместимые с ботом (/scan ожидает keys: files, chunks_indexed).
-    """
-
+def _inbox() -> Path:
     settings = get_settings()
     inbox = Path(settings.inbox_dir)
     if not inbox.exists():
         raise HTTPException(status_code=400, detail=f"inbox_dir does not exist: {inbox}")
     if not inbox.is_dir():
         raise HTTPException(status_code=400, detail=f"inbox_dir is not a directory: {inbox}")
+    return inbox
+
+
+async def _wait_job(job) -> dict:
+    """Результат задачи; задачу другого воркера ждём по её снимку на диске.
+
+    Ждём, пока владелец обновляет снимок: без heartbeat дольше STALE_AFTER_S
+    задача считается брошенной (load_snapshot переводит её в failed).
+    """
+    if job.future is not None:
+        return await asyncio.wrap_future(job.future)
+    loop = asyncio.get_running_loop()
+    last_beat, seen_at = None, loop.time()
+    while True:
+        snap = job.to_dict()
+        if snap.get("state") not in ACTIVE_STATES:
+            break
+        if snap.get("heartbeat_at") != last_beat:
+            last_beat, seen_at = snap.get("heartbeat_at"), loop.time()
+        elif loop.time() - seen_at > STALE_AFTER_S:
+            raise HTTPException(
+                status_code=504, detail=f"ingest job {job.id} stopped reporting progress"
+            )
+        await asyncio.sleep(SNAPSHOT_INTERVAL_S)
+    if snap.get("state") == "failed":
+        errors = snap.get("errors") or [{}]
+        raise HTTPException(status_code=500, detail=f"ingest job failed: {errors[-1].get('error')}")
+    return snap.get("result") or {}
+
+
+@router.post("/ingest/scan")
+async def ingest_scan():
+    """
+    Просканировать входную директорию и проиндексировать поддерживаемые файлы.
+    Возвращает счётчики, совместимые с ботом (/scan ожидает keys: files, chunks_indexed).
 
-    # Запускаем индексацию (скан + дедуп + разбиение на чанки + запись в Weaviate)
-    result = scan_and_index([str(inbox)])
+    Скан идёт фоновой задачей (см. /ingest/jobs); здесь мы лишь ждём её,
+    не блокируя event loop. Если скан уже идёт — ждём текущий.
+    """
+
+    inbox = _inbox()
+    job, _ = get_job_manager().submit(str(inbox))
+    result = await _wait_job(job)
 
     # Дополнительная справочная информация (не используется ботом, но полезна в UI)
     try:
@@ -37,4 +80,43 @@ async def ingest_scan():
     except Exception:
         extras = {}
 
-    return {"inbox_dir": str(inbox), **result, **extras}
+    return {"inbox_dir": str(inbox), "job_id": job.id, **(result or {}), **extras}
+
+
+@router.post("/ingest/jobs", status_code=202)
+async def ingest_job_start():
+    """Запустить скан входной директории в фоне и сразу вернуть id задачи."""
+    job, created = get_job_manager().submit(str(_inbox()))
+    return {**job.to_dict(), "created": created}
+
+
+@router.get("/ingest/jobs")
+async def ingest_jobs_list():
+    jobs = [j.to_dict() for j in get_job_manager().list()]
+    # при нескольких воркерах — и задачи, запущенные в других процессах
+    local = {j["job_id"] for j in jobs}
+    jobs += [j for j in list_snapshots() if j["job_id"] not in local]
+    return {"jobs": jobs}
+
+
+@router.get("/ingest/jobs/{job_id}")
+async def ingest_job_status(job_id: str):
+    job = get_job_manager().get(job_id)
+    if job is not None:
+        return job.to_dict()
+    snap = load_snapshot(job_id)
+    if snap is None:
+        raise HTTPException(status_code=404, detail=f"job not found: {job_id}")
+    return snap
+
+
+@router.post("/ingest/jobs/{job_id}/cancel")
+async def ingest_job_cancel(job_id: str):
+    job = get_job_manager().cancel(job_id)
+    if job is not None:
+        return job.to_dict()
+    snap = load_snapshot(job_id)
+    if snap is None:
+        raise HTTPException(status_code=404, detail=f"job not found: {job_id}")
+    request_cancel(job_id)
+    return snap
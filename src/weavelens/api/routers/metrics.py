@@ -0,0 +1,42 @@
+from __future__ import annotations
+import time
+
+from fastapi import APIRouter, Request, Response
+
+from weavelens.monitoring.metrics import LAT, REQS, render_latest
+
+router = APIRouter()
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    body, content_type = render_latest()
+    return Response(content=body, media_type=content_type)
+
+def _route_template(scope) -> str:
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    if not path:
+        return "unmatched"
+    # новые версии FastAPI хранят в route путь без префикса include_router
+    full = scope.get("path", "")
+    regex = getattr(route, "path_regex", None)
+    if regex is not None and not regex.match(full):
+        for i in range(1, len(full)):
+            if full[i] == "/" and regex.match(full[i:]):
+                return full[:i] + path
+    return path
+
+async def route_metrics(request: Request, call_next):
+    """HTTP-middleware: число запросов и задержка по шаблону маршрута
+    (/api/ask, а не полный URL — число серий не растёт от путей).
+
+    Для потоковых ответов задержка — до отправки заголовков; время генерации
+    видно в weavelens_llm_generation_seconds.
+    """
+    t0 = time.perf_counter()
+    try:
+        return await call_next(request)
+    finally:
+        route = _route_template(request.scope)
+        REQS.labels(route=route).inc()
+        LAT.labels(route=route).observe(time.perf_counter() - t0)
@@ -1,19 +1,63 @@
 from __future__ import annotations
-from typing import List, Optional, Dict, Any
-from fastapi import APIRouter, HTTPException
+import json
+import time
+from typing import AsyncIterator, List, Literal, Optional, Dict, Any, Tuple
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from weavelens.db import weaviate_client as wv
+from weavelens.db import weaviate_async as awv
+from weavelens.llm.answer_cache import AnswerCache, cache_info, get_answer_cache
 from weavelens.llm.ollama_client import generate as ollama_generate
+from weavelens.llm.ollama_client import generate_stream as ollama_generate_stream
+from weavelens.llm.scheduler import SchedulerError, get_scheduler, request_deadline
+from weavelens.monitoring.metrics import HITK
+from weavelens.monitoring.profiling import RequestProfile, stage
+from weavelens.settings import get_settings
 
 router = APIRouter()
 
 class QueryIn(BaseModel):
     q: str
     k: int = Field(default=8, ge=1, le=50)
+    # None — режим по умолчанию из SEARCH_MODE
+    mode: Optional[Literal["bm25", "vector", "hybrid"]] = None
+    # вернуть разбивку времени по этапам (то же — заголовок X-Debug-Timings: 1)
+    debug: bool = False
+
+def _profile(body: QueryIn, request: Request, route: str) -> Optional[RequestProfile]:
+    header = request.headers.get("x-debug-timings", "")
+    if body.debug or header.lower() in ("1", "true", "yes"):
+        return RequestProfile(route)
+    return None
+
+async def _retrieve(body: QueryIn, prof: Optional[RequestProfile] = None) -> List[Dict[str, Any]]:
+    mode = body.mode or get_settings().search_mode
+    if prof is not None:
+        prof.info["mode"] = mode
+    if mode == "bm25":
+        with stage(prof, "search"):
+            return await awv.search_bm25(body.q, body.k)
+    try:
+        from weavelens.models.embed_service import get_embedding_service
+        with stage(prof, "embed_query"):
+            vector = await get_embedding_service().embed_query(body.q)
+    except Exception:
+        # Нет модели эмбеддингов — деградируем до BM25
+        with stage(prof, "search"):
+            return await awv.search_bm25(body.q, body.k)
+    with stage(prof, "search"):
+        if mode == "vector":
+            return await awv.search_vector(vector, body.k)
+        return await awv.search_hybrid(body.q, vector, body.k)
 
 @router.post("/search")
-async def search(body: QueryIn):
-    hits = wv.search_bm25(body.q, body.k)
+async def search(body: QueryIn, request: Request):
+    prof = _profile(body, request, "search")
+    with stage(prof, "retrieval"):
+        hits = await _retrieve(body, prof)
+    HITK.labels(route="search").observe(len(hits))
+    if prof is not None:
+        return {"hits": hits, "timings": prof.finish()}
     return {"hits": hits}
 
 def _format_context(hits: List[Dict[str, Any]]) -> str:
@@ -24,18 +68,186 @@ def _format_context(hits: List[Dict[str, Any]]) -> str:
         lines.append(f"[{i}] Source: {src}\n{txt}")
     return "\n\n".join(lines)
 
+_NOTHING_FOUND = "Ничего не нашёл по базе."
+_RETRY_AFTER_S = "5"
+_LLM_UNAVAILABLE = "[LLM недоступна — вернул релевантные фрагменты]"
+
+def _ask_prompt(q: str, hits: List[Dict[str, Any]], prof: Optional[RequestProfile] = None) -> str:
+    with stage(prof, "context_format"):
+        prompt = (
+            "Ты — помощник. Отвечай кратко и по делу только на основе контекста. "
+            "Если ответа нет в контексте — скажи, что в материалах не нашлось.\n\n"
+            f"Контекст:\n{_format_context(hits)}\n\nВопрос: {q}\nОтвет:"
+        )
+    if prof is not None:
+        prof.info["prompt_chars"] = len(prompt)
+    return prompt
+
+def _llm_timings(prof: Optional[RequestProfile], stats: Dict[str, Any]) -> None:
+    """Счётчики Ollama в профиль: токены промпта (prompt_eval_count) и этапы LLM."""
+    if prof is None or not stats:
+        return
+    prof.info["prompt_tokens"] = stats.get("prompt_tokens")
+    prof.info["completion_tokens"] = stats.get("completion_tokens")
+    prof.info["llm"] = stats
+
+async def _cache_lookup(
+    body: QueryIn, hits: List[Dict[str, Any]]
+) -> Tuple[AnswerCache, Optional[Tuple[str, Dict[str, Any]]], Optional[List[float]]]:
+    cache = get_answer_cache()
+    vector = None
+    if cache.semantic:
+        try:
+            from weavelens.models.embed_service import get_embedding_service
+            vector = await get_embedding_service().embed_query(body.q)
+        except Exception:
+            vector = None  # без модели — только точное совпадение
+    return cache, cache.get(body.q, hits, vector), vector
+
+def _busy(e: SchedulerError) -> HTTPException:
+    return HTTPException(
+        status_code=e.status_code, detail=f"LLM busy: {e}", headers={"Retry-After": _RETRY_AFTER_S}
+    )
+
+def _deadline(request: Request) -> float:
+    client = request.headers.get("x-request-timeout")
+    return request_deadline(client, get_settings().ollama_ask_timeout_s)
+
+def _with_timings(out: Dict[str, Any], prof: Optional[RequestProfile]) -> Dict[str, Any]:
+    if prof is not None:
+        out["timings"] = prof.finish()
+    return out
+
 @router.post("/ask")
-async def ask(body: QueryIn):
-    hits = wv.search_bm25(body.q, body.k)
+async def ask(body: QueryIn, response: Response, request: Request):
+    prof = _profile(body, request, "ask")
+    deadline = _deadline(request)
+    with stage(prof, "retrieval"):
+        hits = await _retrieve(body, prof)
+    HITK.labels(route="ask").observe(len(hits))
     if not hits:
-        return {"answer": {"text": "Ничего не нашёл по базе.", "used_chunks": 0}, "hits": []}
-    prompt = (
-        "Ты — помощник. Отвечай кратко и по делу только на основе контекста. "
-        "Если ответа нет в контексте — скажи, что в материалах не нашлось.\n\n"
-        f"Контекст:\n{_format_context(hits)}\n\nВопрос: {body.q}\nОтвет:"
-    )
+        out = {
+            "answer": {"text": _NOTHING_FOUND, "used_chunks": 0},
+            "hits": [],
+            "cache": cache_info(None),
+        }
+        return _with_timings(out, prof)
+    with stage(prof, "cache_lookup"):
+        cache, found, vector = await _cache_lookup(body, hits)
+    if found is not None:
+        kind, entry = found
+        response.headers["X-Answer-Cache"] = f"hit-{kind}"
+        out = {
+            "answer": {"text": entry["text"], "used_chunks": len(hits)},
+            "hits": hits,
+            "cache": cache_info(kind, entry),
+        }
+        return _with_timings(out, prof)
+    stats: Dict[str, Any] = {}
+    prompt = _ask_prompt(body.q, hits, prof)
     try:
-        text = await ollama_generate(prompt, None, timeout=120.0)
+        with stage(prof, "llm_total"):
+            text = await ollama_generate(
+                prompt,
+                None,
+                kind="answer",
+                deadline=deadline,
+                stats=stats if prof is not None else None,
+            )
+        cache.set(body.q, hits, text, vector)
+    except SchedulerError as e:
+        raise _busy(e)
     except Exception:
-        text = "[LLM недоступна — вернул релевантные фрагменты]"
-    return {"answer": {"text": text, "used_chunks": len(hits)}, "hits": hits}
+        text = _LLM_UNAVAILABLE
+    if prof is not None and stats:
+        _llm_timings(prof, stats)
+        # без стрима первый токен не наблюдаем: очередь + загрузка модели + разбор промпта
+        prof.marks["llm_first_token"] = round(
+            prof.stages.get("retrieval", 0.0) + prof.stages.get("cache_lookup", 0.0)
+            + prof.stages.get("context_format", 0.0) + stats.get("queue_ms", 0.0)
+            + stats.get("load_ms", 0.0) + stats.get("prompt_eval_ms", 0.0), 1
+        )
+    response.headers["X-Answer-Cache"] = "miss"
+    out = {
+        "answer": {"text": text, "used_chunks": len(hits)},
+        "hits": hits,
+        "cache": cache_info(None),
+    }
+    return _with_timings(out, prof)
+
+async def _ask_events(
+    body: QueryIn, deadline: Optional[float] = None, prof: Optional[RequestProfile] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """События потокового /ask: hits → token* → done (или error вместо токенов).
+
+    При профилировании done несёт timings; llm_first_token — момент первого
+    фрагмента от начала запроса.
+    """
+    with stage(prof, "retrieval"):
+        hits = await _retrieve(body, prof)
+    HITK.labels(route="ask_stream").observe(len(hits))
+    yield {"type": "hits", "hits": hits}
+    if not hits:
+        yield {"type": "token", "text": _NOTHING_FOUND}
+        yield _with_timings({"type": "done", "used_chunks": 0, "cache": cache_info(None)}, prof)
+        return
+    with stage(prof, "cache_lookup"):
+        cache, found, vector = await _cache_lookup(body, hits)
+    if found is not None:
+        kind, entry = found
+        yield {"type": "token", "text": entry["text"]}
+        done = {"type": "done", "used_chunks": len(hits), "cache": cache_info(kind, entry)}
+        yield _with_timings(done, prof)
+        return
+    pieces: List[str] = []
+    stats: Dict[str, Any] = {}
+    prompt = _ask_prompt(body.q, hits, prof)
+    t_llm = time.perf_counter()
+    try:
+        async for piece in ollama_generate_stream(
+            prompt, None, timeout=get_settings().ollama_ask_timeout_s,
+            kind="answer", deadline=deadline, stats=stats if prof is not None else None,
+        ):
+            if prof is not None and not pieces:
+                prof.mark("llm_first_token")
+            pieces.append(piece)
+            yield {"type": "token", "text": piece}
+        cache.set(body.q, hits, "".join(pieces), vector)
+    except SchedulerError as e:
+        yield {"type": "error", "detail": f"LLM busy: {e}", "status": e.status_code}
+    except Exception as e:
+        # Фрагменты уже у клиента — сообщаем об обрыве; иначе — как в /ask
+        if pieces:
+            yield {"type": "error", "detail": f"LLM stream failed: {e}"}
+        else:
+            yield {"type": "token", "text": _LLM_UNAVAILABLE}
+    if prof is not None:
+        prof.add("llm_total", time.perf_counter() - t_llm)
+        _llm_timings(prof, stats)
+    yield _with_timings({"type": "done", "used_chunks": len(hits), "cache": cache_info(None)}, prof)
+
+@router.post("/ask/stream")
+async def ask_stream(body: QueryIn, request: Request):
+    """Потоковый /ask: NDJSON по умолчанию, SSE при Accept: text/event-stream."""
+    sse = "text/event-stream" in request.headers.get("accept", "")
+    if get_scheduler().full():
+        # отказ до начала потока — клиент получит обычный 429
+        raise HTTPException(
+            status_code=429,
+            detail="LLM busy: queue is full",
+            headers={"Retry-After": _RETRY_AFTER_S},
+        )
+    deadline = _deadline(request)
+    prof = _profile(body, request, "ask_stream")
+
+    async def _encode() -> AsyncIterator[str]:
+        async for ev in _ask_events(body, deadline, prof):
+            data = json.dumps(ev, ensure_ascii=False)
+            yield f"event: {ev['type']}\ndata: {data}\n\n" if sse else data + "\n"
+
+    return StreamingResponse(
+        _encode(),
+        media_type="text/event-stream" if sse else "application/x-ndjson",
+        # не буферизовать на nginx-прокси
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
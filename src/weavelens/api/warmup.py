@@ -0,0 +1,113 @@
+from __future__ import annotations
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from weavelens.settings import Settings, get_settings
+
+logger = logging.getLogger("weavelens.api")
+
+# пауза между попытками, пока Weaviate/модель недоступны
+RETRY_S = 5.0
+
+
+def needs_embedder(s: Settings) -> bool:
+    """Нужна ли процессу API модель эмбеддингов при текущих настройках."""
+    return s.search_mode != "bm25" or s.answer_cache_semantic or s.intent_model_enabled
+
+
+class Warmup:
+    """Прогрев процесса API: /ready отвечает 503, пока он не завершён."""
+
+    def __init__(self) -> None:
+        self.done = False
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.error: Optional[str] = None
+        self.steps: Dict[str, float] = {}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "warm": self.done,
+            "elapsed_s": round((self.finished_at or time.time()) - self.started_at, 3),
+            "steps_s": dict(self.steps),
+            "error": self.error,
+        }
+
+
+warmup = Warmup()
+
+
+def preload_models() -> None:
+    """Загрузить модель эмбеддингов в текущем процессе.
+
+    В мастере gunicorn (preload) это происходит до fork — воркеры делят
+    веса через copy-on-write, а не грузят каждый свою копию.
+    """
+    s = get_settings()
+    if s.api_preload_models and needs_embedder(s):
+        from weavelens.models.embeddings import get_embedder
+
+        t0 = time.perf_counter()
+        get_embedder()
+        logger.info("embedder preloaded in %.1fs", time.perf_counter() - t0)
+
+
+def _encode_once() -> None:
+    from weavelens.models.embeddings import embed_texts
+
+    embed_texts(["warm-up"])
+
+
+async def _step(name: str, fn, *args) -> None:
+    if name in warmup.steps:
+        return
+    t0 = time.perf_counter()
+    res = fn(*args)
+    if asyncio.iscoroutine(res):
+        await res
+    warmup.steps[name] = round(time.perf_counter() - t0, 3)
+
+
+async def _warm_ollama() -> None:
+    from weavelens.llm import ollama_client
+
+    await ollama_client.warm_model()
+
+
+async def warm_up() -> None:
+    """Подключения и модели процесса до приёма трафика (повторяется до успеха).
+
+    Ollama прогревается после остального и на /ready не влияет: /search
+    работает и без LLM, а неудача лишь оставляет первую генерацию холодной.
+    """
+    from weavelens.db import weaviate_async
+    from weavelens.db import weaviate_client as wv
+
+    s = get_settings()
+    while True:
+        try:
+            # схема — синхронным клиентом (он же пишет при ингесте), поиск — асинхронным
+            await _step("weaviate_schema", asyncio.to_thread, wv.client)
+            await _step("weaviate_async", weaviate_async.open_client)
+            # первый запрос прогревает gRPC-канал и кэши Weaviate
+            await _step("bm25_query", weaviate_async.search_bm25, "warm-up", 1)
+            if needs_embedder(s):
+                await _step("embedder", asyncio.to_thread, _encode_once)
+            break
+        except Exception as e:
+            warmup.error = f"{type(e).__name__}: {e}"
+            logger.warning("warm-up failed, retrying in %ss: %s", RETRY_S, e)
+            await asyncio.sleep(RETRY_S)
+    warmup.error = None
+    if s.warmup_ollama:
+        try:
+            await _step("ollama_generate", _warm_ollama)
+        except Exception as e:
+            logger.warning("Ollama warm-up failed: %s", e)
+    warmup.done = True
+    warmup.finished_at = time.time()
+    logger.info(
+        "warm-up finished in %.1fs %s", warmup.finished_at - warmup.started_at, warmup.steps
+    )
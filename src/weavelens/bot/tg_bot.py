@@ -11,10 +11,13 @@ WeaveLens Telegram Bot (aiogram v3)
 /ask <q>       — вопрос LLM с опорой на базу
 """
 import asyncio
+import contextlib
+import json
 import logging
 import os
+import time
 from io import BytesIO
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
 import httpx
 from aiogram import Bot, Dispatcher
@@ -37,6 +40,16 @@ s = Settings()  # читает .env/окружение
 # Текущая рабочая база API (определяется на старте)
 _API_BASE: str = ""
 
+# Один HTTP-клиент с keep-alive на весь процесс бота
+_client: Optional[httpx.AsyncClient] = None
+HTTP_MAX_CONNECTIONS = int(os.getenv("BOT_HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("BOT_HTTP_MAX_KEEPALIVE", "10"))
+
+# Здоровье баз API: фоновая проверка /live и circuit breaker
+HEALTH_INTERVAL_S = float(os.getenv("BOT_HEALTH_INTERVAL_S", "15"))
+CB_FAILURES = int(os.getenv("BOT_CB_FAILURES", "3"))
+CB_COOLDOWN_S = float(os.getenv("BOT_CB_COOLDOWN_S", "30"))
+
 # Telegram лимиты
 TELEGRAM_MAX_CHARS = 4096
 # безопасный размер чанка (оставляем запас под хвосты и служебные приписки)
@@ -44,6 +57,26 @@ TELEGRAM_SAFE_CHARS = int(os.getenv("BOT_TG_SAFE_CHARS", "3500"))
 # если текст совсем длинный — отправляем как файл
 TO_FILE_THRESHOLD = TELEGRAM_SAFE_CHARS * 6
 
+# /scan: как часто опрашивать статус фоновой задачи и сколько всего ждать
+SCAN_POLL_INTERVAL_S = float(os.getenv("BOT_SCAN_POLL_S", "3"))
+SCAN_MAX_WAIT_S = float(os.getenv("BOT_SCAN_MAX_WAIT_S", "3600"))
+
+# /ask: не чаще одного edit_text в столько секунд (flood-лимиты Telegram)
+EDIT_INTERVAL_S = float(os.getenv("BOT_EDIT_INTERVAL_S", "1.5"))
+ASK_TIMEOUT_S = 180.0
+LLM_UNAVAILABLE_PREFIX = "[LLM недоступна"
+# Просить у API разбивку времени /ask по этапам и писать её в лог бота
+ASK_DEBUG = os.getenv("BOT_ASK_DEBUG", "false").lower() in ("1", "true", "yes")
+
+
+def _ask_payload(q: str, k: int) -> Dict[str, Any]:
+    return {"q": q, "k": k, "debug": True} if ASK_DEBUG else {"q": q, "k": k}
+
+
+def _log_timings(q: str, timings: Optional[Dict[str, Any]]) -> None:
+    if timings:
+        logger.info("ask timings (q=%d chars): %s", len(q), json.dumps(timings, ensure_ascii=False))
+
 
 def _normalize_base(v: str) -> str:
     return (v or "").strip().rstrip("/")
@@ -55,23 +88,131 @@ def _alt_base(v: str) -> str:
     return v[:-4] if v.endswith("/api") else (v + "/api")
 
 
+def _http() -> httpx.AsyncClient:
+    """Общий клиент; таймауты задаются на каждый запрос."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=30.0,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=60.0,
+            ),
+        )
+    return _client
+
+
 async def _probe_base(base: str) -> bool:
     """Проверяем, что {base}/live отдаёт 200."""
     try:
-        async with httpx.AsyncClient(timeout=5.0) as c:
-            r = await c.get(f"{base}/live")
-            if r.status_code == 200:
-                return True
+        r = await _http().get(f"{base}/live", timeout=5.0)
+        return r.status_code == 200
     except Exception:
         return False
+
+
+def _deadline_headers(timeout: float) -> Dict[str, str]:
+    """Сколько мы готовы ждать — API не станет генерировать ответ дольше."""
+    return {"X-Request-Timeout": f"{timeout:g}"}
+
+
+class _StreamBroken(Exception):
+    """Поток оборвался после ответа 200: база жива, повторить можно обычным запросом."""
+
+
+def _is_base_failure(e: BaseException) -> bool:
+    """Ошибки, говорящие о недоступности базы (а не о медленной LLM или 4xx)."""
+    if isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError)):
+        return True
+    if isinstance(e, httpx.HTTPStatusError) and e.response is not None:
+        return e.response.status_code in (502, 504)
     return False
 
 
-async def _autodetect_api_base() -> str:
+class _BaseTracker:
     """
-    Пробуем ряд кандидатов, пока не найдём базу, где /live отвечает 200.
-    Порядок: env, env toggled, http://api:8000/api, http://api:8000.
+    Здоровье кандидатов базы API.
+    После CB_FAILURES сбоев подряд база «размыкается» на CB_COOLDOWN_S:
+    запросы сразу идут на следующую доступную базу без повторов.
+    Фоновая проверка /live помечает базы здоровыми/нездоровыми.
     """
+
+    def __init__(self, candidates: List[str]):
+        self.candidates = candidates
+        self.failures: Dict[str, int] = {b: 0 for b in candidates}
+        self.open_until: Dict[str, float] = {b: 0.0 for b in candidates}
+        self.healthy: Dict[str, bool] = {b: True for b in candidates}
+
+    def available(self, base: str) -> bool:
+        return self.healthy.get(base, True) and time.monotonic() >= self.open_until.get(base, 0.0)
+
+    def record_success(self, base: str) -> None:
+        self.failures[base] = 0
+        self.open_until[base] = 0.0
+
+    def record_failure(self, base: str) -> None:
+        n = self.failures.get(base, 0) + 1
+        self.failures[base] = n
+        if n >= CB_FAILURES:
+            self.open_until[base] = time.monotonic() + CB_COOLDOWN_S
+            logger.warning(
+                "API base %s: %s failures in a row, circuit open for %ss", base, n, CB_COOLDOWN_S
+            )
+
+    def pick(self, current: str) -> str:
+        if self.available(current):
+            return current
+        for b in self.candidates:
+            if self.available(b):
+                return b
+        return current  # всё недоступно — остаёмся на текущей
+
+    async def check_all(self) -> None:
+        results = await asyncio.gather(*(_probe_base(b) for b in self.candidates))
+        for base, ok in zip(self.candidates, results):
+            self.healthy[base] = ok
+
+
+_tracker: Optional[_BaseTracker] = None
+
+
+def _current_base() -> str:
+    global _API_BASE
+    if _tracker is not None:
+        base = _tracker.pick(_API_BASE)
+        if base != _API_BASE:
+            logger.warning("API base %s unavailable, switching to %s", _API_BASE, base)
+            _API_BASE = base
+    return _API_BASE
+
+
+@contextlib.asynccontextmanager
+async def _tracked(base: str):
+    """Учитывает исход запроса к базе в circuit breaker."""
+    try:
+        yield
+    except Exception as e:
+        if _tracker is not None and _is_base_failure(e):
+            _tracker.record_failure(base)
+        raise
+    else:
+        if _tracker is not None:
+            _tracker.record_success(base)
+
+
+async def _health_loop() -> None:
+    while True:
+        await asyncio.sleep(HEALTH_INTERVAL_S)
+        try:
+            await _tracker.check_all()
+            _current_base()
+        except Exception:
+            logger.debug("health check failed", exc_info=True)
+
+
+def _candidate_bases() -> List[str]:
+    """Порядок: env, env toggled, http://api:8000/api, http://api:8000."""
     env_base = _normalize_base(s.bot_api_url or "http://api:8000/api")
     candidates: List[str] = [
         env_base,
@@ -88,6 +229,17 @@ async def _autodetect_api_base() -> str:
         if b and b not in seen:
             uniq.append(b)
             seen.add(b)
+    return uniq
+
+
+async def _autodetect_api_base() -> str:
+    """
+    Пробуем кандидатов (_candidate_bases), пока не найдём базу, где /live отвечает 200.
+    """
+    global _tracker
+    uniq = _candidate_bases()
+    env_base = uniq[0]
+    _tracker = _BaseTracker(uniq)
 
     for base in uniq:
         if await _probe_base(base):
@@ -101,7 +253,7 @@ async def _autodetect_api_base() -> str:
 
 def api_url(path: str) -> str:
     path = path if path.startswith("/") else f"/{path}"
-    return f"{_API_BASE}{path}"
+    return f"{_current_base()}{path}"
 
 
 def _is_allowed(user_id: Optional[int]) -> bool:
@@ -137,29 +289,70 @@ async def _post_json_with_fallback(path: str, payload: Dict[str, Any], *, timeou
     Возвращает (json, используемая_база).
     """
     global _API_BASE
-    url = api_url(path)
+    path = path if path.startswith("/") else f"/{path}"
+    base = _current_base()
     try:
-        async with httpx.AsyncClient(timeout=timeout) as c:
-            r = await c.post(url, json=payload)
+        async with _tracked(base):
+            r = await _http().post(
+                f"{base}{path}", json=payload, timeout=timeout, headers=_deadline_headers(timeout)
+            )
             r.raise_for_status()
-            return r.json(), _API_BASE
+        return r.json(), base
     except httpx.HTTPStatusError as e:
-        # Если 404 — пробуем альтернативную базу
+        # Если 404 — пробуем альтернативную базу (другой префикс, а не сбой)
         if e.response is not None and e.response.status_code == 404:
-            alt = _alt_base(_API_BASE)
-            if alt != _API_BASE:
-                try:
-                    async with httpx.AsyncClient(timeout=timeout) as c:
-                        r2 = await c.post(f"{alt}{path if path.startswith('/') else '/' + path}", json=payload)
-                        r2.raise_for_status()
-                        _API_BASE = alt
-                        logger.info("Switched API base to: %s (due to 404 on %s)", _API_BASE, url)
-                        return r2.json(), _API_BASE
-                except Exception:
-                    pass
+            alt = _alt_base(base)
+            try:
+                async with _tracked(alt):
+                    r2 = await _http().post(
+                        f"{alt}{path}",
+                        json=payload,
+                        timeout=timeout,
+                        headers=_deadline_headers(timeout),
+                    )
+                    r2.raise_for_status()
+                _API_BASE = alt
+                logger.info("Switched API base to: %s (due to 404 on %s%s)", _API_BASE, base, path)
+                return r2.json(), _API_BASE
+            except Exception:
+                pass
         raise  # пробрасываем дальше
-    except Exception:
-        raise
+
+
+async def _stream_ndjson_with_fallback(
+    path: str, payload: Dict[str, Any], *, timeout: float = 120.0
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    POST с потоковым NDJSON-ответом; при 404 — один раз альтернативная база.
+    Если 404 и там, наружу уходит HTTPStatusError (старый API без потоковых ручек).
+    Обрыв или мусор в уже начавшемся потоке — _StreamBroken (не сбой базы).
+    """
+    global _API_BASE
+    path = path if path.startswith("/") else f"/{path}"
+    current = _current_base()
+    for base in (current, _alt_base(current)):
+        async with _tracked(base):
+            request = _http().stream(
+                "POST",
+                f"{base}{path}",
+                json=payload,
+                timeout=timeout,
+                headers=_deadline_headers(timeout),
+            )
+            async with request as r:
+                if r.status_code == 404 and base == current:
+                    continue
+                r.raise_for_status()
+                if base != _API_BASE:
+                    _API_BASE = base
+                    logger.info("Switched API base to: %s (due to 404 on %s)", _API_BASE, path)
+                try:
+                    async for line in r.aiter_lines():
+                        if line.strip():
+                            yield json.loads(line)
+                except (httpx.RemoteProtocolError, httpx.ReadError, ValueError) as e:
+                    raise _StreamBroken(f"{path}: {e!r}") from e
+                return
 
 
 # --------------------- ХЕЛПЕРЫ ОТПРАВКИ ----------------------
@@ -195,6 +388,108 @@ async def _reply_long(m: Message, text: str, footer: str = ""):
         await m.reply(chunk + tail)
 
 
+async def _edit(msg: Message, text: str) -> float:
+    """edit_text без исключений; возвращает паузу, которую запросил Telegram (RetryAfter)."""
+    try:
+        await msg.edit_text(text)
+    except Exception as e:
+        return float(getattr(e, "retry_after", 0) or 0)
+    return 0.0
+
+
+async def _stream_answer(placeholder: Message, q: str, k: int) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Читает /ask/stream и постепенно дописывает ответ в placeholder —
+    не чаще EDIT_INTERVAL_S. Когда текст перерастает одно сообщение,
+    правки прекращаются: целиком ответ уйдёт через _reply_long.
+    """
+    loop = asyncio.get_running_loop()
+    parts: List[str] = []
+    hits: List[Dict[str, Any]] = []
+    next_edit = 0.0
+    overflow = False
+    events = _stream_ndjson_with_fallback("/ask/stream", _ask_payload(q, k), timeout=ASK_TIMEOUT_S)
+    async for ev in events:
+        kind = ev.get("type")
+        if kind == "hits":
+            hits = ev.get("hits") or []
+        elif kind == "error":
+            logger.warning("ask stream: %s", ev.get("detail"))
+        elif kind == "done":
+            _log_timings(q, ev.get("timings"))
+        if kind != "token":
+            continue
+        parts.append(ev.get("text") or "")
+        text = "".join(parts).strip()
+        throttled = loop.time() < next_edit
+        if overflow or throttled or not text or text.startswith(LLM_UNAVAILABLE_PREFIX):
+            continue
+        if len(text) > TELEGRAM_SAFE_CHARS:
+            overflow = True
+            text = text[:TELEGRAM_SAFE_CHARS].rstrip() + "…"
+        else:
+            text += " ▌"
+        delay = await _edit(placeholder, text)
+        next_edit = loop.time() + EDIT_INTERVAL_S + delay
+    return "".join(parts), hits
+
+
+async def _finish_answer(
+    m: Message, placeholder: Message, answer: str, hits: List[Dict[str, Any]], used_base: str
+):
+    answer = (answer or "").strip()
+    if not answer or answer.startswith(LLM_UNAVAILABLE_PREFIX):
+        # fallback — показать релевантные фрагменты
+        hits = hits[:3]
+        if hits:
+            answer = "[LLM недоступна — вернул релевантные фрагменты]\n\n" + _format_hits(hits)
+        else:
+            answer = "[LLM недоступна — релевантных фрагментов нет]"
+    footer = f"\n\n(API: {used_base})"
+    if len(answer) + len(footer) <= TELEGRAM_MAX_CHARS:
+        try:
+            return await placeholder.edit_text(answer + footer)
+        except Exception:
+            logger.debug("final edit failed, sending a new message", exc_info=True)
+    with contextlib.suppress(Exception):
+        await placeholder.delete()
+    await _reply_long(m, answer, footer=footer)
+
+
+async def _answer(m: Message, q: str, k: int = 6, *, error_prefix: str = "Ошибка запроса /ask"):
+    """Ответ LLM с постепенным выводом.
+
+    Для API без /ask/stream и при обрыве потока — обычный /ask.
+    """
+    placeholder = await m.reply("Ищу в базе…")
+    try:
+        try:
+            answer, hits = await _stream_answer(placeholder, q, k)
+        except (httpx.HTTPStatusError, _StreamBroken) as e:
+            if isinstance(e, _StreamBroken):
+                logger.warning("ask stream broken, retrying via /ask: %s", e)
+            elif e.response is None or e.response.status_code != 404:
+                raise
+            data, _ = await _post_json_with_fallback(
+                "/ask", _ask_payload(q, k), timeout=ASK_TIMEOUT_S
+            )
+            _log_timings(q, data.get("timings"))
+            answer = (data.get("answer") or {}).get("text") or ""
+            hits = data.get("hits", [])
+        await _finish_answer(m, placeholder, answer, hits, _API_BASE)
+    except httpx.HTTPStatusError as e:
+        status = e.response.status_code if e.response is not None else None
+        if status in (429, 503):
+            # очередь к LLM переполнена — не повторяем, просим подождать
+            logger.warning("ask rejected (HTTP %s)", status)
+            return await _edit(placeholder, "LLM сейчас перегружена, попробуйте через минуту.")
+        logger.exception("ask failed (HTTP %s)", status or "?")
+        await _edit(placeholder, f"{error_prefix}: {e}")
+    except Exception as e:
+        logger.exception("ask failed")
+        await _edit(placeholder, f"{error_prefix}: {e}")
+
+
 # ------------------------- КОМАНДЫ ---------------------------
 async def cmd_help(m: Message):
     await m.reply(
@@ -212,14 +507,78 @@ async def cmd_id(m: Message):
     await m.reply(f"Ваш Telegram ID: {m.from_user.id if m.from_user else 'неизвестно'}")
 
 
+def _format_scan_result(data: Dict[str, Any], used_base: str) -> str:
+    files = data.get("files")
+    chunks = data.get("chunks_indexed")
+    delta = ""
+    if "added" in data:
+        delta = (
+            f"\nНовых: {data.get('added')}, изменённых: {data.get('changed')}, "
+            f"удалённых: {data.get('removed')}, переименованных: {data.get('renamed')}, "
+            f"без изменений: {data.get('unchanged')}"
+        )
+    return f"Файлов: {files}, проиндексировано чанков: {chunks}{delta}\n(API: {used_base})"
+
+
+def _format_job_progress(job: Dict[str, Any]) -> str:
+    total = job.get("files_total")
+    done = job.get("files_done") or 0
+    line = f"Сканирование: {done}/{total if total is not None else '?'} файлов"
+    line += f", чанков: {job.get('chunks_indexed') or 0}"
+    rate = job.get("files_per_s") or 0
+    if rate:
+        line += f" ({rate:.1f} файл/с)"
+    errs = job.get("errors") or []
+    if errs:
+        line += f"\nОшибок: {len(errs)}"
+    return line
+
+
+async def _get_json(path: str, *, timeout: float = 30.0) -> Dict[str, Any]:
+    base = _current_base()
+    async with _tracked(base):
+        r = await _http().get(f"{base}{path}", timeout=timeout)
+        r.raise_for_status()
+    return r.json()
+
+
 async def cmd_scan(m: Message):
     if not _is_allowed(m.from_user.id if m.from_user else None):
         return await m.reply("Доступ закрыт.")
     try:
-        data, used_base = await _post_json_with_fallback("/ingest/scan", {}, timeout=180.0)
-        files = data.get("files")
-        chunks = data.get("chunks_indexed")
-        await m.reply(f"Файлов: {files}, проиндексировано чанков: {chunks}\n(API: {used_base})")
+        try:
+            job, used_base = await _post_json_with_fallback("/ingest/jobs", {}, timeout=30.0)
+        except httpx.HTTPStatusError as e:
+            if e.response is None or e.response.status_code != 404:
+                raise
+            # Старый API без фоновых задач — блокирующий вызов
+            data, used_base = await _post_json_with_fallback(
+                "/ingest/scan", {}, timeout=SCAN_MAX_WAIT_S
+            )
+            return await m.reply(_format_scan_result(data, used_base))
+
+        status = await m.reply("Сканирование запущено…")
+        shown = ""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + SCAN_MAX_WAIT_S
+        while job.get("state") in ("queued", "running"):
+            if loop.time() > deadline:
+                return await m.reply(f"Сканирование ещё идёт (задача {job.get('job_id')}).")
+            await asyncio.sleep(SCAN_POLL_INTERVAL_S)
+            job = await _get_json(f"/ingest/jobs/{job['job_id']}")
+            text = _format_job_progress(job)
+            if text != shown:
+                shown = text
+                try:
+                    await status.edit_text(text)
+                except Exception:
+                    pass
+
+        if job.get("state") != "done":
+            errs = job.get("errors") or []
+            reason = errs[-1]["error"] if errs else job.get("state")
+            return await m.reply(f"Сканирование не завершено: {reason}")
+        await m.reply(_format_scan_result(job.get("result") or {}, used_base))
     except httpx.HTTPStatusError as e:
         logger.exception("scan failed (HTTP %s)", e.response.status_code if e.response else "?")
         await m.reply(f"Ошибка запроса /scan: {e}")
@@ -256,26 +615,7 @@ async def cmd_ask(m: Message):
     if len(parts) < 2 or not parts[1].strip():
         return await m.reply("/ask <вопрос>")
 
-    q = parts[1].strip()
-    try:
-        data, used_base = await _post_json_with_fallback("/ask", {"q": q, "k": 6}, timeout=180.0)
-        answer = (data.get("answer") or {}).get("text") or ""
-        if answer and not answer.strip().startswith("[LLM недоступна"):
-            return await _reply_long(m, answer.strip(), footer=f"\n\n(API: {used_base})")
-
-        # fallback — показать релевантные фрагменты
-        hits = data.get("hits", [])[:3]
-        if hits:
-            text = "[LLM недоступна — вернул релевантные фрагменты]\n\n" + _format_hits(hits)
-        else:
-            text = "[LLM недоступна — релевантных фрагментов нет]"
-        await _reply_long(m, text, footer=f"\n\n(API: {used_base})")
-    except httpx.HTTPStatusError as e:
-        logger.exception("ask failed (HTTP %s)", e.response.status_code if e.response else "?")
-        await m.reply(f"Ошибка запроса /ask: {e}")
-    except Exception as e:
-        logger.exception("ask failed")
-        await m.reply(f"Ошибка запроса /ask: {e}")
+    await _answer(m, parts[1].strip())
 
 
 # --------------------- СВОБОДНЫЙ ТЕКСТ ----------------------
@@ -312,20 +652,7 @@ async def _route_free_text(m: Message):
             logger.exception("search failed (free text)")
             return await m.reply(f"Ошибка запроса поиска: {e}")
     if action == "ask" or action == "unknown":
-        try:
-            data, used_base = await _post_json_with_fallback("/ask", {"q": query, "k": 6}, timeout=180.0)
-            answer = (data.get("answer") or {}).get("text") or ""
-            if answer and not answer.strip().startswith("[LLM недоступна"):
-                return await _reply_long(m, answer.strip(), footer=f"\n\n(API: {used_base})")
-            hits = data.get("hits", [])[:3]
-            if hits:
-                text = "[LLM недоступна — вернул релевантные фрагменты]\n\n" + _format_hits(hits)
-            else:
-                text = "[LLM недоступна — релевантных фрагментов нет]"
-            return await _reply_long(m, text, footer=f"\n\n(API: {used_base})")
-        except Exception as e:
-            logger.exception("ask failed (free text)")
-            return await m.reply(f"Ошибка запроса: {e}")
+        return await _answer(m, query, error_prefix="Ошибка запроса")
 
 
 # ---------------------- ЗАПУСК ПРИЛОЖЕНИЯ --------------------
@@ -352,7 +679,15 @@ async def run_async():
     dp.message.register(_route_free_text)
 
     bot = Bot(token)
-    await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+    health = asyncio.create_task(_health_loop())
+    try:
+        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+    finally:
+        health.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await health
+        if _client is not None:
+            await _client.aclose()
 
 
 def run():
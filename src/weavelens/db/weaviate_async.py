@@ -0,0 +1,98 @@
+from __future__ import annotations
+import asyncio
+import time
+from typing import Any, Dict, List, Optional
+import weaviate
+from weaviate.classes.query import MetadataQuery
+from weavelens.db.weaviate_client import (
+    CHUNK_COLLECTION,
+    _HIT_PROPERTIES,
+    _fusion,
+    _to_hits,
+    connection_params,
+    settings,
+)
+from weavelens.monitoring.metrics import SEARCH_LAT
+
+# Асинхронный клиент для поиска в API: запросы не блокируют event loop,
+# одновременные /search и /ask перекрывают ожидание gRPC.
+_aclient: Optional[weaviate.WeaviateAsyncClient] = None
+_lock: Optional[asyncio.Lock] = None
+
+
+async def open_client() -> weaviate.WeaviateAsyncClient:
+    """Подключиться (идемпотентно); вызывается из lifespan API."""
+    global _aclient, _lock
+    if _lock is None:
+        _lock = asyncio.Lock()
+    async with _lock:
+        if _aclient is None or not _aclient.is_connected():
+            c = weaviate.use_async_with_local(**connection_params())
+            await c.connect()
+            _aclient = c
+    return _aclient
+
+
+async def close_client() -> None:
+    global _aclient
+    c, _aclient = _aclient, None
+    if c is not None:
+        await c.close()
+
+
+async def aclient() -> weaviate.WeaviateAsyncClient:
+    if _aclient is not None and _aclient.is_connected():
+        return _aclient
+    return await open_client()
+
+
+async def _chunks():
+    return (await aclient()).collections.get(CHUNK_COLLECTION)
+
+
+async def search_bm25(query: str, k: int = 8) -> List[Dict[str, Any]]:
+    coll = await _chunks()
+    t0 = time.perf_counter()
+    res = await coll.query.bm25(
+        query=query,
+        limit=k,
+        return_properties=_HIT_PROPERTIES,
+        return_metadata=MetadataQuery(score=True),
+    )
+    SEARCH_LAT.labels(mode="bm25").observe(time.perf_counter() - t0)
+    return _to_hits(res)
+
+
+async def search_vector(vector: List[float], k: int = 8) -> List[Dict[str, Any]]:
+    coll = await _chunks()
+    t0 = time.perf_counter()
+    res = await coll.query.near_vector(
+        near_vector=vector,
+        limit=k,
+        return_properties=_HIT_PROPERTIES,
+        return_metadata=MetadataQuery(distance=True),
+    )
+    SEARCH_LAT.labels(mode="vector").observe(time.perf_counter() - t0)
+    return _to_hits(res)
+
+
+async def search_hybrid(
+    query: str,
+    vector: List[float],
+    k: int = 8,
+    alpha: Optional[float] = None,
+    fusion: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    coll = await _chunks()
+    t0 = time.perf_counter()
+    res = await coll.query.hybrid(
+        query=query,
+        vector=vector,
+        alpha=settings.search_hybrid_alpha if alpha is None else alpha,
+        fusion_type=_fusion(fusion or settings.search_hybrid_fusion),
+        limit=k,
+        return_properties=_HIT_PROPERTIES,
+        return_metadata=MetadataQuery(score=True),
+    )
+    SEARCH_LAT.labels(mode="hybrid").observe(time.perf_counter() - t0)
+    return _to_hits(res)
@@ -1,28 +1,43 @@
 
 from __future__ import annotations
-from typing import List, Dict, Any, Optional
+import threading
+import time
+from typing import Iterable, Iterator, List, Dict, Any, Optional, Tuple
 from urllib.parse import urlparse
 import weaviate
 from weaviate.classes.config import Property, DataType, Configure
+from weaviate.classes.query import Filter, HybridFusion, MetadataQuery, Sort
+from weaviate.exceptions import ObjectAlreadyExistsError, UnexpectedStatusCodeError
+from weaviate.util import generate_uuid5
+from weavelens.monitoring.metrics import WV_BATCH
 from weavelens.settings import get_settings
 
 settings = get_settings()
 
 _client: Optional[weaviate.WeaviateClient] = None
 
+# sha256 -> uuid всех документов; грузится одним проходом итератора коллекции
+_sha_index: Optional[Dict[str, str]] = None
+_sha_lock = threading.Lock()
+
 CHUNK_COLLECTION = "chunk"
 DOCUMENT_COLLECTION = "document"
 
+def connection_params() -> Dict[str, Any]:
+    """host/port/grpc_port для connect_to_local и use_async_with_local."""
+    o = urlparse(settings.weaviate_url)
+    go = urlparse(settings.weaviate_grpc_url)
+    return {
+        "host": o.hostname or "weaviate",
+        "port": o.port or 8080,
+        "grpc_port": go.port or 50051,
+    }
+
 def _connect() -> weaviate.WeaviateClient:
     global _client
     if _client is not None:
         return _client
-    o = urlparse(settings.weaviate_url)
-    host = o.hostname or "weaviate"
-    port = o.port or 8080
-    go = urlparse(settings.weaviate_grpc_url)
-    grpc_port = go.port or 50051
-    _client = weaviate.connect_to_local(host=host, port=port, grpc_port=grpc_port)
+    _client = weaviate.connect_to_local(**connection_params())
     _ensure_schema(_client)
     return _client
 
@@ -56,68 +71,395 @@ def _ensure_schema(c: weaviate.WeaviateClient) -> None:
                 Property(name="doc_uuid", data_type=DataType.TEXT),
                 Property(name="path", data_type=DataType.TEXT),
                 Property(name="title", data_type=DataType.TEXT),
+                Property(name="has_vector", data_type=DataType.BOOL),
             ],
             vectorizer_config=Configure.Vectorizer.none(),
         )
+    else:
+        # коллекции, созданные до флага has_vector: старые чанки получат null
+        chunks = c.collections.get(CHUNK_COLLECTION)
+        if "has_vector" not in {p.name for p in chunks.config.get().properties}:
+            chunks.config.add_property(Property(name="has_vector", data_type=DataType.BOOL))
+
+def known_documents(refresh: bool = False) -> Dict[str, str]:
+    """Индекс sha256 -> uuid всех документов в памяти процесса.
+
+    Загружается одним проходом итератора по коллекции и дополняется при
+    записи через upsert_document, так что дедуп при скане — локальный lookup.
+    refresh=True перечитывает индекс (в начале каждого скана).
+    """
+    global _sha_index
+    with _sha_lock:
+        if _sha_index is not None and not refresh:
+            return _sha_index
+    coll = client().collections.get(DOCUMENT_COLLECTION)
+    index: Dict[str, str] = {}
+    for o in coll.iterator(return_properties=["sha256"]):
+        sha = (o.properties or {}).get("sha256")
+        if sha:
+            index[sha] = str(o.uuid)
+    with _sha_lock:
+        _sha_index = index
+    return index
+
+
+def drop_document_index() -> None:
+    """Забыть индекс sha256 в памяти процесса.
+
+    При нескольких воркерах API каждый держал бы свою копию индекса всех
+    документов, которая к тому же отстаёт от чужих записей; следующий скан
+    всё равно перечитает его с refresh=True.
+    """
+    global _sha_index
+    with _sha_lock:
+        _sha_index = None
+
+
+def _remember_document(sha256: str, uid: str) -> None:
+    with _sha_lock:
+        if _sha_index is not None:
+            _sha_index[sha256] = str(uid)
+
+
+def _forget_document(sha256: str) -> None:
+    with _sha_lock:
+        if _sha_index is not None:
+            _sha_index.pop(sha256, None)
+
 
 def find_document_by_sha256(sha: str) -> Optional[str]:
+    """uuid документа по sha256: из индекса в памяти, при промахе — запросом.
+
+    Индекс может отстать от Weaviate: документы пишут и другие процессы
+    (CLI, watcher, соседние воркеры API), поэтому промах не окончательный.
+    """
+    with _sha_lock:
+        if _sha_index is not None and sha in _sha_index:
+            return _sha_index[sha]
     c = client()
     coll = c.collections.get(DOCUMENT_COLLECTION)
     res = coll.query.fetch_objects(
-        filters=weaviate.classes.query.Filter.by_property("sha256").equal(sha),
+        filters=Filter.by_property("sha256").equal(sha),
         limit=1,
         return_properties=["sha256"],
     )
     if res.objects:
-        return res.objects[0].uuid
+        uid = str(res.objects[0].uuid)
+        _remember_document(sha, uid)
+        return uid
     return None
 
+def document_uuid(sha256: str) -> str:
+    """Детерминированный UUID документа: повторная запись не создаёт дубль."""
+    return generate_uuid5(sha256, DOCUMENT_COLLECTION)
+
+
+def chunk_uuid(doc_uuid: str, order: int) -> str:
+    """Детерминированный UUID чанка по (документ, порядковый номер)."""
+    return generate_uuid5(f"{doc_uuid}:{order}", CHUNK_COLLECTION)
+
+
 def upsert_document(path: str, sha256: str, title: str, size: int) -> str:
     c = client()
     coll = c.collections.get(DOCUMENT_COLLECTION)
     existing = find_document_by_sha256(sha256)
     if existing:
         return existing
-    uid = coll.data.insert(properties={"path": path, "sha256": sha256, "title": title, "size": int(size)})
+    uid = document_uuid(sha256)
+    props = {"path": path, "sha256": sha256, "title": title, "size": int(size)}
+    try:
+        coll.data.insert(properties=props, uuid=uid)
+    except (ObjectAlreadyExistsError, UnexpectedStatusCodeError) as e:
+        if "already exists" not in str(e):
+            raise
+        # тот же документ успел записать другой процесс — uuid детерминирован
+        coll.data.update(uuid=uid, properties=props)
+    _remember_document(sha256, uid)
     return uid
 
-def add_chunks(doc_uuid: str, path: str, title: str, chunks: List[str]) -> int:
+
+def _chunk_filter(doc_uuid: str):
+    return Filter.by_property("doc_uuid").equal(str(doc_uuid))
+
+
+def delete_document(sha256: str) -> bool:
+    """Удалить документ и все его чанки. True, если документ был."""
+    uid = find_document_by_sha256(sha256)
+    if not uid:
+        return False
+    c = client()
+    c.collections.get(CHUNK_COLLECTION).data.delete_many(where=_chunk_filter(uid))
+    c.collections.get(DOCUMENT_COLLECTION).data.delete_by_id(uid)
+    _forget_document(sha256)
+    return True
+
+
+def _vector(o: Any) -> Optional[List[float]]:
+    """Вектор объекта из ответа с include_vector (v4 отдаёт {"default": [...]})."""
+    vec = getattr(o, "vector", None)
+    if isinstance(vec, dict):
+        vec = vec.get("default")
+    return list(vec) if vec else None
+
+
+def _iter_document_chunks(chunks: Any, doc_uuid: str, page_size: int) -> Iterator[Any]:
+    """Чанки документа по возрастанию order, с векторами.
+
+    Курсор итератора коллекции не сочетается с фильтром, а offset упирается
+    в QUERY_MAXIMUM_RESULTS — поэтому страницы берутся по order > последнего.
+    """
+    last = -1
+    while True:
+        res = chunks.query.fetch_objects(
+            filters=_chunk_filter(doc_uuid) & Filter.by_property("order").greater_than(last),
+            sort=Sort.by_property("order"),
+            limit=page_size,
+            include_vector=True,
+        )
+        objs = getattr(res, "objects", None) or []
+        yield from objs
+        if len(objs) < page_size:
+            return
+        last = int(objs[-1].properties["order"])
+
+
+def repoint_document(sha256: str, path: str, title: str, page_size: int = 500) -> bool:
+    """Перенаправить документ и его чанки на новый путь (переименование файла).
+
+    Чанки переписываются одной пакетной записью с прежними текстом и
+    векторами (батч заменяет объект целиком, PATCH в батче нет).
+    """
+    uid = find_document_by_sha256(sha256)
+    if not uid:
+        return False
+    c = client()
+    c.collections.get(DOCUMENT_COLLECTION).data.update(
+        uuid=uid, properties={"path": path, "title": title}
+    )
+    chunks = c.collections.get(CHUNK_COLLECTION)
+    objects = (
+        (
+            o.uuid,
+            {**(o.properties or {}), "path": path, "title": title, "has_vector": v is not None},
+            v,
+        )
+        for o in _iter_document_chunks(chunks, uid, page_size)
+        for v in (_vector(o),)
+    )
+    failed: List[Dict[str, Any]] = []
+    batch_insert(chunks, objects, failed)
+    if failed:
+        raise RuntimeError(f"{len(failed)} chunks not repointed: {failed[0]['error']}")
+    return True
+
+
+def batch_insert(
+    coll: Any,
+    objects: Iterable[Tuple[Any, ...]],
+    errors: Optional[List[Dict[str, Any]]] = None,
+) -> int:
+    """Пакетная запись (uuid, properties[, vector]) через batch API клиента v4.
+
+    WEAVIATE_BATCH_SIZE > 0 — батчи фиксированного размера с
+    WEAVIATE_BATCH_CONCURRENCY параллельными запросами, 0 — динамический батчинг.
+    Возвращает число успешно записанных объектов; ошибки по отдельным
+    объектам дописываются в ``errors`` как {"uuid": ..., "error": ...}.
+    """
+    size = int(settings.weaviate_batch_size or 0)
+    if size > 0:
+        ctx = coll.batch.fixed_size(
+            batch_size=size,
+            concurrent_requests=max(1, int(settings.weaviate_batch_concurrency or 1)),
+        )
+    else:
+        ctx = coll.batch.dynamic()
+    sent = 0
+    t0 = time.perf_counter()
+    with ctx as batch:
+        for uid, props, *vec in objects:
+            vector = vec[0] if vec else None
+            if vector is None:
+                batch.add_object(properties=props, uuid=uid)
+            else:
+                batch.add_object(properties=props, uuid=uid, vector=vector)
+            sent += 1
+    # выход из контекста дожидается отправки последних батчей
+    WV_BATCH.observe(time.perf_counter() - t0)
+    failed = coll.batch.failed_objects or []
+    if errors is not None:
+        for f in failed:
+            obj = getattr(f, "object_", None)
+            errors.append({
+                "uuid": str(getattr(obj, "uuid", None) or getattr(f, "original_uuid", "") or ""),
+                "error": getattr(f, "message", str(f)),
+            })
+    return sent - len(failed)
+
+
+def add_chunks(
+    doc_uuid: str,
+    path: str,
+    title: str,
+    chunks: List[str],
+    errors: Optional[List[Dict[str, Any]]] = None,
+    start: int = 0,
+    vectors: Optional[List[List[float]]] = None,
+) -> int:
+    """Записать чанки документа; ``start`` — порядковый номер первого чанка.
+
+    ``vectors`` (по одному на чанк) пишутся вместе с объектами.
+    """
     c = client()
     coll = c.collections.get(CHUNK_COLLECTION)
-    count = 0
-    for i, txt in enumerate(chunks):
-        coll.data.insert(
-            properties={
+    objects = (
+        (
+            chunk_uuid(str(doc_uuid), start + n),
+            {
                 "text": txt,
-                "order": i,
-                "doc_uuid": doc_uuid,
+                "order": start + n,
+                "doc_uuid": str(doc_uuid),
                 "path": path,
                 "title": title,
-            }
+                "has_vector": vectors is not None,
+            },
+            vectors[n] if vectors is not None else None,
         )
-        count += 1
-    return count
-
-def search_bm25(query: str, k: int = 8) -> List[Dict[str, Any]]:
-    c = client()
-    coll = c.collections.get(CHUNK_COLLECTION)
-    res = coll.query.bm25(
-        query=query,
-        limit=k,
-        return_properties=["text", "order", "doc_uuid", "path", "title"],
+        for n, txt in enumerate(chunks)
     )
+    return batch_insert(coll, objects, errors)
+
+
+def iter_chunk_pages(
+    page_size: int = 256, after: Optional[str] = None
+) -> Iterator[List[Tuple[str, Dict[str, Any], bool]]]:
+    """Все чанки страницами [(uuid, properties, has_vector)] в порядке uuid.
+
+    ``after`` — uuid последнего обработанного чанка (для возобновления).
+    Наличие вектора берётся из свойства has_vector, сами векторы не грузятся;
+    только для старых чанков без флага они запрашиваются точечно по uuid.
+    """
+    coll = client().collections.get(CHUNK_COLLECTION)
+
+    def _resolve(
+        page: List[Tuple[str, Dict[str, Any]]],
+    ) -> List[Tuple[str, Dict[str, Any], bool]]:
+        legacy = [uid for uid, props in page if props.get("has_vector") is None]
+        with_vector = set()
+        if legacy:
+            res = coll.query.fetch_objects(
+                filters=Filter.by_id().contains_any(legacy),
+                limit=len(legacy),
+                include_vector=True,
+                return_properties=[],
+            )
+            with_vector = {str(o.uuid) for o in getattr(res, "objects", None) or [] if _vector(o)}
+        out = []
+        for uid, props in page:
+            flag = props.get("has_vector")
+            out.append((uid, props, uid in with_vector if flag is None else bool(flag)))
+        return out
+
+    page: List[Tuple[str, Dict[str, Any]]] = []
+    for o in coll.iterator(after=after, cache_size=page_size):
+        page.append((str(o.uuid), dict(o.properties or {})))
+        if len(page) >= page_size:
+            yield _resolve(page)
+            page = []
+    if page:
+        yield _resolve(page)
+
+
+def set_chunk_vectors(
+    items: Iterable[Tuple[str, Dict[str, Any], List[float]]],
+    errors: Optional[List[Dict[str, Any]]] = None,
+) -> int:
+    """Перезаписать чанки (uuid, properties, vector) с векторами."""
+    coll = client().collections.get(CHUNK_COLLECTION)
+    flagged = ((uid, {**props, "has_vector": True}, vec) for uid, props, vec in items)
+    return batch_insert(coll, flagged, errors)
+
+_HIT_PROPERTIES = ["text", "order", "doc_uuid", "path", "title"]
+
+
+def _to_hits(res: Any) -> List[Dict[str, Any]]:
+    """Ответ Weaviate -> hits.
+
+    ``score`` во всех режимах — чем больше, тем лучше: BM25/гибрид отдают его
+    сами, для векторного поиска это 1 - косинусное расстояние. ``distance`` —
+    само расстояние (только в векторном режиме, иначе None).
+    """
     hits: List[Dict[str, Any]] = []
     for o in getattr(res, "objects", []) or []:
         props = o.properties or {}
         meta = getattr(o, "metadata", None)
         score = getattr(meta, "score", None) if meta else None
+        distance = getattr(meta, "distance", None) if meta else None
+        if score is None and distance is not None:
+            score = 1.0 - distance
         hits.append({
             "text": props.get("text", ""),
             "doc_id": props.get("doc_uuid"),  # logical document id (string we stored)
-            "chunk_id": o.uuid,
+            "chunk_id": str(o.uuid),  # UUID из Weaviate не сериализуется в JSON потока
             "order": props.get("order", 0),
-            "distance": score if score is not None else 0.0,
+            "score": score if score is not None else 0.0,
+            "distance": distance,
             "path": props.get("path"),
             "title": props.get("title"),
         })
     return hits
+
+
+def search_bm25(query: str, k: int = 8) -> List[Dict[str, Any]]:
+    c = client()
+    coll = c.collections.get(CHUNK_COLLECTION)
+    res = coll.query.bm25(
+        query=query,
+        limit=k,
+        return_properties=_HIT_PROPERTIES,
+        return_metadata=MetadataQuery(score=True),
+    )
+    return _to_hits(res)
+
+
+def search_vector(vector: List[float], k: int = 8) -> List[Dict[str, Any]]:
+    """Поиск по близости вектора запроса.
+
+    distance — косинусное расстояние, score = 1 - distance.
+    """
+    c = client()
+    coll = c.collections.get(CHUNK_COLLECTION)
+    res = coll.query.near_vector(
+        near_vector=vector,
+        limit=k,
+        return_properties=_HIT_PROPERTIES,
+        return_metadata=MetadataQuery(distance=True),
+    )
+    return _to_hits(res)
+
+
+def _fusion(name: Optional[str]) -> HybridFusion:
+    if (name or "").lower() == "ranked":
+        return HybridFusion.RANKED
+    return HybridFusion.RELATIVE_SCORE
+
+
+def search_hybrid(
+    query: str,
+    vector: List[float],
+    k: int = 8,
+    alpha: Optional[float] = None,
+    fusion: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """Гибрид BM25 + вектор (alpha: 0 — только BM25, 1 — только вектор)."""
+    c = client()
+    coll = c.collections.get(CHUNK_COLLECTION)
+    res = coll.query.hybrid(
+        query=query,
+        vector=vector,
+        alpha=settings.search_hybrid_alpha if alpha is None else alpha,
+        fusion_type=_fusion(fusion or settings.search_hybrid_fusion),
+        limit=k,
+        return_properties=_HIT_PROPERTIES,
+        return_metadata=MetadataQuery(score=True),
+    )
+    return _to_hits(res)
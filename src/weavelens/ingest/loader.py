@@ -1,7 +1,8 @@
 from __future__ import annotations
 import os, hashlib, time
 from typing import Dict, Iterable, List, Tuple
-from ..db.weaviate_client import get_client
+from ..db.weaviate_client import batch_insert, get_client
+from weaviate.util import generate_uuid5
 from .chunker import iter_chunks
 
 def _sha256_file(path: str, buf_size: int = 1024 * 1024) -> str:
@@ -25,11 +26,14 @@ def _read_text_file(path: str) -> str:
     with open(path, 'r', encoding='utf-8', errors='ignore') as f:
         return f.read()
 
-def scan_paths(paths: Iterable[str]) -> Tuple[int, int]:
+def scan_paths(paths: Iterable[str], errors: List[Dict] | None = None) -> Tuple[int, int]:
     """Scan given paths, deduplicate by file content (sha256),
 
     upsert Document and Chunk objects into Weaviate.
 
+    Chunks are written in batches with deterministic UUIDs, so a retried
+    scan does not duplicate them. Per-object failures go to ``errors``.
+
     Returns (files_seen, chunks_indexed)
 
     """
@@ -83,14 +87,19 @@ def scan_paths(paths: Iterable[str]) -> Tuple[int, int]:
                 })
 
                 # Upsert Chunks
-                for order, chunk_text in enumerate(iter_chunks(text)):
-                    chunks.data.insert({
-                        "chunk_id": _chunk_id(doc_id, order),
-                        "doc_id": doc_id,
-                        "order": order,
-                        "text": chunk_text,
-                        "path": full,
-                        "filename": name,
-                    })
-                    chunks_indexed += 1
+                objects = (
+                    (
+                        generate_uuid5(_chunk_id(doc_id, order), "Chunk"),
+                        {
+                            "chunk_id": _chunk_id(doc_id, order),
+                            "doc_id": doc_id,
+                            "order": order,
+                            "text": chunk_text,
+                            "path": full,
+                            "filename": name,
+                        },
+                    )
+                    for order, chunk_text in enumerate(iter_chunks(text))
+                )
+                chunks_indexed += batch_insert(chunks, objects, errors)
     return files_seen, chunks_indexed
\ No newline at end of file
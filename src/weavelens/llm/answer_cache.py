@@ -0,0 +1,102 @@
+from __future__ import annotations
+import time
+from typing import Any, Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+from weavelens.monitoring.metrics import ANSWER_CACHE
+from weavelens.settings import get_settings
+from weavelens.utils.cache import TTLCache
+
+# сколько вариантов формулировки хранить на один набор чанков
+_SEMANTIC_PER_CHUNKS = 8
+
+
+def normalize_question(text: str) -> str:
+    return " ".join((text or "").casefold().replace("ё", "е").split()).rstrip(" ?.!")
+
+
+def _chunk_ids(hits: Sequence[Dict[str, Any]]) -> Tuple[str, ...]:
+    return tuple(str(h.get("chunk_id")) for h in hits)
+
+
+class AnswerCache:
+    """Кэш ответов /ask: нормализованный вопрос + упорядоченные id чанков.
+
+    id чанков детерминированы по sha256 документа, поэтому переиндексация
+    изменённого файла сама делает старые ответы недостижимыми. Опционально
+    (semantic) ищется почти-дубликат вопроса по эмбеддингу среди ответов
+    на тот же набор чанков.
+    """
+
+    def __init__(
+        self, maxsize: int, ttl: float, semantic: bool = False, min_sim: float = 0.95
+    ) -> None:
+        self.exact: TTLCache[Dict[str, Any]] = TTLCache(maxsize, ttl)
+        self.semantic = semantic
+        self.min_sim = min_sim
+        self._similar: TTLCache[List[Tuple[List[float], Dict[str, Any]]]] = TTLCache(maxsize, ttl)
+
+    def get(
+        self, q: str, hits: Sequence[Dict[str, Any]], vector: Optional[List[float]] = None
+    ) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """Вернуть (вид попадания, запись) или None."""
+        ids = _chunk_ids(hits)
+        entry = self.exact.get((normalize_question(q), ids))
+        if entry is not None:
+            ANSWER_CACHE.labels(result="exact").inc()
+            return "exact", entry
+        if self.semantic and vector is not None:
+            best, best_sim = None, self.min_sim
+            for vec, cand in self._similar.get(frozenset(ids)) or []:
+                sim = sum(a * b for a, b in zip(vector, vec))
+                if sim >= best_sim:
+                    best, best_sim = cand, sim
+            if best is not None:
+                ANSWER_CACHE.labels(result="semantic").inc()
+                return "semantic", best
+        ANSWER_CACHE.labels(result="miss").inc()
+        return None
+
+    def set(
+        self,
+        q: str,
+        hits: Sequence[Dict[str, Any]],
+        text: str,
+        vector: Optional[List[float]] = None,
+    ) -> None:
+        ids = _chunk_ids(hits)
+        entry = {"text": text, "question": q, "created": time.time()}
+        self.exact.set((normalize_question(q), ids), entry)
+        if self.semantic and vector is not None:
+            key: FrozenSet[str] = frozenset(ids)
+            bucket = list(self._similar.get(key) or [])[-(_SEMANTIC_PER_CHUNKS - 1):]
+            bucket.append((vector, entry))
+            self._similar.set(key, bucket)
+
+    def clear(self) -> None:
+        self.exact.clear()
+        self._similar.clear()
+
+
+def cache_info(kind: Optional[str], entry: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Поле cache в ответе /ask."""
+    info: Dict[str, Any] = {"hit": kind is not None, "kind": kind}
+    if entry is not None:
+        info["age_s"] = round(time.time() - entry["created"], 3)
+        info["question"] = entry["question"]
+    return info
+
+
+_cache: Optional[AnswerCache] = None
+
+
+def get_answer_cache() -> AnswerCache:
+    global _cache
+    if _cache is None:
+        s = get_settings()
+        _cache = AnswerCache(
+            s.answer_cache_size,
+            s.answer_cache_ttl_s,
+            semantic=s.answer_cache_semantic,
+            min_sim=s.answer_cache_min_sim,
+        )
+    return _cache
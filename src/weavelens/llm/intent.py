@@ -0,0 +1,237 @@
+from __future__ import annotations
+import asyncio
+import logging
+import os
+import re
+import sqlite3
+from typing import Dict, List, NamedTuple, Optional, Pattern, Tuple
+
+from weavelens.settings import get_settings
+from weavelens.utils.cache import SQLiteCache, TTLCache
+
+logger = logging.getLogger("weavelens.intent")
+
+INTENT_CACHE_FILENAME = "intent_cache.sqlite3"
+
+ACTIONS = ("ask", "search", "scan", "help", "unknown")
+
+
+class IntentGuess(NamedTuple):
+    action: str
+    query: str
+    confidence: float
+    stage: str
+
+
+# (действие, шаблон, уверенность). Группа query — текст запроса после триггера.
+# Якорные шаблоны (триггер в начале сообщения) надёжнее, чем слово где-то внутри.
+_RULES: List[Tuple[str, Pattern[str], float]] = [
+    (
+        "help",
+        re.compile(
+            r"^\s*(?:/?start|/?help|помощь|помоги|справка|команды|список команд|"
+            r"что ты умеешь|что умеешь|как пользоваться)\W*$",
+            re.I,
+        ),
+        1.0,
+    ),
+    (
+        "scan",
+        re.compile(
+            r"^\s*(?:пере)?(?:сканируй|сканировать|скан|проиндексируй|индексируй|переиндексируй|"
+            r"reindex|rescan|re-index|scan|index)\b",
+            re.I,
+        ),
+        0.95,
+    ),
+    (
+        "scan",
+        re.compile(
+            r"\b(?:перескан\w*|переиндекс\w*|проиндексир\w*|reindex|rescan"
+            r"|обнови(?:ть)?\s+(?:базу|индекс))",
+            re.I,
+        ),
+        0.8,
+    ),
+    (
+        "search",
+        re.compile(
+            r"^\s*(?:найди|найти|поищи|ищи|поиск|отыщи|покажи документы|find|search(?:\s+for)?|"
+            r"look\s+(?:for|up))\b[\s:,-]*(?:мне\s+)?(?P<query>.*)$",
+            re.I | re.S,
+        ),
+        0.95,
+    ),
+    (
+        "ask",
+        re.compile(
+            r"^\s*(?:что такое|что значит|почему|зачем|как|каким образом|объясни|расскажи|"
+            r"what|why|how|explain|describe)\b",
+            re.I,
+        ),
+        0.9,
+    ),
+    ("ask", re.compile(r"\?\s*$"), 0.85),
+]
+
+
+def classify_rules(text: str) -> Optional[IntentGuess]:
+    """Ключевые слова и регулярные выражения для очевидных команд.
+
+    Если сработали правила разных действий, уверенность снижается вдвое —
+    такое сообщение лучше отдать модели/LLM.
+    """
+    text = (text or "").strip()
+    if not text:
+        return None
+    best: Optional[IntentGuess] = None
+    matched = set()
+    for action, pattern, conf in _RULES:
+        mt = pattern.search(text)
+        if not mt:
+            continue
+        matched.add(action)
+        if best is None or conf > best.confidence:
+            query = ""
+            if action == "search":
+                query = (mt.groupdict().get("query") or "").strip(" \t\n.!?,:") or text
+            elif action == "ask":
+                query = text
+            best = IntentGuess(action, query, conf, "rules")
+    if best is not None and len(matched) > 1:
+        best = best._replace(confidence=best.confidence / 2)
+    return best
+
+
+# Примеры фраз для опциональной модели (ближайший прототип по эмбеддингу)
+_EXAMPLES: Dict[str, List[str]] = {
+    "scan": [
+        "пересканируй входящую папку",
+        "обнови индекс документов",
+        "проиндексируй новые файлы",
+        "reindex the inbox",
+    ],
+    "search": [
+        "найди договор с поставщиком",
+        "где лежит отчёт за квартал",
+        "покажи документы про отпуск",
+        "find the invoice from March",
+    ],
+    "ask": [
+        "объясни, что означает этот пункт",
+        "почему вырос бюджет проекта",
+        "как оформить командировку",
+        "what does the policy say about remote work",
+    ],
+    "help": [
+        "что ты умеешь",
+        "какие есть команды",
+        "как пользоваться ботом",
+        "help me use the bot",
+    ],
+}
+_prototypes: Optional[Tuple[List[str], List[List[float]]]] = None
+
+
+async def _load_prototypes() -> Tuple[List[str], List[List[float]]]:
+    global _prototypes
+    if _prototypes is None:
+        from weavelens.models.embeddings import embed_texts
+
+        labels = [a for a, phrases in _EXAMPLES.items() for _ in phrases]
+        phrases = [p for ps in _EXAMPLES.values() for p in ps]
+        vectors = await asyncio.get_running_loop().run_in_executor(None, embed_texts, phrases)
+        _prototypes = (labels, vectors)
+    return _prototypes
+
+
+async def classify_model(text: str) -> Optional[IntentGuess]:
+    """Лёгкая модель: косинус запроса к примерам каждого действия (та же модель
+    эмбеддингов, что и для поиска; векторы нормированы). Уверенность — лучший
+    скор, если он заметно выше лучшего скора другого действия.
+    """
+    from weavelens.models.embed_service import get_embedding_service
+
+    labels, protos = await _load_prototypes()
+    vec = await get_embedding_service().embed_query(text)
+    best: Dict[str, float] = {}
+    for label, proto in zip(labels, protos):
+        score = sum(a * b for a, b in zip(vec, proto))
+        best[label] = max(score, best.get(label, -1.0))
+    ranked = sorted(best.items(), key=lambda kv: kv[1], reverse=True)
+    if not ranked:
+        return None
+    action, score = ranked[0]
+    margin = score - ranked[1][1] if len(ranked) > 1 else score
+    conf = score if margin >= 0.05 else score / 2
+    query = text if action in ("search", "ask") else ""
+    return IntentGuess(action, query, conf, "model")
+
+
+def normalize_intent_text(text: str) -> str:
+    """Ключ кэша: регистр, ё/е, пробелы и финальная точка/восклицание не важны."""
+    t = " ".join((text or "").casefold().replace("ё", "е").split())
+    return t.rstrip(" .!…")
+
+
+class IntentCache:
+    """Кэш распознанных намерений: TTLCache в памяти + опционально SQLite.
+
+    SQLite-слой переживает рестарт API и общий для воркеров; попадание в
+    него поднимает запись в память. Из event loop — aget/aset: SQLite
+    читается и пишется в потоке, промах памяти не блокирует loop.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, db_path: Optional[str] = None) -> None:
+        self.memory: TTLCache[Dict[str, str]] = TTLCache(maxsize, ttl)
+        self.store = (
+            SQLiteCache(db_path, ttl, table="intents", maxsize=maxsize) if db_path else None
+        )
+
+    def get(self, text: str) -> Optional[Dict[str, str]]:
+        key = normalize_intent_text(text)
+        value = self.memory.get(key)
+        if value is None and self.store is not None:
+            try:
+                value = self.store.get(key)
+            except sqlite3.Error:
+                logger.warning("intent cache read failed", exc_info=True)
+                return None
+            if value is not None:
+                self.memory.set(key, value)
+        return value
+
+    def set(self, text: str, value: Dict[str, str]) -> None:
+        key = normalize_intent_text(text)
+        self.memory.set(key, value)
+        if self.store is not None:
+            try:
+                self.store.set(key, value)
+            except sqlite3.Error:
+                logger.warning("intent cache write failed", exc_info=True)
+
+    async def aget(self, text: str) -> Optional[Dict[str, str]]:
+        value = self.memory.get(normalize_intent_text(text))
+        if value is None and self.store is not None:
+            value = await asyncio.to_thread(self.get, text)
+        return value
+
+    async def aset(self, text: str, value: Dict[str, str]) -> None:
+        if self.store is None:
+            self.set(text, value)
+        else:
+            await asyncio.to_thread(self.set, text, value)
+
+
+_cache: Optional[IntentCache] = None
+
+
+def get_intent_cache() -> IntentCache:
+    global _cache
+    if _cache is None:
+        s = get_settings()
+        db_path = None
+        if s.intent_cache_persist and s.intent_cache_size > 0:
+            db_path = os.path.join(s.data_processed, INTENT_CACHE_FILENAME)
+        _cache = IntentCache(s.intent_cache_size, s.intent_cache_ttl_s, db_path)
+    return _cache
@@ -1,12 +1,20 @@
 
 from __future__ import annotations
+import asyncio
+import json
 import httpx
+from typing import AsyncIterator, Optional
 from urllib.parse import urlparse
 
+from weavelens.llm.scheduler import get_scheduler
+from weavelens.monitoring.metrics import LLM_GEN, LLM_TPS
 from weavelens.settings import get_settings, pick_ollama_model
 
 settings = get_settings()
 
+# Общий клиент на процесс: открывается в lifespan API, соединения переиспользуются
+_client: Optional[httpx.AsyncClient] = None
+
 
 class OllamaError(Exception):
     pass
@@ -24,14 +32,170 @@ def _base_url(host: str, port: int) -> str:
     return f"http://{host}"
 
 
-async def generate(prompt: str, model: str | None = None, timeout: float = 60.0) -> str:
-    base = _base_url(settings.ollama_host, settings.ollama_port).rstrip("/")
-    mdl = model or pick_ollama_model(settings.llm_accel, settings.ollama_model_cpu, settings.ollama_model_gpu)
-    url = f"{base}/api/generate"
-    async with httpx.AsyncClient(timeout=timeout) as client:
-        r = await client.post(url, json={"model": mdl, "prompt": prompt, "stream": False})
-        r.raise_for_status()
-        data = r.json()
-        if "response" not in data:
-            raise OllamaError("no response field from ollama")
-        return data["response"]
+def _timeout(total: float) -> httpx.Timeout:
+    return httpx.Timeout(total, connect=min(total, settings.ollama_connect_timeout_s))
+
+
+async def open_client() -> httpx.AsyncClient:
+    """Создать общий клиент с пулом keep-alive соединений (идемпотентно)."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            base_url=_base_url(settings.ollama_host, settings.ollama_port),
+            timeout=_timeout(settings.ollama_ask_timeout_s),
+            limits=httpx.Limits(
+                max_connections=settings.ollama_max_connections,
+                max_keepalive_connections=settings.ollama_max_keepalive,
+                keepalive_expiry=settings.ollama_keepalive_expiry_s,
+            ),
+        )
+    return _client
+
+
+async def close_client() -> None:
+    global _client
+    client, _client = _client, None
+    if client is not None and not client.is_closed:
+        await client.aclose()
+
+
+async def get_client() -> httpx.AsyncClient:
+    # Вне API (скрипты, тесты) lifespan не запускается — создаём клиент по требованию
+    return _client if _client is not None and not _client.is_closed else await open_client()
+
+
+def default_model() -> str:
+    return pick_ollama_model(
+        settings.llm_accel, settings.ollama_model_cpu, settings.ollama_model_gpu
+    )
+
+
+def _payload(model: str, prompt: str, stream: bool, **extra) -> dict:
+    payload = {"model": model, "prompt": prompt, "stream": stream, **extra}
+    if settings.ollama_keep_alive:
+        payload["keep_alive"] = settings.ollama_keep_alive
+    return payload
+
+
+def _observe_generation(kind: str, seconds: float, data: dict) -> None:
+    LLM_GEN.labels(kind=kind).observe(seconds)
+    # eval_count/eval_duration (нс) — из финального ответа Ollama
+    tokens, ns = data.get("eval_count"), data.get("eval_duration")
+    if tokens and ns:
+        LLM_TPS.labels(kind=kind).observe(tokens / (ns / 1e9))
+
+
+def _fill_stats(stats: Optional[dict], data: dict) -> None:
+    """Счётчики Ollama из финального ответа: токены и длительности (нс → мс)."""
+    if stats is None:
+        return
+    stats["prompt_tokens"] = data.get("prompt_eval_count")
+    stats["completion_tokens"] = data.get("eval_count")
+    for key in ("load_duration", "prompt_eval_duration", "eval_duration", "total_duration"):
+        if data.get(key) is not None:
+            stats[key.replace("_duration", "_ms")] = round(data[key] / 1e6, 1)
+
+
+async def list_models(timeout: float = 3.0) -> list[str]:
+    """Модели, доступные в Ollama (/api/tags) — для проверки готовности."""
+    client = await get_client()
+    r = await client.get("/api/tags", timeout=_timeout(timeout))
+    r.raise_for_status()
+    return [m.get("name") or m.get("model") for m in r.json().get("models", [])]
+
+
+async def warm_model(model: str | None = None) -> None:
+    """Загрузить модель в память Ollama генерацией одного токена (мимо очереди)."""
+    client = await get_client()
+    r = await client.post(
+        "/api/generate",
+        json=_payload(model or default_model(), "ok", stream=False, options={"num_predict": 1}),
+        timeout=_timeout(settings.ollama_ask_timeout_s),
+    )
+    r.raise_for_status()
+
+
+async def generate(
+    prompt: str,
+    model: str | None = None,
+    timeout: float | None = None,
+    *,
+    kind: str = "answer",
+    deadline: float | None = None,
+    stats: dict | None = None,
+) -> str:
+    """Сгенерировать ответ целиком.
+
+    timeout — общий бюджет запроса, включая ожидание слота в планировщике;
+    deadline (loop.time()) задаёт его явно. kind — приоритет в очереди
+    (intent раньше answer). stats, если передан, заполняется ожиданием
+    в очереди и счётчиками Ollama (для профилирования запроса).
+    """
+    mdl = model or default_model()
+    loop = asyncio.get_running_loop()
+    if deadline is None:
+        deadline = loop.time() + (timeout or settings.ollama_ask_timeout_s)
+    client = await get_client()
+    t_wait = loop.time()
+    async with get_scheduler().slot(kind, deadline):
+        remaining = max(1.0, deadline - loop.time())
+        t0 = loop.time()
+        if stats is not None:
+            stats["queue_ms"] = round((t0 - t_wait) * 1000, 1)
+        r = await client.post(
+            "/api/generate",
+            json=_payload(mdl, prompt, stream=False),
+            timeout=_timeout(remaining),
+        )
+    r.raise_for_status()
+    data = r.json()
+    if "response" not in data:
+        raise OllamaError("no response field from ollama")
+    _observe_generation(kind, loop.time() - t0, data)
+    _fill_stats(stats, data)
+    return data["response"]
+
+
+async def generate_stream(
+    prompt: str,
+    model: str | None = None,
+    timeout: float | None = None,
+    *,
+    kind: str = "answer",
+    deadline: float | None = None,
+    stats: dict | None = None,
+) -> AsyncIterator[str]:
+    """Отдавать фрагменты ответа по мере генерации (stream=true, NDJSON от Ollama).
+
+    timeout действует на ожидание каждого очередного фрагмента, а не на весь
+    ответ; слот планировщика занят до конца потока. stats — как в generate.
+    """
+    mdl = model or default_model()
+    loop = asyncio.get_running_loop()
+    if deadline is None:
+        deadline = loop.time() + (timeout or settings.ollama_ask_timeout_s)
+    client = await get_client()
+    t_wait = loop.time()
+    async with get_scheduler().slot(kind, deadline):
+        t0 = loop.time()
+        if stats is not None:
+            stats["queue_ms"] = round((t0 - t_wait) * 1000, 1)
+        async with client.stream(
+            "POST",
+            "/api/generate",
+            json=_payload(mdl, prompt, stream=True),
+            timeout=_timeout(timeout or settings.ollama_ask_timeout_s),
+        ) as r:
+            r.raise_for_status()
+            async for line in r.aiter_lines():
+                if not line.strip():
+                    continue
+                data = json.loads(line)
+                if data.get("error"):
+                    raise OllamaError(str(data["error"]))
+                if data.get("response"):
+                    yield data["response"]
+                if data.get("done"):
+                    _observe_generation(kind, loop.time() - t0, data)
+                    _fill_stats(stats, data)
+                    break
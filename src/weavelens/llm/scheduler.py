@@ -0,0 +1,155 @@
+from __future__ import annotations
+import asyncio
+import heapq
+import itertools
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from weavelens.monitoring.metrics import LLM_ACTIVE, LLM_QUEUE, LLM_REJECTED, LLM_WAIT
+from weavelens.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Меньше — раньше: короткие вызовы маршрутизатора не ждут за длинными ответами
+PRIORITIES: Dict[str, int] = {"intent": 0, "answer": 1}
+
+
+class SchedulerError(Exception):
+    status_code = 503
+
+
+class QueueFull(SchedulerError):
+    """Очередь к LLM заполнена — отказываем сразу."""
+
+    status_code = 429
+
+
+class DeadlineExceeded(SchedulerError):
+    """Слот не освободился до дедлайна запроса."""
+
+
+class LLMScheduler:
+    """Ограничение одновременных вызовов LLM с очередью по приоритетам.
+
+    concurrency — сколько генераций идёт параллельно (под OLLAMA_NUM_PARALLEL),
+    max_queue — сколько ещё запросов может ждать; сверх этого QueueFull.
+    Ожидающий запрос снимается с очереди по дедлайну или при отмене.
+    """
+
+    def __init__(self, concurrency: int, max_queue: int) -> None:
+        self.concurrency = max(1, int(concurrency))
+        self.max_queue = max(0, int(max_queue))
+        self._active = 0
+        self._queue: List[list] = []
+        self._seq = itertools.count()
+
+    @property
+    def queued(self) -> int:
+        return len(self._queue)
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    def full(self) -> bool:
+        return self._active >= self.concurrency and len(self._queue) >= self.max_queue
+
+    def _update_gauges(self) -> None:
+        LLM_QUEUE.set(len(self._queue))
+        LLM_ACTIVE.set(self._active)
+
+    def _release(self) -> None:
+        self._active -= 1
+        while self._queue:
+            _, _, fut = heapq.heappop(self._queue)
+            if not fut.done():
+                self._active += 1
+                fut.set_result(None)
+                break
+        self._update_gauges()
+
+    @asynccontextmanager
+    async def slot(
+        self, kind: str = "answer", deadline: Optional[float] = None
+    ) -> AsyncIterator[None]:
+        """Занять слот LLM. deadline — loop.time(), после которого ждать бессмысленно."""
+        loop = asyncio.get_running_loop()
+        t0 = loop.time()
+        if self._active < self.concurrency and not self._queue:
+            self._active += 1
+        else:
+            if len(self._queue) >= self.max_queue:
+                LLM_REJECTED.labels(reason="queue_full").inc()
+                raise QueueFull(f"LLM queue is full ({self.max_queue} waiting)")
+            fut: asyncio.Future = loop.create_future()
+            entry = [PRIORITIES.get(kind, len(PRIORITIES)), next(self._seq), fut]
+            heapq.heappush(self._queue, entry)
+            self._update_gauges()
+            try:
+                timeout = None if deadline is None else max(0.0, deadline - loop.time())
+                await asyncio.wait_for(asyncio.shield(fut), timeout)
+            except BaseException as e:
+                if fut.done() and not fut.cancelled():
+                    # слот выдали одновременно с отменой — передаём следующему
+                    self._release()
+                else:
+                    fut.cancel()
+                    if entry in self._queue:
+                        self._queue.remove(entry)
+                        heapq.heapify(self._queue)
+                    self._update_gauges()
+                if isinstance(e, asyncio.TimeoutError):
+                    LLM_REJECTED.labels(reason="deadline").inc()
+                    raise DeadlineExceeded(f"no LLM slot within {loop.time() - t0:.1f}s") from None
+                raise
+        LLM_WAIT.labels(kind=kind).observe(loop.time() - t0)
+        self._update_gauges()
+        try:
+            yield
+        finally:
+            self._release()
+
+
+_scheduler: Optional[LLMScheduler] = None
+
+
+def worker_limits(concurrency: int, max_queue: int, workers: int) -> Tuple[int, int]:
+    """Доля лимитов LLM на один процесс API.
+
+    Планировщик живёт в памяти процесса, так что при API_WORKERS > 1 лимиты
+    делятся между воркерами, иначе Ollama получит concurrency * workers
+    генераций. Меньше одного слота на процесс не бывает.
+    """
+    workers = max(1, int(workers))
+    return max(1, int(concurrency) // workers), -(-max(0, int(max_queue)) // workers)
+
+
+def get_scheduler() -> LLMScheduler:
+    global _scheduler
+    if _scheduler is None:
+        s = get_settings()
+        workers = max(1, s.api_workers)
+        concurrency, max_queue = worker_limits(s.llm_max_concurrency, s.llm_queue_size, workers)
+        if concurrency * workers > s.llm_max_concurrency:
+            logger.warning(
+                "LLM_MAX_CONCURRENCY=%s < API_WORKERS=%s: up to %s concurrent LLM calls",
+                s.llm_max_concurrency, workers, concurrency * workers,
+            )
+        _scheduler = LLMScheduler(concurrency, max_queue)
+    return _scheduler
+
+
+def request_deadline(client_timeout: Optional[str], budget: float) -> float:
+    """Дедлайн (loop.time()) для LLM-вызова запроса.
+
+    budget — наш бюджет на вызов; client_timeout — заголовок X-Request-Timeout
+    (сек): сколько клиент готов ждать. Работа после ухода клиента не нужна.
+    """
+    try:
+        client = float(client_timeout or 0)
+    except ValueError:
+        client = 0.0
+    if client > 0:
+        budget = min(budget, client)
+    return asyncio.get_running_loop().time() + budget
@@ -0,0 +1,100 @@
+from __future__ import annotations
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from ..monitoring.metrics import EMB_BATCH, EMB_CACHE, EMB_LAT
+from ..settings import get_settings
+from ..utils.cache import TTLCache
+
+
+def normalize_query(text: str) -> str:
+    return " ".join((text or "").split())
+
+
+class EmbeddingService:
+    """Кодирование запросов вне event loop: LRU/TTL-кэш + микробатчинг.
+
+    Одновременные запросы собираются в течение EMB_BATCH_WAIT_MS (или до
+    EMB_BATCH_MAX штук) и кодируются одним вызовом encode в отдельном потоке.
+    """
+
+    def __init__(
+        self,
+        cache_size: int,
+        cache_ttl: float,
+        batch_wait_ms: float,
+        batch_max: int,
+    ) -> None:
+        self.cache: TTLCache[List[float]] = TTLCache(cache_size, cache_ttl)
+        self.batch_wait = max(0.0, batch_wait_ms) / 1000.0
+        self.batch_max = max(1, batch_max)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed")
+        self._pending: Dict[str, "asyncio.Future[List[float]]"] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def embed_query(self, text: str) -> List[float]:
+        key = normalize_query(text)
+        cached = self.cache.get(key)
+        if cached is not None:
+            EMB_CACHE.labels(result="hit").inc()
+            return cached
+        EMB_CACHE.labels(result="miss").inc()
+
+        fut = self._pending.get(key)
+        if fut is None:
+            loop = asyncio.get_running_loop()
+            fut = loop.create_future()
+            self._pending[key] = fut
+            if len(self._pending) >= self.batch_max:
+                self._flush()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.batch_wait, self._flush)
+        return await asyncio.shield(fut)
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch = list(self._pending.items())
+        self._pending = {}
+        asyncio.get_running_loop().create_task(self._encode(batch))
+
+    async def _encode(self, batch: List[Tuple[str, "asyncio.Future[List[float]]"]]) -> None:
+        from .embeddings import embed_texts
+
+        texts = [key for key, _ in batch]
+        EMB_BATCH.observe(len(texts))
+        loop = asyncio.get_running_loop()
+        t0 = time.perf_counter()
+        try:
+            vectors = await loop.run_in_executor(self._executor, embed_texts, texts)
+            EMB_LAT.labels(kind="query").observe(time.perf_counter() - t0)
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for (key, fut), vec in zip(batch, vectors):
+            self.cache.set(key, vec)
+            if not fut.done():
+                fut.set_result(vec)
+
+
+_service: Optional[EmbeddingService] = None
+
+
+def get_embedding_service() -> EmbeddingService:
+    global _service
+    if _service is None:
+        s = get_settings()
+        _service = EmbeddingService(
+            cache_size=s.emb_query_cache_size,
+            cache_ttl=s.emb_query_cache_ttl_s,
+            batch_wait_ms=s.emb_batch_wait_ms,
+            batch_max=s.emb_batch_max,
+        )
+    return _service
@@ -1,18 +1,83 @@
 from __future__ import annotations
+import os
+import shutil
 from sentence_transformers import SentenceTransformer
 from ..settings import Settings
 
 _model: SentenceTransformer | None = None
 
+
+def _onnx_export_dir(s: Settings) -> str:
+    return os.path.join(s.models_cache, "onnx", s.emb_model_name.replace("/", "__"))
+
+
+def _ensure_onnx_export(s: Settings) -> str:
+    """Один раз экспортировать модель в ONNX и сохранить в MODELS_CACHE/onnx."""
+    export_dir = _onnx_export_dir(s)
+    if not os.path.exists(os.path.join(export_dir, "onnx", "model.onnx")):
+        model = SentenceTransformer(
+            s.emb_model_name, cache_folder=s.models_cache, device="cpu", backend="onnx"
+        )
+        # Пишем во временный каталог и переименовываем, чтобы параллельный
+        # процесс не подхватил недописанный экспорт
+        tmp = f"{export_dir}.tmp{os.getpid()}"
+        model.save_pretrained(tmp)
+        os.makedirs(os.path.dirname(export_dir), exist_ok=True)
+        try:
+            os.replace(tmp, export_dir)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+    return export_dir
+
+
+def _ensure_quantized(s: Settings, export_dir: str) -> str:
+    """Динамическая int8-квантизация ONNX-модели (кэшируется рядом с экспортом)."""
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+
+    cfg = s.emb_quant_config
+    file_name = f"onnx/model_qint8_{cfg}.onnx"
+    if not os.path.exists(os.path.join(export_dir, file_name)):
+        model = SentenceTransformer(export_dir, device="cpu", backend="onnx")
+        export_dynamic_quantized_onnx_model(model, cfg, export_dir)
+    return file_name
+
+
+def load_embedder(backend: str | None = None) -> SentenceTransformer:
+    """Загрузить модель эмбеддингов с нужным бэкендом (без кэширования).
+
+    torch — исходная модель на PyTorch; onnx — ONNX Runtime (fp32);
+    onnx-int8 — ONNX Runtime с динамической int8-квантизацией. ONNX-версии
+    экспортируются один раз и кэшируются в MODELS_CACHE/onnx.
+    """
+    s = Settings()
+    backend = (backend or s.emb_backend or "torch").lower()
+    if backend == "torch":
+        model = SentenceTransformer(
+            s.emb_model_name, cache_folder=s.models_cache, device=s.emb_device
+        )
+    else:
+        export_dir = _ensure_onnx_export(s)
+        kwargs = {}
+        if backend == "onnx-int8":
+            kwargs["model_kwargs"] = {"file_name": _ensure_quantized(s, export_dir)}
+        model = SentenceTransformer(export_dir, device=s.emb_device, backend="onnx", **kwargs)
+    model.max_seq_length = s.emb_max_seq
+    return model
+
+
 def get_embedder() -> SentenceTransformer:
     global _model
     if _model is None:
-        s = Settings()
-        _model = SentenceTransformer(s.emb_model_name, cache_folder=s.models_cache, device=s.emb_device)
-        _model.max_seq_length = s.emb_max_seq
+        _model = load_embedder()
     return _model
 
-def embed_texts(texts: list[str]) -> list[list[float]]:
+
+def embed_texts(texts: list[str], batch_size: int | None = None) -> list[list[float]]:
     m = get_embedder()
-    embs = m.encode(texts, normalize_embeddings=True, show_progress_bar=False)
+    bs = batch_size or Settings().emb_batch_size
+    embs = m.encode(texts, batch_size=bs, normalize_embeddings=True, show_progress_bar=False)
     return [e.tolist() for e in embs]
+
+
+def embed_query(text: str) -> list[float]:
+    return embed_texts([text])[0]
@@ -1,4 +1,4 @@
-import logging, sys
+import json, logging, sys
 
 def setup_logging(level: int = logging.INFO) -> None:
     handler = logging.StreamHandler(stream=sys.stdout)
@@ -8,3 +8,8 @@ def setup_logging(level: int = logging.INFO) -> None:
     handler.setFormatter(fmt)
     root.handlers.clear()
     root.addHandler(handler)
+
+def log_event(logger: logging.Logger, event: str, level: int = logging.INFO, **fields) -> None:
+    """Структурированная строка: сообщение — JSON с полем event (удобно для grep/jq)."""
+    if logger.isEnabledFor(level):
+        logger.log(level, json.dumps({"event": event, **fields}, ensure_ascii=False, default=str))
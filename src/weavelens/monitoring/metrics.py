@@ -1,5 +1,101 @@
-from prometheus_client import Counter, Histogram
+import os
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
 
 REQS = Counter("weavelens_requests_total", "Requests", ["route"])
 LAT = Histogram("weavelens_latency_seconds", "Latency", ["route"])
 HITK = Histogram("weavelens_hit_at_k", "Hit@k", ["route"], buckets=(1,3,5,8,10,20))
+
+INTENT_STAGE = Counter(
+    "weavelens_intent_decisions_total", "Which /bot/intent stage decided", ["stage", "action"]
+)
+INTENT_LAT = Histogram(
+    "weavelens_intent_latency_seconds", "/bot/intent latency by deciding stage", ["stage"],
+    buckets=(0.0005, 0.005, 0.05, 0.25, 1, 2.5, 5, 10, 30),
+)
+
+# livesum: при нескольких воркерах (PROMETHEUS_MULTIPROC_DIR) — сумма по живым процессам
+LLM_QUEUE = Gauge(
+    "weavelens_llm_queue_depth", "LLM requests waiting for a slot", multiprocess_mode="livesum"
+)
+LLM_ACTIVE = Gauge(
+    "weavelens_llm_active", "LLM generations in progress", multiprocess_mode="livesum"
+)
+LLM_WAIT = Histogram(
+    "weavelens_llm_wait_seconds", "Time waiting for an LLM slot", ["kind"],
+    buckets=(0.001, 0.01, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+LLM_REJECTED = Counter(
+    "weavelens_llm_rejected_total", "LLM requests rejected by the scheduler", ["reason"]
+)
+LLM_GEN = Histogram(
+    "weavelens_llm_generation_seconds", "LLM generation time while holding a slot", ["kind"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120),
+)
+LLM_TPS = Histogram(
+    "weavelens_llm_tokens_per_second", "LLM decode speed reported by Ollama", ["kind"],
+    buckets=(1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 150),
+)
+
+ANSWER_CACHE = Counter("weavelens_answer_cache_total", "/ask answer cache lookups", ["result"])
+
+EMB_CACHE = Counter("weavelens_embed_cache_total", "Query embedding cache lookups", ["result"])
+EMB_BATCH = Histogram(
+    "weavelens_embed_batch_size", "Query embedding micro-batch size",
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+EMB_LAT = Histogram(
+    "weavelens_embed_seconds", "Embedding encode call time", ["kind"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+SEARCH_LAT = Histogram(
+    "weavelens_search_seconds", "Weaviate query time by search mode", ["mode"],
+    buckets=(0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+WV_BATCH = Histogram(
+    "weavelens_weaviate_batch_seconds", "Weaviate batch write call latency",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+
+# Ингест: в пуле процессов (INGEST_WORKERS/OCR_WORKERS > 0) значения из
+# дочерних процессов видны только в режиме PROMETHEUS_MULTIPROC_DIR
+EXTRACT_LAT = Histogram(
+    "weavelens_extract_seconds", "Text extraction and chunking time per file", ["ext"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+OCR_PAGE = Histogram(
+    "weavelens_ocr_page_seconds", "Tesseract time per page or image",
+    buckets=(0.1, 0.25, 0.5, 1, 2, 3, 5, 10, 20, 60),
+)
+
+
+def render_latest() -> tuple[bytes, str]:
+    """Текст метрик для /metrics.
+
+    С PROMETHEUS_MULTIPROC_DIR (gunicorn с несколькими воркерами) метрики
+    собираются по файлам всех процессов, иначе — из реестра текущего.
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: int) -> None:
+    """Хук gunicorn child_exit: убрать live-gauge завершившегося воркера."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,59 @@
+from __future__ import annotations
+import contextlib
+import logging
+import time
+from typing import Any, ContextManager, Dict, Optional
+
+from weavelens.monitoring.logging import log_event
+
+logger = logging.getLogger("weavelens.profile")
+
+# общий пустой контекст: при выключенном профилировании этапы ничего не стоят
+_NULL = contextlib.nullcontext()
+
+
+class RequestProfile:
+    """Разбивка времени одного запроса по этапам (debug: true или X-Debug-Timings).
+
+    stages_ms — длительности этапов, marks_ms — моменты от начала запроса
+    (например, первый токен LLM), info — размеры и счётчики.
+    """
+
+    def __init__(self, route: str) -> None:
+        self.route = route
+        self.t0 = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.marks: Dict[str, float] = {}
+        self.info: Dict[str, Any] = {}
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t)
+
+    def add(self, name: str, seconds: float) -> None:
+        self.stages[name] = round(self.stages.get(name, 0.0) + seconds * 1000, 1)
+
+    def mark(self, name: str) -> None:
+        self.marks.setdefault(name, round((time.perf_counter() - self.t0) * 1000, 1))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "total_ms": round((time.perf_counter() - self.t0) * 1000, 1),
+            "stages_ms": dict(self.stages),
+            "marks_ms": dict(self.marks),
+            **self.info,
+        }
+
+    def finish(self) -> Dict[str, Any]:
+        """Итог для ответа; заодно пишет одну структурированную строку в лог."""
+        out = self.to_dict()
+        log_event(logger, "request_timings", route=self.route, **out)
+        return out
+
+
+def stage(profile: Optional[RequestProfile], name: str) -> ContextManager[None]:
+    return profile.stage(name) if profile is not None else _NULL
@@ -1,9 +1,15 @@
 
 from __future__ import annotations
-import os, hashlib
-from typing import List, Tuple, Dict, Any
+import codecs, contextlib, os, hashlib, re, threading, time
+import multiprocessing as mp
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 from weavelens.settings import get_settings
 from weavelens.db import weaviate_client as wv
+from weavelens.monitoring.metrics import EMB_LAT, EXTRACT_LAT, OCR_PAGE
+from weavelens.pipeline.manifest import Entry, Manifest
 from pypdf import PdfReader
 from docx import Document as DocxDocument
 settings = get_settings()
@@ -11,143 +17,422 @@ settings = get_settings()
 
 SUPPORTED = {".txt", ".md", ".pdf", ".docx", ".png", ".jpg", ".jpeg"}
 
+_NON_WS = re.compile(r"\S")
+
 def sha256_bytes(data: bytes) -> str:
     h = hashlib.sha256()
     h.update(data)
     return h.hexdigest()
 
-def read_text_from_path(path: str) -> str:
-    ext = os.path.splitext(path)[1].lower()
-    if ext in (".txt", ".md"):
-        with open(path, "rb") as f:
-            return f.read().decode("utf-8", errors="ignore")
-    if ext == ".pdf":
-        # Перестраховываемся: гибридно по страницам. Сначала извлекаем текст из слоя PDF.
-        # Для страниц, где текста нет/очень мало, делаем OCR этой страницы.
-        page_texts: List[str] = []
-        num_pages = 0
+def sha256_file(path: str, buf_size: int = 1024 * 1024) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(buf_size)
+            if not data:
+                break
+            h.update(data)
+    return h.hexdigest()
+
+
+def _ocr_image(img: Any, lang: str) -> str:
+    import pytesseract
+    t0 = time.perf_counter()
+    try:
+        t = pytesseract.image_to_string(img, lang=lang)
+    except Exception:
+        t = pytesseract.image_to_string(img, lang="eng")
+    OCR_PAGE.observe(time.perf_counter() - t0)
+    return (t or "").strip()
+
+
+def _ocr_doc_page(doc: Any, index: int, zoom: float, lang: str) -> str:
+    import fitz  # PyMuPDF
+    from PIL import Image
+    page = doc.load_page(index)
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+    mode = "RGB" if pix.alpha == 0 else "RGBA"
+    img = Image.frombytes(mode, [pix.width, pix.height], pix.samples)
+    return _ocr_image(img, lang)
+
+
+def _ocr_pdf_page(path: str, index: int, zoom: float, lang: str) -> str:
+    """OCR одной страницы PDF (выполняется в пуле процессов)."""
+    import fitz  # PyMuPDF
+    with fitz.open(path) as doc:
+        return _ocr_doc_page(doc, index, zoom, lang)
+
+
+def _ocr_cache_path(sha: str, index: int, zoom: float, lang: str) -> str:
+    key = f"p{index:05d}_z{zoom:g}_{lang.replace('+', '-')}.txt"
+    return os.path.join(settings.data_processed, "ocr_cache", sha[:2], sha, key)
+
+
+def _ocr_cache_get(sha: Optional[str], index: int, zoom: float, lang: str) -> Optional[str]:
+    # скан передаёт sha всегда, так что выключатель проверяется здесь
+    if not sha or not settings.ocr_cache_enabled:
+        return None
+    try:
+        with open(_ocr_cache_path(sha, index, zoom, lang), encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _ocr_cache_put(sha: Optional[str], index: int, zoom: float, lang: str, text: str) -> None:
+    if not sha or not settings.ocr_cache_enabled:
+        return
+    dst = _ocr_cache_path(sha, index, zoom, lang)
+    try:
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        tmp = f"{dst}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, dst)
+    except OSError:
+        pass
+
+
+def _ocr_params() -> Tuple[float, str]:
+    zoom = float(getattr(settings, "ocr_pdf_zoom", 2.0) or 2.0)
+    lang = (getattr(settings, "ocr_langs", "rus+eng") or "eng").strip()
+    return zoom, lang
+
+
+def _ocr_submit(
+    pool: ProcessPoolExecutor,
+    path: str,
+    indices: List[int],
+    sha: Optional[str],
+    deadline: Optional[float] = None,
+) -> Tuple[Dict[int, str], Dict[Future, int]]:
+    """Поставить в пул OCR страниц, которых нет в кэше: (из кэша, futures).
+
+    После deadline новые страницы не ставятся — только кэш.
+    """
+    zoom, lang = _ocr_params()
+    expired = deadline is not None and time.monotonic() > deadline
+    out: Dict[int, str] = {}
+    futs: Dict[Future, int] = {}
+    for i in indices:
+        cached = _ocr_cache_get(sha, i, zoom, lang)
+        if cached is None:
+            if not expired:
+                futs[pool.submit(_ocr_pdf_page, path, i, zoom, lang)] = i
+        else:
+            out[i] = cached
+    return out, futs
+
+
+def _ocr_collect(
+    futs: Dict[Future, int], out: Dict[int, str], sha: Optional[str], deadline: Optional[float]
+) -> Dict[int, str]:
+    """Дождаться OCR страниц до deadline; не успевшие снимаются с очереди."""
+    zoom, lang = _ocr_params()
+    if futs:
+        remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+        done, not_done = wait(list(futs), timeout=remaining)
+        for fut in not_done:
+            fut.cancel()
+        for fut in done:
+            i = futs[fut]
+            try:
+                out[i] = fut.result()
+            except Exception:
+                continue
+            _ocr_cache_put(sha, i, zoom, lang, out[i])
+    return out
+
+
+def _ocr_pdf_pages(
+    path: str,
+    indices: List[int],
+    sha: Optional[str] = None,
+    deadline: Optional[float] = None,
+    pool: Optional[ProcessPoolExecutor] = None,
+) -> Dict[int, str]:
+    """OCR выбранных страниц PDF.
+
+    Результаты кэшируются на диске (DATA_PROCESSED/ocr_cache) по ключу
+    sha256 файла + страница + zoom + языки, так что повторный ингест того же
+    файла OCR не запускает. При OCR_WORKERS > 1 страницы распознаются
+    параллельно в отдельных процессах (в ``pool``, если он передан).
+    ``deadline`` (time.monotonic) — бюджет времени на документ: страницы,
+    не успевшие к сроку, пропускаются.
+    """
+    zoom, lang = _ocr_params()
+    workers = int(settings.ocr_workers or 0)
+    if workers > 1 or pool is not None:
+        own = pool is None
+        pool = pool or _new_pool(min(workers, len(indices)) or 1)
         try:
-            reader = PdfReader(path)
-            num_pages = len(reader.pages)
-            for page in reader.pages:
-                t = (page.extract_text() or "").strip()
-                page_texts.append(t)
-        except Exception:
-            page_texts = []
-            num_pages = 0
+            out, futs = _ocr_submit(pool, path, indices, sha, deadline)
+            return _ocr_collect(futs, out, sha, deadline)
+        finally:
+            if own:
+                _kill_pool(pool)
 
-        needs_ocr_indices: List[int] = []
-        # Минимальная длина текста страницы, ниже которой считаем, что нужен OCR
-        min_len = int(getattr(settings, "ocr_min_page_text_len", 20) or 20)
-        if page_texts and any(not t or len(t) < min_len for t in page_texts):
-            needs_ocr_indices = [i for i, t in enumerate(page_texts) if not t or len(t) < min_len]
-        elif not page_texts:
-            # Если вообще не удалось прочитать текст — OCR для всех страниц
-            needs_ocr_indices = list(range(num_pages)) if num_pages > 0 else []
+    out: Dict[int, str] = {}
+    todo: List[int] = []
+    for i in indices:
+        cached = _ocr_cache_get(sha, i, zoom, lang)
+        if cached is None:
+            todo.append(i)
+        else:
+            out[i] = cached
+    if not todo:
+        return out
 
-        if needs_ocr_indices:
+    import fitz  # PyMuPDF
+    with fitz.open(path) as doc:
+        for i in todo:
+            if deadline is not None and time.monotonic() > deadline:
+                break
             try:
-                import fitz  # PyMuPDF
-                from PIL import Image
-                import pytesseract
+                out[i] = _ocr_doc_page(doc, i, zoom, lang)
             except Exception:
-                # Нет OCR-зависимостей — вернём только то, что смогли достать (если что-то есть)
-                return "\n\n".join([t for t in page_texts if t])
+                continue
+            _ocr_cache_put(sha, i, zoom, lang, out[i])
+    return out
+
+
+def _ocr_available() -> bool:
+    try:
+        import fitz  # noqa: F401  PyMuPDF
+        from PIL import Image  # noqa: F401
+        import pytesseract  # noqa: F401
+    except Exception:
+        return False
+    return True
+
+
+def _iter_pdf_pages(path: str, sha: Optional[str] = None) -> Iterator[str]:
+    """Текст PDF постранично: слой текста, для «пустых» страниц — OCR.
+
+    Страницы обрабатываются окнами; в памяти — тексты не больше двух окон.
+    При OCR_WORKERS > 1 на документ создаётся один пул, и OCR следующего окна
+    ставится в него, пока ожидается текущее. ``sha`` — sha256 файла для кэша
+    OCR (обычно уже посчитан при скане); без него считается лишь при первом OCR.
+    """
+    # Минимальная длина текста страницы, ниже которой считаем, что нужен OCR
+    min_len = int(getattr(settings, "ocr_min_page_text_len", 20) or 20)
+    ocr_ok = bool(getattr(settings, "ocr_enabled", True)) and _ocr_available()
+
+    with open(path, "rb") as fh:
+        # Файловый объект, а не путь: так pypdf не читает весь PDF в память
+        try:
+            reader: Optional[PdfReader] = PdfReader(fh)
+            num_pages = len(reader.pages)
+        except Exception:
+            reader = None
+            num_pages = 0
+        if reader is None:
+            # Слой текста не прочитался — OCR для всех страниц (если есть чем)
+            if not ocr_ok:
+                return
             try:
-                doc = fitz.open(path)
-                zoom = float(getattr(settings, "ocr_pdf_zoom", 2.0) or 2.0)
-                mat = fitz.Matrix(zoom, zoom)
-                # Если num_pages не был установлен, возьмём из doc
-                if num_pages == 0:
+                import fitz  # PyMuPDF
+                with fitz.open(path) as doc:
                     num_pages = doc.page_count
-                    page_texts = [""] * num_pages
-                    needs_ocr_indices = list(range(num_pages))
-                for i in needs_ocr_indices:
+            except Exception:
+                return
+
+        budget = float(settings.ocr_doc_timeout or 0)
+        deadline = time.monotonic() + budget if budget > 0 else None
+        workers = int(settings.ocr_workers or 0)
+        window = max(8, workers * 4)
+        pool: Optional[ProcessPoolExecutor] = None
+        # окна в работе: (страницы, тексты слоя, OCR из кэша, futures OCR)
+        pending: deque = deque()
+
+        def _finish(idx: range, texts: Dict[int, str], ocr_texts: Dict[int, str]) -> Iterator[str]:
+            for i, t in ocr_texts.items():
+                if t:
+                    # Если ранее был какой-то текст, добавим OCR с разделителем
+                    texts[i] = (texts[i].rstrip() + "\n\n" + t) if texts[i] else t
+            for i in idx:
+                if texts[i]:
+                    yield texts[i]
+
+        def _drain(keep: int) -> Iterator[str]:
+            while len(pending) > keep:
+                idx, texts, cached, futs = pending.popleft()
+                try:
+                    ocr_texts = _ocr_collect(futs, cached, sha, deadline)
+                except Exception:
+                    ocr_texts = cached
+                yield from _finish(idx, texts, ocr_texts)
+
+        def _pages() -> Iterator[str]:
+            nonlocal sha, pool
+            for start in range(0, num_pages, window):
+                idx = range(start, min(num_pages, start + window))
+                texts: Dict[int, str] = {}
+                for i in idx:
                     try:
-                        page = doc.load_page(i)
-                        pix = page.get_pixmap(matrix=mat)
-                        mode = "RGB" if pix.alpha == 0 else "RGBA"
-                        img = Image.frombytes(mode, [pix.width, pix.height], pix.samples)
-                        if getattr(settings, "ocr_enabled", True):
-                            lang = (getattr(settings, "ocr_langs", "rus+eng") or "eng").strip()
-                            try:
-                                t = pytesseract.image_to_string(img, lang=lang)
-                            except Exception:
-                                t = pytesseract.image_to_string(img, lang="eng")
-                        else:
-                            t = ""
-                        t = (t or "").strip()
-                        if t:
-                            # Если ранее был какой-то текст, добавим OCR с разделителем, чтобы не дублировать вплотную
-                            if i < len(page_texts) and page_texts[i]:
-                                page_texts[i] = (page_texts[i].rstrip() + "\n\n" + t)
-                            elif i < len(page_texts):
-                                page_texts[i] = t
-                            else:
-                                # Защита на случай рассинхрона длин
-                                page_texts.append(t)
+                        texts[i] = (reader.pages[i].extract_text() or "").strip() if reader else ""
                     except Exception:
+                        texts[i] = ""
+                need = [i for i in idx if not texts[i] or len(texts[i]) < min_len]
+                if need and ocr_ok:
+                    if sha is None and settings.ocr_cache_enabled:
+                        sha = sha256_file(path)
+                    if workers > 1:
+                        try:
+                            pool = pool or _new_pool(workers)
+                            submitted = _ocr_submit(pool, path, need, sha, deadline)
+                            pending.append((idx, texts, *submitted))
+                        except Exception:
+                            pending.append((idx, texts, {}, {}))
+                        # одно окно OCR распознаётся, пока извлекается следующее
+                        yield from _drain(1)
                         continue
-            except Exception:
-                # Любая ошибка OCR — вернём то, что было
-                return "\n\n".join([t for t in page_texts if t])
+                    try:
+                        ocr_texts = _ocr_pdf_pages(path, need, sha=sha, deadline=deadline)
+                    except Exception:
+                        # Ошибка OCR — оставляем то, что было в слое текста
+                        ocr_texts = {}
+                    yield from _drain(0)
+                    yield from _finish(idx, texts, ocr_texts)
+                    continue
+                pending.append((idx, texts, {}, {}))
+                yield from _drain(1 if pool is not None else 0)
+            yield from _drain(0)
+
+        try:
+            first = True
+            for text in _pages():
+                yield text if first else "\n\n" + text
+                first = False
+        finally:
+            if pool is not None:
+                _kill_pool(pool)
+
 
-        # Если вообще ничего не извлекли — вернуть пусто
-        joined = "\n\n".join([t for t in page_texts if t]).strip()
-        return joined
+def iter_text_from_path(
+    path: str, block_size: int = 1024 * 1024, sha: Optional[str] = None
+) -> Iterator[str]:
+    """Текст файла кусками (блоки txt/md, страницы PDF, абзацы DOCX).
+
+    Конкатенация кусков совпадает с read_text_from_path; память — на кусок.
+    ``sha`` — уже известный sha256 файла (ключ кэша OCR для PDF).
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".txt", ".md"):
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+        with open(path, "rb") as f:
+            while True:
+                data = f.read(block_size)
+                if not data:
+                    break
+                text = decoder.decode(data)
+                if text:
+                    yield text
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            yield tail
+        return
+    if ext == ".pdf":
+        # Перестраховываемся: гибридно по страницам. Сначала извлекаем текст из слоя PDF.
+        # Для страниц, где текста нет/очень мало, делаем OCR этой страницы.
+        yield from _iter_pdf_pages(path, sha)
+        return
     if ext == ".docx":
         doc = DocxDocument(path)
-        return "\n".join(p.text for p in doc.paragraphs)
+        for n, p in enumerate(doc.paragraphs):
+            yield p.text if n == 0 else "\n" + p.text
+        return
     if ext in (".png", ".jpg", ".jpeg"):
-        # Lazy import to keep optional dependency
-        try:
-            from PIL import Image, ImageOps
-            import pytesseract
-        except Exception:
-            return ""
-        try:
-            img = Image.open(path)
-            # Respect EXIF orientation
-            img = ImageOps.exif_transpose(img)
-            # Simple normalization can help OCR on screenshots
-            if img.mode not in ("L", "RGB"):
-                img = img.convert("RGB")
-            # Try Russian+English first, then fallback to English
-            if getattr(settings, "ocr_enabled", True):
-                lang = (getattr(settings, "ocr_langs", "rus+eng") or "eng").strip()
-                try:
-                    text = pytesseract.image_to_string(img, lang=lang)
-                except Exception:
-                    text = pytesseract.image_to_string(img, lang="eng")
-            else:
-                text = ""
-            return (text or "").strip()
-        except Exception:
-            return ""
-    return ""
+        text = _read_image_text(path)
+        if text:
+            yield text
+
+
+def _read_image_text(path: str) -> str:
+    # Lazy import to keep optional dependency
+    try:
+        from PIL import Image, ImageOps
+        import pytesseract
+    except Exception:
+        return ""
+    try:
+        img = Image.open(path)
+        # Respect EXIF orientation
+        img = ImageOps.exif_transpose(img)
+        # Simple normalization can help OCR on screenshots
+        if img.mode not in ("L", "RGB"):
+            img = img.convert("RGB")
+        # Try Russian+English first, then fallback to English
+        if getattr(settings, "ocr_enabled", True):
+            lang = (getattr(settings, "ocr_langs", "rus+eng") or "eng").strip()
+            return _ocr_image(img, lang)
+        return ""
+    except Exception:
+        return ""
+
+
+def read_text_from_path(path: str, sha: Optional[str] = None) -> str:
+    return "".join(iter_text_from_path(path, sha=sha))
+
+
+def iter_chunk_text(
+    pieces: Iterable[str], chunk_chars: int = 1200, overlap: int = 200
+) -> Iterator[str]:
+    """Потоковый вариант chunk_text: принимает текст кусками.
+
+    Результат совпадает с chunk_text("".join(pieces)), но в памяти держится
+    только хвост текущего окна, а не весь документ.
+    """
+    step = chunk_chars - overlap
+    buf = ""
+    started = False
+    for piece in pieces:
+        if not started:
+            piece = piece.lstrip()
+            if not piece:
+                continue
+            started = True
+        buf += piece
+        pos = 0
+        # Режем, только если за окном есть непробельный текст: иначе это
+        # может оказаться хвост, который chunk_text срезал бы strip()
+        while len(buf) - pos > chunk_chars and _NON_WS.search(buf, pos + chunk_chars):
+            yield buf[pos:pos + chunk_chars]
+            pos += step
+        if pos:
+            buf = buf[pos:]
+    buf = buf.rstrip()
+    pos = 0
+    while len(buf) - pos > chunk_chars:
+        yield buf[pos:pos + chunk_chars]
+        pos += step
+    if buf[pos:]:
+        yield buf[pos:]
+
 
 def chunk_text(text: str, chunk_chars: int = 1200, overlap: int = 200) -> List[str]:
-    text = text.strip()
-    if not text:
-        return []
-    chunks = []
-    i = 0
-    n = len(text)
-    while i < n:
-        end = min(n, i + chunk_chars)
-        chunks.append(text[i:end])
-        if end == n:
-            break
-        i = end - overlap
-        if i < 0:
-            i = 0
-    return chunks
+    return list(iter_chunk_text([text], chunk_chars, overlap))
 
-def scan_and_index(paths: List[str]) -> Dict[str, Any]:
-    files_processed = 0
-    chunks_total = 0
-    skipped = 0
 
+def _extract_chunks(path: str, sha: Optional[str] = None) -> List[str]:
+    """Извлечение текста и разбиение на чанки (выполняется в пуле процессов)."""
+    return chunk_text(read_text_from_path(path, sha))
+
+
+def _extract_timed(path: str, sha: Optional[str] = None) -> Tuple[List[str], float]:
+    """_extract_chunks + его длительность: время меряется там, где идёт работа,
+    без ожидания в очереди пула."""
+    t0 = time.perf_counter()
+    chunks = _extract_chunks(path, sha)
+    return chunks, time.perf_counter() - t0
+
+
+def _observe_extract(path: str, seconds: float) -> None:
+    ext = os.path.splitext(path)[1].lower() or "none"
+    EXTRACT_LAT.labels(ext=ext).observe(seconds)
+
+
+def _collect_files(paths: List[str]) -> List[str]:
     seen = set()
     for p in paths:
         if not p:
@@ -164,34 +449,591 @@ def scan_and_index(paths: List[str]) -> Dict[str, Any]:
         else:
             if os.path.splitext(p)[1].lower() in SUPPORTED:
                 seen.add(p)
+    return sorted(seen)
+
+
+def _new_pool(workers: int) -> ProcessPoolExecutor:
+    # spawn, а не fork: в родителе уже может быть открыт gRPC-канал Weaviate
+    return ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"))
+
+
+def _kill_pool(pool: ProcessPoolExecutor) -> None:
+    """Жёстко останавливаем пул, чтобы зависший воркер не держал сканирование."""
+    procs = list((getattr(pool, "_processes", None) or {}).values())
+    pool.shutdown(wait=False, cancel_futures=True)
+    for proc in procs:
+        try:
+            proc.terminate()
+        except Exception:
+            pass
+
+
+class ExtractPool:
+    """Пул процессов извлечения, переживающий несколько сканов.
+
+    watcher индексирует маленькие пачки файлов; без общего пула каждая
+    пачка платила бы за запуск spawn-процессов заново.
+    """
+
+    def __init__(self, workers: Optional[int] = None) -> None:
+        self.workers = int(settings.ingest_workers or 0) if workers is None else workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def get(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = _new_pool(self.workers)
+        return self._pool
+
+    def reset(self) -> None:
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            _kill_pool(pool)
+
+    close = reset
+
+
+def _iter_extracted(
+    files: List[str],
+    hashes: Optional[Dict[str, str]] = None,
+    shared: Optional[ExtractPool] = None,
+) -> Iterator[Tuple[str, Optional[List[str]], Optional[str]]]:
+    """Отдаёт (path, chunks, error) по мере готовности.
+
+    ``hashes`` — уже посчитанные sha256 файлов (ключ кэша OCR); ``shared`` —
+    пул, который живёт дольше одного скана (иначе пул создаётся на скан).
+
+    Извлечение идёт в пуле из INGEST_WORKERS процессов; одновременно в обработке
+    не больше INGEST_QUEUE_DEPTH файлов. Файл, превысивший INGEST_FILE_TIMEOUT
+    (считая с момента, когда до него дошла очередь пула), отбрасывается, а пул
+    пересоздаётся. Если воркер упал (BrokenProcessPool),
+    затронутые файлы перезапускаются один раз.
+    """
+    hashes = hashes or {}
+    workers = int(settings.ingest_workers or 0)
+    if workers <= 0:
+        for fp in files:
+            try:
+                chunks, seconds = _extract_timed(fp, hashes.get(fp))
+            except Exception as e:
+                yield fp, None, str(e)
+                continue
+            _observe_extract(fp, seconds)
+            yield fp, chunks, None
+        return
+
+    depth = max(workers, int(settings.ingest_queue_depth or 0) or workers * 2)
+    timeout = float(settings.ingest_file_timeout or 0)
+    pending = deque((fp, 0) for fp in files)
+    # future -> (path, попытка, момент, когда файл мог попасть к воркеру)
+    in_flight: Dict[Future, Tuple[str, int, Optional[float]]] = {}
+    holder = shared if shared is not None and shared.workers == workers else ExtractPool(workers)
+    pool = holder.get()
+
+    def _resubmit_all() -> None:
+        for fp, attempt, _ in in_flight.values():
+            pending.appendleft((fp, attempt))
+        in_flight.clear()
+
+    try:
+        while pending or in_flight:
+            while pending and len(in_flight) < depth:
+                fp, attempt = pending.popleft()
+                in_flight[pool.submit(_extract_timed, fp, hashes.get(fp))] = (fp, attempt, None)
+
+            done, _ = wait(list(in_flight), timeout=1.0, return_when=FIRST_COMPLETED)
+            broken: List[Tuple[str, int]] = []
+            for fut in done:
+                fp, attempt, _ = in_flight.pop(fut)
+                try:
+                    chunks, seconds = fut.result()
+                except BrokenProcessPool:
+                    broken.append((fp, attempt))
+                    continue
+                except Exception as e:
+                    yield fp, None, str(e)
+                    continue
+                _observe_extract(fp, seconds)
+                yield fp, chunks, None
+
+            if broken:
+                # Упавший воркер ломает весь пул: пересоздаём и повторяем один раз
+                holder.reset()
+                for fp, attempt in broken:
+                    if attempt >= 1:
+                        yield fp, None, "worker process crashed"
+                    else:
+                        pending.append((fp, attempt + 1))
+                _resubmit_all()
+                pool = holder.get()
+                continue
+
+            if timeout > 0:
+                # Пул берёт файлы по порядку отправки: выполняются не больше workers
+                # самых ранних, остальные ждут в очереди — их часы ещё не идут
+                now = time.monotonic()
+                for fut in list(in_flight)[:workers]:
+                    fp, attempt, t0 = in_flight[fut]
+                    if t0 is None:
+                        in_flight[fut] = (fp, attempt, now)
+                expired = [
+                    f
+                    for f, (_, _, t0) in in_flight.items()
+                    if t0 is not None and now - t0 > timeout
+                ]
+                if expired:
+                    for fut in expired:
+                        fp, _, _ = in_flight.pop(fut)
+                        yield fp, None, f"extraction timed out after {timeout:g}s"
+                    holder.reset()
+                    _resubmit_all()
+                    pool = holder.get()
+    finally:
+        # общий пул оставляем, если в нём не осталось задач (скан не прерван)
+        if holder is not shared or in_flight:
+            holder.reset()
+
+
+def _stream_threshold() -> int:
+    """Размер файла (байт), начиная с которого он индексируется потоково.
+
+    Результат пула — полный список чанков файла, и в полёте может быть до
+    INGEST_QUEUE_DEPTH файлов; делим INGEST_MEMORY_BUDGET_MB между ними.
+    """
+    budget = int(settings.ingest_memory_budget_mb or 0) * 1024 * 1024
+    if budget <= 0:
+        return 1 << 62
+    workers = int(settings.ingest_workers or 0)
+    depth = max(workers, int(settings.ingest_queue_depth or 0) or workers * 2, 1)
+    return budget // depth
+
 
-    for fp in sorted(seen):
+def _batched(items: Iterable[str], size: int) -> Iterator[List[str]]:
+    batch: List[str] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _embedder() -> Optional[Callable[..., List[List[float]]]]:
+    """embed_texts, если векторизация включена и sentence-transformers доступен."""
+    if not settings.emb_index_enabled:
+        return None
+    try:
+        from weavelens.models.embeddings import embed_texts
+    except Exception:
+        return None
+    return embed_texts
+
+
+def _embed_chunks(
+    chunks: List[str], fp: str, errors: List[Dict[str, Any]], stats: Dict[str, float]
+) -> Optional[List[List[float]]]:
+    embed = _embedder()
+    if embed is None or not chunks:
+        return None
+    t0 = time.perf_counter()
+    try:
+        vectors = embed(chunks)
+    except Exception as e:
+        # Чанки всё равно пишем (BM25 работает), векторы досчитает backfill
+        errors.append({"path": fp, "error": f"embedding failed: {e}"})
+        return None
+    elapsed = time.perf_counter() - t0
+    EMB_LAT.labels(kind="index").observe(elapsed)
+    stats["embedded"] += len(chunks)
+    stats["embed_s"] += elapsed
+    return vectors
+
+
+def _write_chunks(
+    doc_uuid: str,
+    fp: str,
+    title: str,
+    chunks: List[str],
+    errors: List[Dict[str, Any]],
+    stats: Dict[str, float],
+    start: int = 0,
+) -> int:
+    """Записать чанки; если часть не записалась — RuntimeError (файл надо переиндексировать)."""
+    vectors = _embed_chunks(chunks, fp, errors, stats)
+    failed: List[Dict[str, Any]] = []
+    cnt = wv.add_chunks(doc_uuid, fp, title, chunks, errors=failed, start=start, vectors=vectors)
+    errors.extend({"path": fp, **e} for e in failed)
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {len(chunks)} chunks not written")
+    return cnt
+
+
+def _drop_document(sha: str, fp: str, errors: List[Dict[str, Any]]) -> None:
+    """Убрать недописанный документ: иначе следующий скан пропустит файл по sha256."""
+    try:
+        wv.delete_document(sha)
+    except Exception as e:
+        errors.append({"path": fp, "error": f"cleanup failed: {e}"})
+
+
+def _index_streaming(
+    fp: str, sha: str, errors: List[Dict[str, Any]], stats: Dict[str, float]
+) -> Optional[int]:
+    """Индексирует файл потоково: страницы -> чанки -> батчи записи.
+
+    Пиковая память — один батч чанков, а не весь текст файла.
+    Возвращает число записанных чанков или None, если текста нет.
+    """
+    title = os.path.basename(fp)
+    size = int(settings.weaviate_batch_size or 0) or 200
+    doc_uuid = None
+    order = 0
+    written = 0
+    try:
+        for batch in _batched(iter_chunk_text(iter_text_from_path(fp, sha=sha)), size):
+            if doc_uuid is None:
+                doc_uuid = wv.upsert_document(fp, sha, title, os.path.getsize(fp))
+            written += _write_chunks(doc_uuid, fp, title, batch, errors, stats, start=order)
+            order += len(batch)
+    except Exception:
+        if doc_uuid is not None:
+            _drop_document(sha, fp, errors)
+        raise
+    return None if doc_uuid is None else written
+
+
+def _rate(n: float, seconds: float) -> float:
+    return round(n / seconds, 2) if seconds > 0 else 0.0
+
+
+def _open_manifest() -> Optional[Manifest]:
+    try:
+        return Manifest()
+    except Exception:
+        # Нет доступа к DATA_PROCESSED — работаем без манифеста (полный рехеш)
+        return None
+
+
+def scan_and_index(
+    paths: List[str],
+    progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+    cancel: Optional[threading.Event] = None,
+    *,
+    incremental: bool = False,
+    pool: Optional[ExtractPool] = None,
+) -> Dict[str, Any]:
+    """Скан + дедуп + извлечение + запись в Weaviate.
+
+    ``progress`` получает события {"type": "total", "files": n} и
+    {"type": "file", "path", "status", "chunks"[, "error"]} по каждому файлу.
+    Установленный ``cancel`` останавливает скан между файлами; удаление
+    пропавших файлов при этом не выполняется.
+
+    ``incremental`` — пачка изменённых файлов (watcher): вместо перечитывания
+    индекса всех документов дедуп идёт по кэшу и точечным запросам по sha256.
+    ``pool`` — общий пул извлечения между вызовами.
+    """
+
+    def _emit(**event: Any) -> None:
+        if progress is not None:
+            try:
+                progress(event)
+            except Exception:
+                pass
+
+    def _cancelled() -> bool:
+        return cancel is not None and cancel.is_set()
+
+    files_processed = 0
+    chunks_total = 0
+    skipped = 0
+    errors: List[Dict[str, Any]] = []
+    # Статус файлов относительно прошлого скана (по манифесту)
+    added = changed = unchanged = removed = renamed = 0
+    embed_stats: Dict[str, float] = {"embedded": 0, "embed_s": 0.0}
+
+    files = _collect_files(paths)
+    roots = [os.path.abspath(p) for p in paths if p and os.path.exists(p)]
+    manifest = _open_manifest()
+    previous: Dict[str, Entry] = manifest.under(roots) if manifest else {}
+    _emit(type="total", files=len(files))
+
+    # Дедуп по sha256 — в текущем процессе, в пул уходят только новые файлы.
+    # Полный скан грузит все известные sha256 одним проходом, дальше проверка
+    # локальная; пачке watcher'а дешевле спросить про свои несколько файлов.
+    if incremental:
+        def _known(sha: str) -> bool:
+            return wv.find_document_by_sha256(sha) is not None
+    else:
+        _known = wv.known_documents(refresh=True).__contains__
+    stream_threshold = _stream_threshold()
+    todo: List[str] = []
+    large: List[str] = []
+    hashes: Dict[str, str] = {}
+    queued = set()
+    new_paths: Dict[str, List[str]] = {}  # sha256 -> новые пути (кандидаты в переименования)
+    vacated: List[str] = []  # sha256 содержимого, которое было по изменённым путям
+    unreadable = set()  # stat/хеш не удались: файл есть, но его sha256 неизвестен
+    for fp in files:
+        if _cancelled():
+            break
         try:
-            with open(fp, "rb") as f:
-                data = f.read()
-            sha = sha256_bytes(data)
-            if wv.find_document_by_sha256(sha):
+            st = os.stat(fp)
+            row = previous.get(fp)
+            if row is not None and row.matches(st):
+                # stat не изменился — не перечитываем файл
+                sha = row.sha256
+            else:
+                sha = sha256_file(fp)
+            hashes[fp] = sha
+            if row is None:
+                added += 1
+                new_paths.setdefault(sha, []).append(fp)
+            elif row.sha256 != sha:
+                changed += 1
+                vacated.append(row.sha256)
+            else:
+                unchanged += 1
+            if manifest:
+                manifest.put(fp, st, sha)
+            if sha in queued or _known(sha):
                 skipped += 1
+                _emit(type="file", path=fp, status="unchanged", chunks=0)
                 continue
+            queued.add(sha)
+            if st.st_size > stream_threshold:
+                # Крупный файл: не гоняем список чанков через пул, читаем потоково
+                large.append(fp)
+            else:
+                todo.append(fp)
+        except Exception as e:
+            if fp not in hashes:
+                unreadable.add(fp)
+            skipped += 1
+            errors.append({"path": fp, "error": str(e)})
+            _emit(type="file", path=fp, status="error", chunks=0, error=str(e))
+
+    # Единственный писатель: батчами пишет в Weaviate то, что отдал пул
+    extracted = _iter_extracted(todo, hashes, pool)
+    for fp, ch, err in extracted:
+        if _cancelled():
+            extracted.close()
+            break
+        if err is not None:
+            skipped += 1
+            errors.append({"path": fp, "error": err})
+            _emit(type="file", path=fp, status="error", chunks=0, error=err)
+            continue
+        if not ch:
+            skipped += 1
+            _emit(type="file", path=fp, status="skipped", chunks=0)
+            continue
+        doc_uuid = None
+        try:
             title = os.path.basename(fp)
             size = os.path.getsize(fp)
-            text = read_text_from_path(fp)
-            ch = chunk_text(text)
-            if not ch:
-                skipped += 1
-                continue
-            doc_uuid = wv.upsert_document(fp, sha, title, size)
-            cnt = wv.add_chunks(doc_uuid, fp, title, ch)
+            doc_uuid = wv.upsert_document(fp, hashes[fp], title, size)
+            cnt = _write_chunks(doc_uuid, fp, title, ch, errors, embed_stats)
             files_processed += 1
             chunks_total += cnt
-        except Exception:
+            _emit(type="file", path=fp, status="indexed", chunks=cnt)
+        except Exception as e:
+            if doc_uuid is not None:
+                _drop_document(hashes[fp], fp, errors)
             skipped += 1
+            errors.append({"path": fp, "error": str(e)})
+            _emit(type="file", path=fp, status="error", chunks=0, error=str(e))
+
+    for fp in large:
+        if _cancelled():
+            break
+        try:
+            cnt = _index_streaming(fp, hashes[fp], errors, embed_stats)
+        except Exception as e:
+            skipped += 1
+            errors.append({"path": fp, "error": str(e)})
+            _emit(type="file", path=fp, status="error", chunks=0, error=str(e))
+            continue
+        if cnt is None:
+            skipped += 1
+            _emit(type="file", path=fp, status="skipped", chunks=0)
+            continue
+        files_processed += 1
+        chunks_total += cnt
+        _emit(type="file", path=fp, status="indexed", chunks=cnt)
+
+    # Пропавшие файлы: переименование (тот же sha256 по новому пути) — перенаправляем
+    # документ, иначе удаляем его из Weaviate, если содержимое больше нигде не лежит.
+    current = {sha: fp for fp, sha in hashes.items()}
+    if _cancelled():
+        # Скан прерван, список файлов неполный — ничего не удаляем и не переносим
+        previous, vacated = {}, []
+    for gone, row in previous.items():
+        # временная ошибка чтения — не повод удалять документ
+        if gone in hashes or gone in unreadable:
+            continue
+        try:
+            if new_paths.get(row.sha256):
+                target = new_paths[row.sha256].pop(0)
+                wv.repoint_document(row.sha256, target, os.path.basename(target))
+                renamed += 1
+                added -= 1
+            elif row.sha256 in current:
+                # Копия содержимого осталась по другому пути
+                target = current[row.sha256]
+                wv.repoint_document(row.sha256, target, os.path.basename(target))
+                removed += 1
+            else:
+                removed += 1
+                vacated.append(row.sha256)
+            if manifest:
+                manifest.delete(gone)
+        except Exception as e:
+            errors.append({"path": gone, "error": str(e)})
+    for sha in vacated:
+        if sha in current:
+            continue
+        try:
+            # Скан мог охватить не все пути (пачка watcher'а): то же содержимое
+            # может лежать в файле вне скана — тогда документ остаётся за ним
+            others = (
+                [e for e in manifest.by_sha256(sha) if os.path.exists(e.path)] if manifest else []
+            )
+            if others:
+                target = others[0].path
+                wv.repoint_document(sha, target, os.path.basename(target))
+            else:
+                wv.delete_document(sha)
+        except Exception as e:
+            errors.append({"sha256": sha, "error": str(e)})
+
+    if manifest:
+        manifest.commit()
+        manifest.close()
 
     return {
         "files_indexed": files_processed,
         "chunks_indexed": chunks_total,
         "skipped": skipped,
+        "errors": errors,
+        "added": added,
+        "changed": changed,
+        "removed": removed,
+        "renamed": renamed,
+        "unchanged": unchanged,
+        "cancelled": _cancelled(),
+        "embedded": int(embed_stats["embedded"]),
+        "embed_chunks_per_s": _rate(embed_stats["embedded"], embed_stats["embed_s"]),
         # legacy keys for bot
         "files": files_processed,
         "chunks": chunks_total,
     }
+
+
+def remove_paths(paths: Iterable[str]) -> Dict[str, Any]:
+    """Убрать из индекса удалённые файлы (или каталоги) по данным манифеста.
+
+    Если то же содержимое ещё лежит по другому пути — документ перенаправляется
+    туда (так обрабатывается переименование, пришедшее как delete + create).
+    """
+    removed = renamed = 0
+    errors: List[Dict[str, Any]] = []
+    manifest = _open_manifest()
+    if manifest is None:
+        return {"removed": 0, "renamed": 0, "errors": errors}
+    try:
+        gone = [e for e in manifest.under(paths).values() if not os.path.exists(e.path)]
+        for entry in gone:
+            manifest.delete(entry.path)
+        for entry in gone:
+            try:
+                others = manifest.by_sha256(entry.sha256)
+                if others:
+                    target = others[0].path
+                    wv.repoint_document(entry.sha256, target, os.path.basename(target))
+                    renamed += 1
+                else:
+                    wv.delete_document(entry.sha256)
+                    removed += 1
+            except Exception as e:
+                errors.append({"path": entry.path, "error": str(e)})
+        manifest.commit()
+    finally:
+        manifest.close()
+    return {"removed": removed, "renamed": renamed, "errors": errors}
+
+
+def backfill_vectors(page_size: Optional[int] = None, restart: bool = False) -> Dict[str, Any]:
+    """Досчитать векторы для уже проиндексированных чанков.
+
+    Идёт по коллекции страницами в порядке uuid; после каждой страницы
+    курсор сохраняется в DATA_PROCESSED/backfill_vectors.cursor, так что
+    прерванный backfill продолжается с места остановки.
+    """
+    from weavelens.models.embeddings import embed_texts
+
+    page_size = page_size or max(int(settings.emb_batch_size or 0) * 4, 64)
+    cursor_path = os.path.join(settings.data_processed, "backfill_vectors.cursor")
+    after: Optional[str] = None
+    if restart:
+        with contextlib.suppress(OSError):
+            os.remove(cursor_path)
+    else:
+        with contextlib.suppress(OSError):
+            with open(cursor_path, encoding="utf-8") as f:
+                after = f.read().strip() or None
+
+    scanned = vectorized = 0
+    embed_s = 0.0
+    errors: List[Dict[str, Any]] = []
+    t_start = time.perf_counter()
+    for page in wv.iter_chunk_pages(page_size, after):
+        missing = [(uid, props) for uid, props, has_vector in page if not has_vector]
+        if missing:
+            t0 = time.perf_counter()
+            vectors = embed_texts([props.get("text") or "" for _, props in missing])
+            embed_s += time.perf_counter() - t0
+            items = ((uid, props, vec) for (uid, props), vec in zip(missing, vectors))
+            vectorized += wv.set_chunk_vectors(items, errors)
+        scanned += len(page)
+        os.makedirs(os.path.dirname(cursor_path), exist_ok=True)
+        with open(cursor_path, "w", encoding="utf-8") as f:
+            f.write(page[-1][0])
+    with contextlib.suppress(OSError):
+        os.remove(cursor_path)
+
+    total_s = time.perf_counter() - t_start
+    return {
+        "scanned": scanned,
+        "vectorized": vectorized,
+        "errors": errors,
+        "embed_chunks_per_s": _rate(vectorized, embed_s),
+        "chunks_per_s": _rate(vectorized, total_s),
+    }
+
+
+def cli() -> None:
+    import argparse, json
+
+    ap = argparse.ArgumentParser(prog="weavelens-index")
+    sub = ap.add_subparsers(dest="cmd")
+    p_scan = sub.add_parser(
+        "scan", help="просканировать и проиндексировать пути (по умолчанию DATA_INBOX)"
+    )
+    p_scan.add_argument("paths", nargs="*")
+    p_bf = sub.add_parser(
+        "backfill-vectors", help="досчитать векторы для уже проиндексированных чанков"
+    )
+    p_bf.add_argument("--page-size", type=int, default=None)
+    p_bf.add_argument("--restart", action="store_true", help="начать сначала, игнорируя курсор")
+    args = ap.parse_args()
+
+    if args.cmd == "backfill-vectors":
+        res = backfill_vectors(page_size=args.page_size, restart=args.restart)
+    else:
+        res = scan_and_index(getattr(args, "paths", None) or [settings.inbox_dir])
+    print(json.dumps(res, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    cli()
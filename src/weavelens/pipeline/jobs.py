@@ -0,0 +1,399 @@
+from __future__ import annotations
+import contextlib, fcntl, hashlib, json, os, socket, threading, time, uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Union
+from weavelens.db import weaviate_client as wv
+from weavelens.pipeline.index import scan_and_index
+from weavelens.settings import get_settings
+
+# Сколько завершённых задач держать для GET /ingest/jobs
+MAX_FINISHED_JOBS = 50
+# Сколько ошибок по файлам хранить в статусе задачи
+MAX_JOB_ERRORS = 100
+
+ACTIVE_STATES = ("queued", "running")
+# При нескольких воркерах API статус задачи пишется в файл не чаще раза в столько секунд
+SNAPSHOT_INTERVAL_S = 1.0
+# Активные задачи переписывают снимок (heartbeat_at) по таймеру, даже без прогресса;
+# снимок без heartbeat дольше STALE_AFTER_S считается брошенным (воркер/контейнер исчез)
+HEARTBEAT_INTERVAL_S = 5.0
+STALE_AFTER_S = HEARTBEAT_INTERVAL_S * 6
+
+
+_inbox_locks: Dict[str, threading.Lock] = {}
+_inbox_locks_guard = threading.Lock()
+
+
+def _shared_state() -> bool:
+    """Несколько воркеров API: задачи и локи видны между процессами через DATA_PROCESSED."""
+    return get_settings().api_workers > 1
+
+
+def _jobs_dir() -> str:
+    return os.path.join(get_settings().data_processed, "jobs")
+
+
+def _owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _owner_alive(owner: Optional[str]) -> bool:
+    """Жив ли процесс-владелец задачи. Про чужой хост судить не можем — считаем живым."""
+    host, _, pid = (owner or "").rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _write_snapshot(job_id: str, data: Dict[str, Any]) -> None:
+    os.makedirs(_jobs_dir(), exist_ok=True)
+    path = os.path.join(_jobs_dir(), f"{job_id}.json")
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _remove_job_files(job_id: str, *suffixes: str) -> None:
+    for suffix in suffixes:
+        with contextlib.suppress(OSError):
+            os.remove(os.path.join(_jobs_dir(), f"{job_id}{suffix}"))
+
+
+@contextlib.contextmanager
+def _submit_lock() -> Iterator[None]:
+    """Между воркерами: проверка «по каталогу уже идёт скан» и запись снимка атомарны."""
+    os.makedirs(_jobs_dir(), exist_ok=True)
+    with open(os.path.join(_jobs_dir(), ".submit.lock"), "w") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+@contextlib.contextmanager
+def inbox_lock(inbox: str) -> Iterator[None]:
+    """Лок каталога: полный скан и инкрементальные обновления не идут параллельно.
+
+    При API_WORKERS > 1 дополнительно берётся flock на файл в DATA_PROCESSED,
+    чтобы не сканировали одновременно разные процессы.
+    """
+    inbox = os.path.abspath(inbox)
+    with _inbox_locks_guard:
+        lock = _inbox_locks.setdefault(inbox, threading.Lock())
+    with lock:
+        if not _shared_state():
+            yield
+            return
+        locks_dir = os.path.join(get_settings().data_processed, "locks")
+        os.makedirs(locks_dir, exist_ok=True)
+        name = hashlib.sha1(inbox.encode("utf-8")).hexdigest() + ".lock"
+        with open(os.path.join(locks_dir, name), "w") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def _abandoned(snap: Dict[str, Any]) -> Optional[str]:
+    """Почему активный снимок брошен владельцем (None — не брошен)."""
+    if not _owner_alive(snap.get("owner")):
+        return "owner worker exited"
+    # pid мог достаться другому процессу, а контейнер — смениться: решает heartbeat
+    beat = snap.get("heartbeat_at") or snap.get("created_at") or 0
+    if time.time() - beat > STALE_AFTER_S:
+        return f"owner worker stopped reporting ({int(time.time() - beat)}s without heartbeat)"
+    return None
+
+
+def load_snapshot(job_id: str) -> Optional[Dict[str, Any]]:
+    """Статус задачи другого воркера (из DATA_PROCESSED/jobs).
+
+    Если воркер-владелец завершился, не дописав статус, активная задача
+    помечается как failed — иначе она числилась бы running навсегда.
+    """
+    if not _shared_state() or not job_id.isalnum():
+        return None
+    try:
+        with open(os.path.join(_jobs_dir(), f"{job_id}.json"), encoding="utf-8") as f:
+            snap = json.load(f)
+    except (OSError, ValueError):
+        return None
+    reason = _abandoned(snap) if snap.get("state") in ACTIVE_STATES else None
+    if reason is not None:
+        snap["state"] = "failed"
+        snap["finished_at"] = snap.get("finished_at") or time.time()
+        snap["current"] = None
+        snap["errors"] = list(snap.get("errors") or []) + [{"path": None, "error": reason}]
+        with contextlib.suppress(OSError):
+            _write_snapshot(job_id, snap)
+        _remove_job_files(job_id, ".cancel")
+    return snap
+
+
+def list_snapshots() -> List[Dict[str, Any]]:
+    if not _shared_state() or not os.path.isdir(_jobs_dir()):
+        return []
+    out = []
+    for name in os.listdir(_jobs_dir()):
+        if name.endswith(".json"):
+            snap = load_snapshot(name[:-5])
+            if snap is not None:
+                out.append(snap)
+    out.sort(key=lambda j: j.get("created_at") or 0, reverse=True)
+    return out[:MAX_FINISHED_JOBS]
+
+
+def _prune_snapshots() -> None:
+    """Удалить старые завершённые снимки сверх MAX_FINISHED_JOBS и осиротевшие маркеры отмены."""
+    names = os.listdir(_jobs_dir())
+    finished = []
+    for name in names:
+        if name.endswith(".json"):
+            snap = load_snapshot(name[:-5])
+            if snap is not None and snap.get("state") not in ACTIVE_STATES:
+                finished.append((snap.get("created_at") or 0, name[:-5]))
+    finished.sort()
+    for _, job_id in finished[: max(0, len(finished) - MAX_FINISHED_JOBS)]:
+        _remove_job_files(job_id, ".json", ".cancel")
+    done = {job_id for _, job_id in finished}
+    for name in names:
+        job_id = name[:-7]
+        if name.endswith(".cancel") and (job_id in done or f"{job_id}.json" not in names):
+            _remove_job_files(job_id, ".cancel")
+
+
+def request_cancel(job_id: str) -> None:
+    """Попросить воркер-владелец отменить задачу (файл-маркер рядом со статусом)."""
+    snap = load_snapshot(job_id)
+    if snap is not None and snap.get("state") in ACTIVE_STATES:
+        open(os.path.join(_jobs_dir(), f"{job_id}.cancel"), "w").close()
+
+
+class IngestJob:
+    """Фоновая задача сканирования одного каталога с прогрессом по файлам."""
+
+    def __init__(self, inbox: str) -> None:
+        self.id = uuid.uuid4().hex
+        self.inbox = inbox
+        self.state = "queued"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.files_total: Optional[int] = None
+        self.files_done = 0
+        self.files_indexed = 0
+        self.chunks_indexed = 0
+        self.current: Optional[str] = None
+        self.errors: List[Dict[str, Any]] = []
+        self.result: Optional[Dict[str, Any]] = None
+        self.cancel_event = threading.Event()
+        self.future: Optional[Future] = None
+        self._lock = threading.Lock()
+        self._saved_at = 0.0
+
+    def save(self, force: bool = False) -> None:
+        """Сохранить статус для других воркеров (только при API_WORKERS > 1)."""
+        if not _shared_state():
+            return
+        now = time.time()
+        if not force and now - self._saved_at < SNAPSHOT_INTERVAL_S:
+            return
+        self._saved_at = now
+        _write_snapshot(self.id, {**self.to_dict(), "owner": _owner(), "heartbeat_at": now})
+        # отмена, запрошенная через другой воркер
+        if os.path.exists(os.path.join(_jobs_dir(), f"{self.id}.cancel")):
+            self.cancel_event.set()
+
+    def on_progress(self, event: Dict[str, Any]) -> None:
+        self._on_progress(event)
+        self.save()
+
+    def _on_progress(self, event: Dict[str, Any]) -> None:
+        with self._lock:
+            if event.get("type") == "total":
+                self.files_total = int(event.get("files") or 0)
+                return
+            self.files_done += 1
+            self.current = event.get("path")
+            if event.get("status") == "indexed":
+                self.files_indexed += 1
+                self.chunks_indexed += int(event.get("chunks") or 0)
+            if event.get("error") and len(self.errors) < MAX_JOB_ERRORS:
+                self.errors.append({"path": event.get("path"), "error": event.get("error")})
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            end = self.finished_at or time.time()
+            elapsed = (end - self.started_at) if self.started_at else 0.0
+            return {
+                "job_id": self.id,
+                "inbox_dir": self.inbox,
+                "state": self.state,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "elapsed_s": round(elapsed, 3),
+                "files_total": self.files_total,
+                "files_done": self.files_done,
+                "files_indexed": self.files_indexed,
+                "chunks_indexed": self.chunks_indexed,
+                "current": self.current,
+                "files_per_s": round(self.files_done / elapsed, 3) if elapsed > 0 else 0.0,
+                "chunks_per_s": round(self.chunks_indexed / elapsed, 3) if elapsed > 0 else 0.0,
+                "errors": list(self.errors),
+                "result": self.result,
+            }
+
+
+class SnapshotJob:
+    """Активная задача другого воркера: только чтение статуса из снимка."""
+
+    future: Optional[Future] = None
+
+    def __init__(self, snap: Dict[str, Any]) -> None:
+        self.id = snap["job_id"]
+        self.inbox = snap.get("inbox_dir")
+        self._snap = snap
+
+    @property
+    def state(self) -> str:
+        return self.to_dict().get("state") or "failed"
+
+    def to_dict(self) -> Dict[str, Any]:
+        snap = load_snapshot(self.id)
+        if snap is not None:
+            self._snap = snap
+        elif self._snap.get("state") in ACTIVE_STATES:
+            # снимок удалили — ждать больше нечего
+            self._snap = {**self._snap, "state": "failed", "current": None,
+                          "errors": [{"path": None, "error": "job snapshot is gone"}]}
+        return dict(self._snap)
+
+
+class JobManager:
+    """Очередь задач сканирования: не больше одной активной задачи на каталог.
+
+    Скан выполняется в отдельном потоке (тяжёлая часть — в пуле процессов
+    извлечения), так что event loop API не блокируется.
+    """
+
+    def __init__(self, max_workers: int = 2) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._heartbeat: Optional[threading.Thread] = None
+
+    def _beat(self) -> None:
+        """Переписывать снимки активных задач, пока они есть (в т.ч. ждущих лок каталога)."""
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL_S)
+            with self._lock:
+                active = [j for j in self._jobs.values() if j.state in ACTIVE_STATES]
+                if not active:
+                    self._heartbeat = None
+                    return
+            for job in active:
+                with contextlib.suppress(OSError):
+                    job.save(force=True)
+
+    def _ensure_heartbeat(self) -> None:
+        if _shared_state() and self._heartbeat is None:
+            self._heartbeat = threading.Thread(
+                target=self._beat, name="ingest-heartbeat", daemon=True
+            )
+            self._heartbeat.start()
+
+    def submit(self, inbox: str) -> tuple[Union[IngestJob, SnapshotJob], bool]:
+        """Запустить скан каталога. Возвращает (задача, создана_ли_новая).
+
+        Если по этому каталогу уже идёт скан — возвращается он, в том числе
+        запущенный другим воркером API (тогда это SnapshotJob без future).
+        """
+        inbox = os.path.abspath(inbox)
+        with self._lock:
+            for job in self._jobs.values():
+                if job.inbox == inbox and job.state in ACTIVE_STATES:
+                    return job, False
+            with _submit_lock() if _shared_state() else contextlib.nullcontext():
+                for snap in list_snapshots():
+                    if snap.get("inbox_dir") == inbox and snap.get("state") in ACTIVE_STATES:
+                        return SnapshotJob(snap), False
+                job = IngestJob(inbox)
+                self._jobs[job.id] = job
+                self._trim()
+                job.save(force=True)
+            job.future = self._executor.submit(self._run, job)
+            self._ensure_heartbeat()
+            return job, True
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[IngestJob]:
+        with self._lock:
+            return list(reversed(self._jobs.values()))
+
+    def cancel(self, job_id: str) -> Optional[IngestJob]:
+        job = self.get(job_id)
+        if job is not None and job.state in ACTIVE_STATES:
+            job.cancel_event.set()
+        return job
+
+    def _trim(self) -> None:
+        finished = [j.id for j in self._jobs.values() if j.state not in ACTIVE_STATES]
+        for job_id in finished[: max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def _run(self, job: IngestJob) -> Dict[str, Any]:
+        try:
+            # пока ждём лок каталога (скан watcher'а или другого воркера), задача — queued
+            with inbox_lock(job.inbox):
+                job.started_at = time.time()
+                job.state = "running"
+                job.save(force=True)
+                if job.cancel_event.is_set():
+                    job.state = "cancelled"
+                    return {}
+                result = scan_and_index(
+                    [job.inbox], progress=job.on_progress, cancel=job.cancel_event
+                )
+            job.result = result
+            job.state = "cancelled" if result.get("cancelled") else "done"
+            return result
+        except Exception as e:
+            job.state = "failed"
+            job.errors.append({"path": None, "error": str(e)})
+            raise
+        finally:
+            job.finished_at = time.time()
+            job.current = None
+            job.save(force=True)
+            if _shared_state():
+                _remove_job_files(job.id, ".cancel")
+                with contextlib.suppress(OSError):
+                    _prune_snapshots()
+                # у каждого воркера своя копия индекса sha256 — не держим её между сканами
+                wv.drop_document_index()
+
+
+_manager: Optional[JobManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> JobManager:
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+        return _manager
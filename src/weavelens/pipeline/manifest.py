@@ -0,0 +1,102 @@
+from __future__ import annotations
+import os
+import sqlite3
+from typing import Dict, Iterable, List, NamedTuple, Optional
+from weavelens.settings import get_settings
+
+MANIFEST_FILENAME = "manifest.sqlite3"
+
+
+class Entry(NamedTuple):
+    path: str
+    size: int
+    mtime_ns: int
+    inode: int
+    sha256: str
+
+    def matches(self, st: os.stat_result) -> bool:
+        """Файл не менялся с прошлого скана (по size/mtime_ns/inode)."""
+        return (
+            self.size == st.st_size
+            and self.mtime_ns == st.st_mtime_ns
+            and self.inode == st.st_ino
+        )
+
+
+def manifest_path() -> str:
+    return os.path.join(get_settings().data_processed, MANIFEST_FILENAME)
+
+
+class Manifest:
+    """Локальный манифест проиндексированных файлов (SQLite в DATA_PROCESSED).
+
+    Хранит path, size, mtime_ns, inode и sha256, чтобы при повторном скане
+    не перечитывать и не хешировать файлы, у которых не изменился stat,
+    и чтобы находить удалённые/переименованные файлы.
+    """
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path = path or manifest_path()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(self.path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " path TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " inode INTEGER NOT NULL,"
+            " sha256 TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS files_sha256 ON files (sha256)")
+        self._db.commit()
+
+    def __enter__(self) -> "Manifest":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self._db.commit()
+        self.close()
+
+    def close(self) -> None:
+        self._db.close()
+
+    def commit(self) -> None:
+        self._db.commit()
+
+    def get(self, path: str) -> Optional[Entry]:
+        row = self._db.execute(
+            "SELECT path, size, mtime_ns, inode, sha256 FROM files WHERE path = ?", (path,)
+        ).fetchone()
+        return Entry(*row) if row else None
+
+    def under(self, roots: Iterable[str]) -> Dict[str, Entry]:
+        """Все записи, лежащие в одном из roots (каталог или сам файл)."""
+        out: Dict[str, Entry] = {}
+        for root in roots:
+            root = os.path.abspath(root)
+            prefix = root.rstrip(os.sep) + os.sep
+            rows = self._db.execute(
+                "SELECT path, size, mtime_ns, inode, sha256 FROM files"
+                " WHERE path = ? OR substr(path, 1, ?) = ?",
+                (root, len(prefix), prefix),
+            )
+            for row in rows:
+                out[row[0]] = Entry(*row)
+        return out
+
+    def by_sha256(self, sha256: str) -> List[Entry]:
+        rows = self._db.execute(
+            "SELECT path, size, mtime_ns, inode, sha256 FROM files WHERE sha256 = ?", (sha256,)
+        )
+        return [Entry(*row) for row in rows]
+
+    def put(self, path: str, st: os.stat_result, sha256: str) -> None:
+        self._db.execute(
+            "INSERT OR REPLACE INTO files (path, size, mtime_ns, inode, sha256)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (path, st.st_size, st.st_mtime_ns, st.st_ino, sha256),
+        )
+
+    def delete(self, path: str) -> None:
+        self._db.execute("DELETE FROM files WHERE path = ?", (path,))
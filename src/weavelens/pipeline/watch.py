@@ -0,0 +1,110 @@
+from __future__ import annotations
+import logging, os, threading
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+from weavelens.settings import get_settings
+from weavelens.pipeline.index import SUPPORTED, ExtractPool, remove_paths, scan_and_index
+from weavelens.pipeline.jobs import inbox_lock
+
+logger = logging.getLogger("weavelens.watch")
+
+
+def split_changes(paths: Iterable[str]) -> Tuple[Set[str], Set[str]]:
+    """Разделить изменённые пути на (созданные/изменённые файлы, удалённые пути).
+
+    Тип события watchfiles не используем: за окно debounce путь мог быть и
+    создан, и удалён, поэтому решаем по текущему состоянию ФС.
+    """
+    changed: Set[str] = set()
+    deleted: Set[str] = set()
+    for p in paths:
+        p = os.path.abspath(p)
+        if os.path.isfile(p):
+            if os.path.splitext(p)[1].lower() in SUPPORTED:
+                changed.add(p)
+        elif not os.path.exists(p):
+            # удалённый файл или целый каталог
+            deleted.add(p)
+    return changed, deleted
+
+
+def index_changes(
+    changed: Iterable[str], deleted: Iterable[str], pool: Optional[ExtractPool] = None
+) -> Dict[str, Any]:
+    """Проиндексировать только изменённые файлы и убрать удалённые."""
+    changed = sorted(changed)
+    deleted = sorted(deleted)
+    result: Dict[str, Any] = {"files_indexed": 0, "chunks_indexed": 0, "removed": 0, "renamed": 0}
+    errors = []
+    if changed:
+        res = scan_and_index(changed, incremental=True, pool=pool)
+        result["files_indexed"] = res["files_indexed"]
+        result["chunks_indexed"] = res["chunks_indexed"]
+        errors.extend(res.get("errors") or [])
+    if deleted:
+        res = remove_paths(deleted)
+        result["removed"] = res["removed"]
+        result["renamed"] = res["renamed"]
+        errors.extend(res.get("errors") or [])
+    result["errors"] = errors
+    return result
+
+
+def watch_inbox(inbox: Optional[str] = None, stop_event: Optional[threading.Event] = None) -> None:
+    """Следить за каталогом и индексировать изменения по мере появления.
+
+    Пачки событий склеиваются watchfiles (INGEST_WATCH_DEBOUNCE_MS), полный
+    обход дерева не выполняется.
+    """
+    from watchfiles import watch
+
+    settings = get_settings()
+    inbox = os.path.abspath(inbox or settings.inbox_dir)
+    logger.info("watching %s", inbox)
+    # один пул извлечения на всё время слежения, а не на каждую пачку
+    pool = ExtractPool()
+    try:
+        for changes in watch(
+            inbox,
+            debounce=int(settings.ingest_watch_debounce_ms),
+            stop_event=stop_event,
+            recursive=True,
+        ):
+            changed, deleted = split_changes(path for _, path in changes)
+            if not changed and not deleted:
+                continue
+            try:
+                with inbox_lock(inbox):
+                    res = index_changes(changed, deleted, pool)
+                logger.info(
+                    "watch: indexed %s files (%s chunks), removed %s, renamed %s, errors %s",
+                    res["files_indexed"], res["chunks_indexed"], res["removed"],
+                    res["renamed"], len(res["errors"]),
+                )
+            except Exception:
+                logger.exception("watch: indexing failed")
+    finally:
+        pool.close()
+
+
+def start_watcher(inbox: Optional[str] = None) -> Tuple[threading.Thread, threading.Event]:
+    """Запустить watch_inbox в фоновом потоке (для процесса API)."""
+    stop = threading.Event()
+    t = threading.Thread(
+        target=watch_inbox, args=(inbox, stop), name="ingest-watch", daemon=True
+    )
+    t.start()
+    return t, stop
+
+
+def cli() -> None:
+    from weavelens.monitoring.logging import setup_logging
+
+    setup_logging()
+    try:
+        watch_inbox()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    cli()
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from functools import lru_cache
-from typing import List, Optional
+from typing import List, Literal, Optional
 
 from pydantic import Field, field_validator, AliasChoices
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -18,6 +18,16 @@ class Settings(BaseSettings):
     api_port: int = Field(default=8000, alias="API_PORT")
     jwt_secret: Optional[str] = Field(default=None, alias="JWT_SECRET")
     api_prefix: str = Field(default="/api", alias="API_PREFIX")
+    # процессов uvicorn/gunicorn; при > 1 статусы задач и локи ингеста — через DATA_PROCESSED
+    api_workers: int = Field(default=1, alias="API_WORKERS")
+    # загрузить модель эмбеддингов в мастер-процессе до fork (gunicorn --preload)
+    api_preload_models: bool = Field(default=True, alias="API_PRELOAD_MODELS")
+    # фоновые проверки зависимостей для /ready (сек между проверками)
+    ready_check_interval_s: float = Field(default=10.0, alias="READY_CHECK_INTERVAL_S")
+    # считать ли недоступную Ollama причиной для 503 на /ready (/search работает и без неё)
+    ready_require_ollama: bool = Field(default=False, alias="READY_REQUIRE_OLLAMA")
+    # при старте загрузить LLM в Ollama короткой генерацией
+    warmup_ollama: bool = Field(default=True, alias="WARMUP_OLLAMA")
 
     # -------- WeaveLens --------
     weavelens_offline: bool = Field(default=False, alias="WEAVELENS_OFFLINE")
@@ -29,6 +39,9 @@ class Settings(BaseSettings):
     weaviate_grpc_port: int = Field(default=50051, alias="WEAVIATE_GRPC_PORT")
     weaviate_scheme: str = Field(default="http", alias="WEAVIATE_SCHEME")
     weaviate_api_key: Optional[str] = Field(default=None, alias="WEAVIATE_API_KEY")
+    # 0 — динамический размер батча (подбирается клиентом по нагрузке сервера)
+    weaviate_batch_size: int = Field(default=200, alias="WEAVIATE_BATCH_SIZE")
+    weaviate_batch_concurrency: int = Field(default=2, alias="WEAVIATE_BATCH_CONCURRENCY")
 
     # -------- Weaviate (embedded) --------
     weaviate_embedded_data_path: str = Field(
@@ -39,6 +52,45 @@ class Settings(BaseSettings):
     emb_model_name: str = Field(default="BAAI/bge-m3", alias="EMB_MODEL_NAME")
     emb_device: str = Field(default="cpu", alias="EMB_DEVICE")
     emb_max_seq: int = Field(default=1024, alias="EMB_MAX_SEQ")
+    # torch | onnx | onnx-int8 (ONNX экспортируется один раз в MODELS_CACHE/onnx)
+    emb_backend: Literal["torch", "onnx", "onnx-int8"] = Field(default="torch", alias="EMB_BACKEND")
+    # конфигурация int8-квантизации: avx2 | avx512 | avx512_vnni | arm64
+    emb_quant_config: str = Field(default="avx2", alias="EMB_QUANT_CONFIG")
+    emb_batch_size: int = Field(default=64, alias="EMB_BATCH_SIZE")
+    # писать векторы чанков при индексации (нужен sentence-transformers);
+    # выключено: эмбеддинги заметно замедляют скан, векторы можно досчитать backfill'ом
+    emb_index_enabled: bool = Field(default=False, alias="EMB_INDEX_ENABLED")
+    # кэш эмбеддингов запросов и микробатчинг одновременных запросов
+    emb_query_cache_size: int = Field(default=2048, alias="EMB_QUERY_CACHE_SIZE")
+    emb_query_cache_ttl_s: float = Field(default=3600.0, alias="EMB_QUERY_CACHE_TTL_S")
+    emb_batch_wait_ms: float = Field(default=5.0, alias="EMB_BATCH_WAIT_MS")
+    emb_batch_max: int = Field(default=32, alias="EMB_BATCH_MAX")
+
+    # -------- Search --------
+    # режим по умолчанию для /search и /ask: bm25 | vector | hybrid
+    search_mode: Literal["bm25", "vector", "hybrid"] = Field(default="bm25", alias="SEARCH_MODE")
+    search_hybrid_alpha: float = Field(default=0.5, alias="SEARCH_HYBRID_ALPHA")
+    # relative_score | ranked
+    search_hybrid_fusion: str = Field(default="relative_score", alias="SEARCH_HYBRID_FUSION")
+    # кэш ответов /ask по вопросу и набору чанков (0 — выкл.)
+    answer_cache_size: int = Field(default=1024, alias="ANSWER_CACHE_SIZE")
+    answer_cache_ttl_s: float = Field(default=3600.0, alias="ANSWER_CACHE_TTL_S")
+    # искать почти-дубликаты вопроса по эмбеддингу (нужен sentence-transformers)
+    answer_cache_semantic: bool = Field(default=False, alias="ANSWER_CACHE_SEMANTIC")
+    answer_cache_min_sim: float = Field(default=0.95, alias="ANSWER_CACHE_MIN_SIM")
+
+    # -------- Bot intent --------
+    # правила (ключевые слова/regex) до вызова LLM; LLM — только при низкой уверенности
+    intent_rules_enabled: bool = Field(default=True, alias="INTENT_RULES_ENABLED")
+    intent_rules_min_conf: float = Field(default=0.8, alias="INTENT_RULES_MIN_CONF")
+    # модель: близость к примерам фраз по эмбеддингам (нужен sentence-transformers)
+    intent_model_enabled: bool = Field(default=False, alias="INTENT_MODEL_ENABLED")
+    intent_model_min_score: float = Field(default=0.6, alias="INTENT_MODEL_MIN_SCORE")
+    # кэш ответов модели/LLM по нормализованному тексту (0 — выкл.)
+    intent_cache_size: int = Field(default=4096, alias="INTENT_CACHE_SIZE")
+    intent_cache_ttl_s: float = Field(default=86400.0, alias="INTENT_CACHE_TTL_S")
+    # дублировать кэш в DATA_PROCESSED/intent_cache.sqlite3 (переживает рестарт)
+    intent_cache_persist: bool = Field(default=False, alias="INTENT_CACHE_PERSIST")
 
     # -------- LLM / Ollama --------
     ollama_host: str = Field(default="ollama", alias="OLLAMA_HOST")
@@ -47,6 +99,19 @@ class Settings(BaseSettings):
     ollama_model_cpu: str = Field(default="qwen2.5:3b-instruct-q4_0", alias="OLLAMA_MODEL_CPU")
     ollama_model_gpu: str = Field(default="qwen2.5:7b-instruct-q4_0", alias="OLLAMA_MODEL_GPU")
     ollama_num_gpu_layers: int = Field(default=0, alias="OLLAMA_NUM_GPU_LAYERS")
+    # планировщик: параллельных генераций (под OLLAMA_NUM_PARALLEL) и мест в очереди
+    llm_max_concurrency: int = Field(default=1, alias="LLM_MAX_CONCURRENCY")
+    llm_queue_size: int = Field(default=16, alias="LLM_QUEUE_SIZE")
+    # сколько держать модель загруженной в Ollama после запроса ("30m", "-1" — всегда)
+    ollama_keep_alive: str = Field(default="30m", alias="OLLAMA_KEEP_ALIVE")
+    # общий HTTP-клиент Ollama: пул keep-alive соединений
+    ollama_max_connections: int = Field(default=16, alias="OLLAMA_MAX_CONNECTIONS")
+    ollama_max_keepalive: int = Field(default=8, alias="OLLAMA_MAX_KEEPALIVE")
+    ollama_keepalive_expiry_s: float = Field(default=60.0, alias="OLLAMA_KEEPALIVE_EXPIRY_S")
+    # таймауты, сек: установка соединения и полный ответ для /ask и /bot/intent
+    ollama_connect_timeout_s: float = Field(default=5.0, alias="OLLAMA_CONNECT_TIMEOUT_S")
+    ollama_ask_timeout_s: float = Field(default=120.0, alias="OLLAMA_ASK_TIMEOUT_S")
+    ollama_intent_timeout_s: float = Field(default=30.0, alias="OLLAMA_INTENT_TIMEOUT_S")
 
     # -------- Paths --------
     data_inbox: str = Field(
@@ -70,11 +135,30 @@ class Settings(BaseSettings):
         validation_alias=AliasChoices("MODELS_CACHE", "HF_HOME", "TRANSFORMERS_CACHE"),
     )
 
+    # -------- Ingestion --------
+    # 0 — извлекать текст последовательно в текущем процессе
+    ingest_workers: int = Field(default=2, alias="INGEST_WORKERS")
+    # максимум файлов «в полёте» (отправлено в пул, но не записано); 0 — workers * 2
+    ingest_queue_depth: int = Field(default=0, alias="INGEST_QUEUE_DEPTH")
+    # лимит времени на извлечение одного файла, сек (0 — без лимита)
+    ingest_file_timeout: float = Field(default=600.0, alias="INGEST_FILE_TIMEOUT")
+    # бюджет памяти на извлечённый текст; крупные файлы индексируются потоково (0 — выкл.)
+    ingest_memory_budget_mb: int = Field(default=512, alias="INGEST_MEMORY_BUDGET_MB")
+    # следить за DATA_INBOX из процесса API и индексировать изменения сразу
+    ingest_watch: bool = Field(default=False, alias="INGEST_WATCH")
+    ingest_watch_debounce_ms: int = Field(default=1500, alias="INGEST_WATCH_DEBOUNCE_MS")
+
     # -------- OCR / Extraction --------
     ocr_enabled: bool = Field(default=True, alias="OCR_ENABLED")
     ocr_langs: str = Field(default="rus+eng", alias="OCR_LANGS")
     ocr_pdf_zoom: float = Field(default=2.0, alias="OCR_PDF_ZOOM")
     ocr_min_page_text_len: int = Field(default=20, alias="OCR_MIN_PAGE_TEXT_LEN")
+    # процессов для постраничного OCR одного PDF (0/1 — последовательно)
+    ocr_workers: int = Field(default=0, alias="OCR_WORKERS")
+    # бюджет времени на OCR одного документа, сек (0 — без лимита)
+    ocr_doc_timeout: float = Field(default=0.0, alias="OCR_DOC_TIMEOUT")
+    # кэш результатов OCR в DATA_PROCESSED/ocr_cache
+    ocr_cache_enabled: bool = Field(default=True, alias="OCR_CACHE_ENABLED")
 
     # -------- Security --------
     encrypt_content: bool = Field(default=False, alias="ENCRYPT_CONTENT")
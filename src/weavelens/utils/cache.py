@@ -0,0 +1,129 @@
+from __future__ import annotations
+import json, os, sqlite3, threading, time
+from collections import OrderedDict
+from typing import Any, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+V = TypeVar("V")
+
+
+class TTLCache(Generic[V]):
+    """Потокобезопасный LRU-кэш с ограничением по размеру и времени жизни.
+
+    maxsize <= 0 отключает кэш, ttl <= 0 — записи не устаревают.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 0.0) -> None:
+        self.maxsize = int(maxsize)
+        self.ttl = float(ttl)
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Tuple[float, V]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[V]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                expires, value = item
+                if not expires or expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key: Hashable, value: V) -> None:
+        if self.maxsize <= 0:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl > 0 else 0.0
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class SQLiteCache:
+    """Персистентный кэш JSON-значений с TTL (переживает рестарт, общий для воркеров).
+
+    Срок жизни считается по wall-clock, просроченные записи удаляются при чтении
+    и при записи. maxsize > 0 ограничивает число строк: при записи сверх него
+    удаляются самые давно записанные (maxsize <= 0 — без ограничения).
+    """
+
+    def __init__(self, path: str, ttl: float = 0.0, table: str = "cache", maxsize: int = 0) -> None:
+        self.path = path
+        self.ttl = float(ttl)
+        self.table = table
+        self.maxsize = int(maxsize)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " expires REAL NOT NULL)"
+        )
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT value, expires FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires = row
+            if expires and expires <= time.time():
+                self._db.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                return None
+        return json.loads(value)
+
+    def set(self, key: str, value: Any) -> None:
+        expires = time.time() + self.ttl if self.ttl > 0 else 0.0
+        data = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            # INSERT OR REPLACE выдаёт новый rowid — порядок rowid = порядок записи
+            self._db.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires) VALUES (?, ?, ?)",
+                (key, data, expires),
+            )
+            self._evict()
+
+    def _evict(self) -> None:
+        self._db.execute(
+            f"DELETE FROM {self.table} WHERE expires > 0 AND expires <= ?", (time.time(),)
+        )
+        if self.maxsize > 0:
+            self._db.execute(
+                f"DELETE FROM {self.table} WHERE rowid <= ("
+                f" SELECT rowid FROM {self.table} ORDER BY rowid DESC LIMIT 1 OFFSET ?)",
+                (self.maxsize,),
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
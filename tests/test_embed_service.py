@@ -0,0 +1,42 @@
+import asyncio
+import time
+
+from weavelens.models import embed_service
+from weavelens.utils.cache import TTLCache
+
+
+def test_ttl_cache_lru_and_expiry(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    c = TTLCache(maxsize=2, ttl=10)
+    c.set("a", 1)
+    c.set("b", 2)
+    assert c.get("a") == 1
+    c.set("c", 3)  # вытесняет b (давно не читали)
+    assert c.get("b") is None
+    now[0] += 11
+    assert c.get("a") is None
+    assert c.stats()["hits"] == 1
+
+
+def test_concurrent_queries_share_one_encode(monkeypatch):
+    calls = []
+
+    def fake_encode(self, batch):
+        calls.append([k for k, _ in batch])
+        for key, fut in batch:
+            fut.set_result([float(len(key))])
+
+    async def _encode(self, batch):
+        fake_encode(self, batch)
+
+    monkeypatch.setattr(embed_service.EmbeddingService, "_encode", _encode)
+    svc = embed_service.EmbeddingService(cache_size=10, cache_ttl=0, batch_wait_ms=5, batch_max=8)
+
+    async def run():
+        return await asyncio.gather(
+            svc.embed_query("a  b"), svc.embed_query("a b"), svc.embed_query("ccc")
+        )
+
+    assert asyncio.run(run()) == [[3.0], [3.0], [3.0]]
+    assert calls == [["a b", "ccc"]]
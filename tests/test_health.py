@@ -0,0 +1,41 @@
+import asyncio
+import time
+
+from weavelens.api import readiness, warmup as warmup_mod
+from weavelens.api.routers import health
+
+
+def _ok():
+    return {"ok": True, "error": None, "latency_ms": 1.0, "checked_at": time.time()}
+
+
+def test_ready_reflects_warmup_and_cached_checks(monkeypatch):
+    state = warmup_mod.Warmup()
+    checks = readiness.DependencyChecks()
+    monkeypatch.setattr(readiness, "warmup", state)
+    monkeypatch.setattr(health, "checks", checks)
+    checks.status = {"weaviate": _ok(), "ollama": _ok()}
+
+    resp = asyncio.run(health.ready())
+    assert resp.status_code == 503
+
+    state.done = True
+    assert asyncio.run(health.ready())["status"] == "ready"
+
+    # Ollama по умолчанию не обязательна, Weaviate — обязателен
+    checks.status["ollama"] = {**_ok(), "ok": False, "error": "down"}
+    assert asyncio.run(health.ready())["status"] == "ready"
+    checks.status["weaviate"] = {**_ok(), "checked_at": time.time() - 3600}
+    resp = asyncio.run(health.ready())
+    assert resp.status_code == 503
+
+
+def test_failed_check_is_recorded(monkeypatch):
+    async def down():
+        raise ConnectionError("refused")
+
+    checks = readiness.DependencyChecks()
+    monkeypatch.setattr(checks, "checks", lambda: {"weaviate": down})
+    asyncio.run(checks.run_once())
+    assert checks.status["weaviate"]["ok"] is False
+    assert "refused" in checks.status["weaviate"]["error"]
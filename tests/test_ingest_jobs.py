@@ -0,0 +1,148 @@
+import threading
+
+from weavelens.pipeline import jobs
+
+
+def test_one_active_job_per_inbox_and_cancel(tmp_path, monkeypatch):
+    started = threading.Event()
+
+    def fake_scan(paths, progress=None, cancel=None):
+        progress({"type": "total", "files": 2})
+        progress({"type": "file", "path": "a.txt", "status": "indexed", "chunks": 3})
+        started.set()
+        cancel.wait(5)
+        return {"files": 1, "chunks_indexed": 3, "cancelled": cancel.is_set()}
+
+    monkeypatch.setattr(jobs, "scan_and_index", fake_scan)
+    manager = jobs.JobManager()
+
+    job, created = manager.submit(str(tmp_path))
+    again, created_again = manager.submit(str(tmp_path))
+    assert created and not created_again and again is job
+
+    assert started.wait(5)
+    status = job.to_dict()
+    assert status["state"] == "running"
+    assert (status["files_total"], status["files_done"], status["chunks_indexed"]) == (2, 1, 3)
+
+    manager.cancel(job.id)
+    job.future.result(timeout=5)
+    assert job.to_dict()["state"] == "cancelled"
+    nxt, created = manager.submit(str(tmp_path))
+    assert created
+    manager.cancel(nxt.id)
+    nxt.future.result(timeout=5)
+
+
+def test_job_status_shared_between_workers(tmp_path, monkeypatch):
+    settings = jobs.get_settings()
+    monkeypatch.setattr(settings, "api_workers", 2)
+    monkeypatch.setattr(settings, "data_processed", str(tmp_path / "processed"))
+    started = threading.Event()
+
+    def fake_scan(paths, progress=None, cancel=None):
+        progress({"type": "total", "files": 1})
+        started.set()
+        while not cancel.is_set():
+            # маркер отмены из другого воркера подхватывается при сохранении статуса
+            progress({"type": "file", "path": "a.txt", "status": "unchanged"})
+            cancel.wait(0.05)
+        return {"cancelled": True}
+
+    monkeypatch.setattr(jobs, "SNAPSHOT_INTERVAL_S", 0.0)
+    monkeypatch.setattr(jobs, "scan_and_index", fake_scan)
+    job, _ = jobs.JobManager().submit(str(tmp_path))
+    assert started.wait(5)
+
+    # «другой воркер» видит задачу только через снимок на диске
+    snap = jobs.load_snapshot(job.id)
+    assert snap["job_id"] == job.id and snap["state"] == "running"
+    assert [j["job_id"] for j in jobs.list_snapshots()] == [job.id]
+
+    jobs.request_cancel(job.id)
+    job.future.result(timeout=5)
+    assert jobs.load_snapshot(job.id)["state"] == "cancelled"
+
+
+def test_submit_dedupes_across_workers_and_dead_owner_fails(tmp_path, monkeypatch):
+    settings = jobs.get_settings()
+    monkeypatch.setattr(settings, "api_workers", 2)
+    monkeypatch.setattr(settings, "data_processed", str(tmp_path / "processed"))
+    started = threading.Event()
+
+    def fake_scan(paths, progress=None, cancel=None):
+        started.set()
+        while not cancel.is_set():
+            progress({"type": "file", "path": "a.txt", "status": "unchanged"})
+            cancel.wait(0.05)
+        return {"cancelled": True}
+
+    monkeypatch.setattr(jobs, "SNAPSHOT_INTERVAL_S", 0.0)
+    monkeypatch.setattr(jobs, "scan_and_index", fake_scan)
+    job, _ = jobs.JobManager().submit(str(tmp_path))
+    assert started.wait(5)
+
+    # второй воркер (свой JobManager) получает уже идущую задачу, а не новую
+    other, created = jobs.JobManager().submit(str(tmp_path))
+    assert not created and other.id == job.id and other.future is None
+    assert other.state == "running"
+
+    jobs.request_cancel(job.id)
+    job.future.result(timeout=5)
+    assert not (tmp_path / "processed" / "jobs" / f"{job.id}.cancel").exists()
+    assert other.state == "cancelled"
+
+    # снимок воркера, умершего посреди скана, не висит в running
+    snap = {**jobs.load_snapshot(job.id), "job_id": "dead", "state": "running",
+            "owner": f"{jobs.socket.gethostname()}:999999999"}
+    jobs._write_snapshot("dead", snap)
+    dead = jobs.load_snapshot("dead")
+    assert dead["state"] == "failed" and dead["errors"][-1]["error"] == "owner worker exited"
+    manager = jobs.JobManager()
+    nxt, created = manager.submit(str(tmp_path))
+    assert created
+    manager.cancel(nxt.id)
+    nxt.future.result(timeout=5)
+
+
+def test_job_waiting_for_inbox_lock_stays_queued(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "scan_and_index", lambda paths, progress=None, cancel=None: {})
+    manager = jobs.JobManager()
+    with jobs.inbox_lock(str(tmp_path)):
+        job, _ = manager.submit(str(tmp_path))
+        assert job.to_dict()["state"] == "queued" and job.started_at is None
+    job.future.result(timeout=5)
+    assert job.to_dict()["state"] == "done"
+
+
+def test_stale_snapshot_does_not_block_inbox_and_heartbeat_keeps_job_alive(tmp_path, monkeypatch):
+    settings = jobs.get_settings()
+    monkeypatch.setattr(settings, "api_workers", 2)
+    monkeypatch.setattr(settings, "data_processed", str(tmp_path / "processed"))
+    monkeypatch.setattr(jobs, "HEARTBEAT_INTERVAL_S", 0.05)
+    monkeypatch.setattr(jobs, "STALE_AFTER_S", 0.3)
+    inbox = str(tmp_path)
+
+    # снимок из пересозданного контейнера: чужой хост, heartbeat сутки назад
+    day_ago = jobs.time.time() - 86400
+    jobs._write_snapshot("old", {"job_id": "old", "inbox_dir": inbox, "state": "running",
+                                 "created_at": day_ago, "heartbeat_at": day_ago,
+                                 "owner": "oldcontainer:8"})
+    assert jobs.load_snapshot("old")["state"] == "failed"
+
+    started = threading.Event()
+
+    def quiet_scan(paths, progress=None, cancel=None):
+        # ни одного события прогресса — снимок обновляет только heartbeat
+        started.set()
+        cancel.wait(5)
+        return {"cancelled": True}
+
+    monkeypatch.setattr(jobs, "scan_and_index", quiet_scan)
+    manager = jobs.JobManager()
+    job, created = manager.submit(inbox)
+    assert created and started.wait(5)
+    jobs.time.sleep(0.6)
+    assert jobs.load_snapshot(job.id)["state"] == "running"
+    manager.cancel(job.id)
+    job.future.result(timeout=5)
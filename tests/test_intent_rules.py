@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+from starlette.requests import Request
+
+from weavelens.api.routers import bot_intent
+from weavelens.llm import intent
+from weavelens.llm.intent import IntentCache, classify_rules
+
+_REQUEST = Request({"type": "http", "headers": []})
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(intent, "_cache", IntentCache(16, 60.0))
+
+
+@pytest.mark.parametrize(
+    "text, action, query",
+    [
+        ("помощь", "help", ""),
+        ("/start", "help", ""),
+        ("Пересканируй папку", "scan", ""),
+        ("reindex", "scan", ""),
+        ("найди отчёт за март", "search", "отчёт за март"),
+        ("find: quarterly invoice", "search", "quarterly invoice"),
+        ("Что такое RAG?", "ask", "Что такое RAG?"),
+        ("сколько стоит лицензия?", "ask", "сколько стоит лицензия?"),
+    ],
+)
+def test_rules_decide_obvious_triggers(text, action, query):
+    guess = classify_rules(text)
+    assert guess is not None and guess.confidence >= 0.8
+    assert (guess.action, guess.query) == (action, query)
+
+
+def test_conflicting_rules_lower_confidence():
+    guess = classify_rules("найди и пересканируй")
+    assert guess is not None and guess.confidence < 0.8
+    assert classify_rules("привет, коллеги") is None
+
+
+def test_detect_intent_skips_llm_on_confident_rule(monkeypatch):
+    async def no_llm(*a, **kw):
+        raise AssertionError("LLM must not be called")
+
+    monkeypatch.setattr(bot_intent, "ollama_generate", no_llm)
+    out = asyncio.run(bot_intent.detect_intent(bot_intent.IntentIn(text="найди договор"), _REQUEST))
+    assert (out.action, out.query) == ("search", "договор")
+
+
+def test_detect_intent_uses_llm_when_unsure(monkeypatch):
+    async def llm(prompt, model=None, timeout=None, **kw):
+        return '{"action": "ask", "query": "про отпуск"}'
+
+    monkeypatch.setattr(bot_intent, "ollama_generate", llm)
+    body = bot_intent.IntentIn(text="слушай, а отпуск")
+    out = asyncio.run(bot_intent.detect_intent(body, _REQUEST))
+    assert (out.action, out.query) == ("ask", "про отпуск")
+
+
+def test_repeated_message_served_from_cache(monkeypatch):
+    calls = []
+
+    async def llm(prompt, model=None, timeout=None, **kw):
+        calls.append(prompt)
+        return '{"action": "search", "query": "отпуск"}'
+
+    monkeypatch.setattr(bot_intent, "ollama_generate", llm)
+    for text in ("слушай, а отпуск", "Слушай,  а ОТПУСК."):
+        out = asyncio.run(bot_intent.detect_intent(bot_intent.IntentIn(text=text), _REQUEST))
+        assert (out.action, out.query) == ("search", "отпуск")
+    assert len(calls) == 1
+
+
+def test_intent_cache_persists_in_sqlite(tmp_path):
+    db = str(tmp_path / "intent.sqlite3")
+    IntentCache(16, 60.0, db).set("Помоги с отчётом", {"action": "ask", "query": "отчёт"})
+    fresh = IntentCache(16, 60.0, db)
+    assert fresh.get("помоги  с отчетом") == {"action": "ask", "query": "отчёт"}
+    assert fresh.memory.get("помоги с отчетом") is not None
+
+
+def test_sqlite_cache_evicts_oldest_and_expired(tmp_path):
+    from weavelens.utils.cache import SQLiteCache
+
+    cache = SQLiteCache(str(tmp_path / "c.sqlite3"), maxsize=2)
+    for key in ("a", "b", "c"):
+        cache.set(key, key)
+    assert len(cache) == 2 and cache.get("a") is None and cache.get("c") == "c"
+
+    cache.ttl = 1e-6
+    cache.set("d", "d")
+    cache.ttl = 0.0
+    cache.set("e", "e")
+    assert len(cache) == 2 and cache.get("d") is None
+
+
+def test_intent_cache_async_reads_sqlite_in_thread(tmp_path):
+    db = str(tmp_path / "intent.sqlite3")
+    asyncio.run(IntentCache(16, 60.0, db).aset("отчёт", {"action": "ask", "query": "отчёт"}))
+    got = asyncio.run(IntentCache(16, 60.0, db).aget("Отчет"))
+    assert got == {"action": "ask", "query": "отчёт"}
@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+from weavelens.llm.scheduler import DeadlineExceeded, LLMScheduler, QueueFull
+
+
+def test_intent_jumps_ahead_of_queued_answers():
+    async def run():
+        sched = LLMScheduler(concurrency=1, max_queue=4)
+        order = []
+        gate = asyncio.Event()
+
+        async def job(name, kind):
+            async with sched.slot(kind):
+                order.append(name)
+                if name == "first":
+                    await gate.wait()
+
+        first = asyncio.create_task(job("first", "answer"))
+        await asyncio.sleep(0)
+        queued = (("a1", "answer"), ("a2", "answer"), ("i1", "intent"))
+        rest = [asyncio.create_task(job(n, k)) for n, k in queued]
+        await asyncio.sleep(0)
+        assert sched.queued == 3
+        gate.set()
+        await asyncio.gather(first, *rest)
+        assert sched.active == 0 and sched.queued == 0
+        return order
+
+    assert asyncio.run(run()) == ["first", "i1", "a1", "a2"]
+
+
+def test_full_queue_rejects_and_deadline_drops_waiter():
+    async def run():
+        sched = LLMScheduler(concurrency=1, max_queue=1)
+        loop = asyncio.get_running_loop()
+        gate = asyncio.Event()
+
+        async def hold():
+            async with sched.slot("answer"):
+                await gate.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(sched.slot("answer", deadline=loop.time() + 0.05).__aenter__())
+        await asyncio.sleep(0)
+        assert sched.full()
+        with pytest.raises(QueueFull):
+            async with sched.slot("intent"):
+                pass
+        with pytest.raises(DeadlineExceeded):
+            await waiter
+        assert sched.queued == 0
+        gate.set()
+        await holder
+        assert sched.active == 0
+
+    asyncio.run(run())
+
+
+def test_limits_are_split_between_api_workers():
+    from weavelens.llm.scheduler import worker_limits
+
+    assert worker_limits(4, 16, 1) == (4, 16)
+    assert worker_limits(4, 16, 2) == (2, 8)
+    assert worker_limits(1, 5, 4) == (1, 2)
@@ -0,0 +1,36 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from weavelens.api.routers import health, metrics
+from weavelens.llm.ollama_client import _observe_generation
+from weavelens.monitoring.metrics import LLM_GEN, LLM_TPS, REGISTRY
+
+
+def test_metrics_endpoint_reports_route_templates():
+    # как в api.main, без lifespan
+    app = FastAPI()
+    app.include_router(health.router, prefix="/api")
+    app.include_router(metrics.router)
+    app.middleware("http")(metrics.route_metrics)
+    client = TestClient(app)
+    assert client.get("/api/live").status_code == 200
+    client.get("/no/such/path")
+
+    text = client.get("/metrics").text
+    assert 'weavelens_requests_total{route="/api/live"}' in text
+    assert 'weavelens_latency_seconds_count{route="/api/live"}' in text
+    # неизвестные пути не плодят серии
+    assert 'route="unmatched"' in text and "/no/such/path" not in text
+
+
+def _tps_count():
+    return REGISTRY.get_sample_value("weavelens_llm_tokens_per_second_count", {"kind": "test"})
+
+
+def test_generation_metrics_use_ollama_eval_stats():
+    before = _tps_count() or 0
+    _observe_generation("test", 2.0, {"eval_count": 40, "eval_duration": 2_000_000_000})
+    _observe_generation("test", 1.0, {})
+    assert _tps_count() == before + 1
+    assert REGISTRY.get_sample_value("weavelens_llm_tokens_per_second_sum", {"kind": "test"}) >= 20
+    assert LLM_GEN.labels(kind="test") and LLM_TPS.labels(kind="test")
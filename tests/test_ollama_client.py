@@ -0,0 +1,56 @@
+import asyncio
+import json
+
+import httpx
+
+from weavelens.llm import ollama_client
+from weavelens.models.llm import ask_ollama
+
+
+def test_generate_reuses_shared_client(monkeypatch):
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append((request.url.path, request.extensions["timeout"]["read"]))
+        return httpx.Response(200, json={"response": " ok "})
+
+    async def run():
+        client = httpx.AsyncClient(
+            base_url="http://ollama:11434", transport=httpx.MockTransport(handler)
+        )
+        monkeypatch.setattr(ollama_client, "_client", client)
+        assert await ollama_client.generate("a", timeout=7.0) == " ok "
+        assert await ask_ollama("b") == "ok"
+        assert await ollama_client.get_client() is client
+        await ollama_client.close_client()
+        assert client.is_closed and ollama_client._client is None
+
+    asyncio.run(run())
+    assert [p for p, _ in seen] == ["/api/generate", "/api/generate"]
+    # таймаут — остаток бюджета запроса после ожидания слота
+    assert 6.0 < seen[0][1] <= 7.0
+    assert seen[1][1] <= ollama_client.settings.ollama_ask_timeout_s
+
+
+def test_generate_stream_yields_pieces(monkeypatch):
+    lines = [
+        {"response": "При", "done": False},
+        {"response": "вет", "done": False},
+        {"response": "", "done": True},
+    ]
+    body = "\n".join(json.dumps(x) for x in lines) + "\n"
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert json.loads(request.content)["stream"] is True
+        return httpx.Response(200, content=body.encode())
+
+    async def run():
+        client = httpx.AsyncClient(
+            base_url="http://ollama:11434", transport=httpx.MockTransport(handler)
+        )
+        monkeypatch.setattr(ollama_client, "_client", client)
+        out = [p async for p in ollama_client.generate_stream("q")]
+        await ollama_client.close_client()
+        return out
+
+    assert asyncio.run(run()) == ["При", "вет"]
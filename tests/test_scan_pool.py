@@ -0,0 +1,303 @@
+import pytest
+
+from weavelens.pipeline import index
+
+
+@pytest.fixture
+def fake_wv(monkeypatch, tmp_path):
+    monkeypatch.setattr(index.settings, "data_processed", str(tmp_path / "processed"))
+    monkeypatch.setattr(index, "_embedder", lambda: None)
+    written = {}
+    monkeypatch.setattr(index.wv, "known_documents", lambda refresh=False: {})
+    monkeypatch.setattr(index.wv, "upsert_document", lambda fp, sha, title, size: sha)
+    def add_chunks(doc_uuid, path, title, chunks, errors=None, **kw):
+        written[path] = list(chunks)
+        return len(chunks)
+    monkeypatch.setattr(index.wv, "add_chunks", add_chunks)
+    return written
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_scan_counters_match_sequential(tmp_path, monkeypatch, fake_wv, workers):
+    monkeypatch.setattr(index.settings, "ingest_workers", workers)
+    (tmp_path / "a.txt").write_text("alpha " * 500, encoding="utf-8")
+    (tmp_path / "b.md").write_text("beta", encoding="utf-8")
+    (tmp_path / "empty.txt").write_text("", encoding="utf-8")
+    (tmp_path / "skip.bin").write_bytes(b"\\x00")
+    (tmp_path / "copy.md").write_text("beta", encoding="utf-8")
+
+    res = index.scan_and_index([str(tmp_path)])
+
+    assert res["files_indexed"] == 2
+    assert res["skipped"] == 2
+    assert res["chunks_indexed"] == sum(len(c) for c in fake_wv.values())
+    assert res["errors"] == []
+
+
+def test_ocr_cache_skips_rendering(tmp_path, monkeypatch):
+    monkeypatch.setattr(index.settings, "data_processed", str(tmp_path / "processed"))
+    monkeypatch.setattr(index.settings, "ocr_cache_enabled", True)
+    pdf = tmp_path / "scan.pdf"
+    pdf.write_bytes(b"%PDF-fake")
+    sha = index.sha256_file(str(pdf))
+    zoom = index.settings.ocr_pdf_zoom
+    lang = index.settings.ocr_langs
+    index._ocr_cache_put(sha, 0, zoom, lang, "page zero")
+    index._ocr_cache_put(sha, 1, zoom, lang, "")
+
+    assert index._ocr_pdf_pages(str(pdf), [0, 1], sha=sha) == {0: "page zero", 1: ""}
+
+
+def test_ocr_cache_disabled_is_not_read_or_written(tmp_path, monkeypatch):
+    processed = tmp_path / "processed"
+    monkeypatch.setattr(index.settings, "data_processed", str(processed))
+    monkeypatch.setattr(index.settings, "ocr_cache_enabled", True)
+    index._ocr_cache_put("ab" * 32, 0, 2.0, "eng", "cached")
+    monkeypatch.setattr(index.settings, "ocr_cache_enabled", False)
+    assert index._ocr_cache_get("ab" * 32, 0, 2.0, "eng") is None
+    index._ocr_cache_put("cd" * 32, 0, 2.0, "eng", "new")
+    assert not (processed / "ocr_cache" / "cd").exists()
+
+
+def test_rescan_reports_manifest_changes(tmp_path, monkeypatch, fake_wv):
+    monkeypatch.setattr(index.settings, "ingest_workers", 0)
+    known = {}
+    monkeypatch.setattr(index.wv, "known_documents", lambda refresh=False: known)
+    def upsert(fp, sha, title, size):
+        known[sha] = fp
+        return sha
+    monkeypatch.setattr(index.wv, "upsert_document", upsert)
+    deleted, moved = [], []
+    monkeypatch.setattr(index.wv, "delete_document", lambda sha: deleted.append(sha) or True)
+    monkeypatch.setattr(index.wv, "repoint_document", lambda sha, p, t: moved.append(p) or True)
+
+    inbox = tmp_path / "inbox"
+    inbox.mkdir()
+    (inbox / "keep.txt").write_text("keep", encoding="utf-8")
+    (inbox / "edit.txt").write_text("old", encoding="utf-8")
+    (inbox / "gone.txt").write_text("gone", encoding="utf-8")
+    (inbox / "move.txt").write_text("move", encoding="utf-8")
+    first = index.scan_and_index([str(inbox)])
+    assert (first["added"], first["files_indexed"]) == (4, 4)
+
+    hashed = []
+    sha256_file = index.sha256_file
+    monkeypatch.setattr(index, "sha256_file", lambda p: hashed.append(p) or sha256_file(p))
+    (inbox / "edit.txt").write_text("new content", encoding="utf-8")
+    (inbox / "gone.txt").unlink()
+    (inbox / "move.txt").rename(inbox / "moved.txt")
+    second = index.scan_and_index([str(inbox)])
+    assert sorted(hashed) == [str(inbox / "edit.txt"), str(inbox / "moved.txt")]
+    assert (second["unchanged"], second["changed"]) == (1, 1)
+    assert (second["removed"], second["renamed"], second["added"]) == (1, 1, 0)
+    assert second["files_indexed"] == 1
+    assert moved == [str(inbox / "moved.txt")]
+    assert len(deleted) == 2  # gone.txt и старая версия edit.txt
+
+
+def test_unreadable_file_is_not_treated_as_removed(tmp_path, monkeypatch, fake_wv):
+    monkeypatch.setattr(index.settings, "ingest_workers", 0)
+    known = {}
+    monkeypatch.setattr(index.wv, "known_documents", lambda refresh=False: known)
+    monkeypatch.setattr(
+        index.wv, "upsert_document", lambda fp, sha, title, size: known.setdefault(sha, fp)
+    )
+    touched = []
+    monkeypatch.setattr(index.wv, "delete_document", lambda sha: touched.append(sha) or True)
+    monkeypatch.setattr(index.wv, "repoint_document", lambda sha, p, t: touched.append(p) or True)
+    locked = tmp_path / "locked.txt"
+    locked.write_text("secret", encoding="utf-8")
+    (tmp_path / "copy.txt").write_text("secret", encoding="utf-8")
+    index.scan_and_index([str(tmp_path)])
+
+    sha256_file = index.sha256_file
+
+    def flaky(p):
+        if p == str(locked):
+            raise PermissionError(13, "Permission denied", p)
+        return sha256_file(p)
+
+    monkeypatch.setattr(index, "sha256_file", flaky)
+    locked.write_text("secret!", encoding="utf-8")  # stat изменился — нужен рехеш
+    res = index.scan_and_index([str(tmp_path)])
+    assert [e["path"] for e in res["errors"]] == [str(locked)]
+    assert res["removed"] == 0 and touched == []
+
+
+def _reference_chunks(text, chunk_chars=1200, overlap=200):
+    text = text.strip()
+    out, i, n = [], 0, len(text)
+    while text and i < n:
+        end = min(n, i + chunk_chars)
+        out.append(text[i:end])
+        if end == n:
+            break
+        i = max(0, end - overlap)
+    return out
+
+
+@pytest.mark.parametrize("piece", [1, 7, 500, 5000])
+def test_streaming_chunker_matches_chunk_text(piece):
+    text = "  \n" + " ".join(f"слово{i}" for i in range(2000)) + "\n\n   \t"
+    pieces = [text[i:i + piece] for i in range(0, len(text), piece)]
+    assert list(index.iter_chunk_text(pieces)) == _reference_chunks(text)
+    assert index.chunk_text(text) == _reference_chunks(text)
+
+
+def test_large_file_is_indexed_streaming(tmp_path, monkeypatch, fake_wv):
+    monkeypatch.setattr(index.settings, "ingest_workers", 2)
+    monkeypatch.setattr(index.settings, "ingest_memory_budget_mb", 1)
+    monkeypatch.setattr(index.settings, "weaviate_batch_size", 50)
+    starts = []
+    def add_chunks(doc_uuid, path, title, chunks, errors=None, start=0, **kw):
+        starts.append(start)
+        fake_wv.setdefault(path, []).extend(chunks)
+        return len(chunks)
+    monkeypatch.setattr(index.wv, "add_chunks", add_chunks)
+    big = tmp_path / "big.txt"
+    text = "строка текста " * 40000
+    big.write_text(text, encoding="utf-8")
+
+    res = index.scan_and_index([str(tmp_path)])
+
+    assert res["files_indexed"] == 1
+    assert fake_wv[str(big)] == _reference_chunks(text)
+    assert starts[:3] == [0, 50, 100]
+
+
+def test_remove_paths_deletes_or_repoints(tmp_path, monkeypatch, fake_wv):
+    monkeypatch.setattr(index.settings, "ingest_workers", 0)
+    deleted, moved = [], []
+    monkeypatch.setattr(index.wv, "delete_document", lambda sha: deleted.append(sha) or True)
+    monkeypatch.setattr(index.wv, "repoint_document", lambda sha, p, t: moved.append(p) or True)
+    (tmp_path / "a.txt").write_text("same", encoding="utf-8")
+    (tmp_path / "b.txt").write_text("same", encoding="utf-8")
+    (tmp_path / "c.txt").write_text("unique", encoding="utf-8")
+    index.scan_and_index([str(tmp_path)])
+
+    (tmp_path / "a.txt").unlink()
+    (tmp_path / "c.txt").unlink()
+    res = index.remove_paths([str(tmp_path / "a.txt"), str(tmp_path / "c.txt")])
+
+    assert (res["removed"], res["renamed"]) == (1, 1)
+    assert moved == [str(tmp_path / "b.txt")]
+    assert len(deleted) == 1
+
+
+def test_chunks_are_written_with_vectors(tmp_path, monkeypatch, fake_wv):
+    monkeypatch.setattr(index.settings, "ingest_workers", 0)
+    monkeypatch.setattr(index, "_embedder", lambda: lambda texts: [[float(len(t))] for t in texts])
+    seen = {}
+    def add_chunks(doc_uuid, path, title, chunks, errors=None, start=0, vectors=None):
+        seen[path] = vectors
+        return len(chunks)
+    monkeypatch.setattr(index.wv, "add_chunks", add_chunks)
+    (tmp_path / "a.txt").write_text("x" * 1500, encoding="utf-8")
+
+    res = index.scan_and_index([str(tmp_path)])
+
+    assert seen[str(tmp_path / "a.txt")] == [[1200.0], [500.0]]
+    assert res["embedded"] == 2
+
+
+def _fake_pdf(monkeypatch, tmp_path, n_pages, blank):
+    from concurrent.futures import ThreadPoolExecutor
+    from types import SimpleNamespace
+
+    pdf = tmp_path / "doc.pdf"
+    pdf.write_bytes(b"%PDF-fake")
+    pages = [
+        SimpleNamespace(
+            extract_text=lambda i=i: "" if i in blank else f"layer text of page {i:03d}"
+        )
+        for i in range(n_pages)
+    ]
+    monkeypatch.setattr(index, "PdfReader", lambda fh: SimpleNamespace(pages=pages))
+    monkeypatch.setattr(index, "_ocr_available", lambda: True)
+    monkeypatch.setattr(index, "_ocr_pdf_page", lambda path, i, zoom, lang: f"ocr {i}")
+    pools = []
+
+    def new_pool(workers):
+        pools.append(workers)
+        return ThreadPoolExecutor(workers)
+
+    monkeypatch.setattr(index, "_new_pool", new_pool)
+    monkeypatch.setattr(index.settings, "data_processed", str(tmp_path / "processed"))
+    return str(pdf), pools
+
+
+def _no_hashing(path):
+    raise AssertionError(f"unexpected hashing of {path}")
+
+
+def test_pdf_ocr_uses_one_pool_and_keeps_page_order(tmp_path, monkeypatch):
+    monkeypatch.setattr(index.settings, "ocr_workers", 2)
+    monkeypatch.setattr(index.settings, "ocr_cache_enabled", True)
+    blank = {1, 9, 10, 17}
+    path, pools = _fake_pdf(monkeypatch, tmp_path, 20, blank)
+    # sha уже известен из скана — файл повторно не хешируется
+    monkeypatch.setattr(index, "sha256_file", _no_hashing)
+
+    text = "".join(index._iter_pdf_pages(path, sha="a" * 64))
+    expected = [f"ocr {i}" if i in blank else f"layer text of page {i:03d}" for i in range(20)]
+    assert text == "\n\n".join(expected)
+    assert pools == [2]
+
+
+def test_pdf_without_ocr_pages_is_not_hashed(tmp_path, monkeypatch):
+    monkeypatch.setattr(index.settings, "ocr_cache_enabled", True)
+    path, pools = _fake_pdf(monkeypatch, tmp_path, 3, set())
+    monkeypatch.setattr(index, "sha256_file", _no_hashing)
+    assert "".join(index._iter_pdf_pages(path)).count("layer text") == 3
+    assert pools == []
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_failed_chunks_unregister_document_for_retry(tmp_path, monkeypatch, fake_wv, stream):
+    monkeypatch.setattr(index.settings, "ingest_workers", 0)
+    if stream:
+        monkeypatch.setattr(index, "_stream_threshold", lambda: 0)
+    docs, deleted = {}, []
+    monkeypatch.setattr(index.wv, "known_documents", lambda refresh=False: dict(docs))
+    monkeypatch.setattr(
+        index.wv, "upsert_document", lambda fp, sha, title, size: docs.setdefault(sha, fp)
+    )
+    monkeypatch.setattr(
+        index.wv, "delete_document", lambda sha: deleted.append(docs.pop(sha)) or True
+    )
+    fail = [True]
+
+    def add_chunks(doc_uuid, path, title, chunks, errors=None, **kw):
+        if fail[0]:
+            errors.append({"uuid": "u1", "error": "boom"})
+            return len(chunks) - 1
+        return len(chunks)
+
+    monkeypatch.setattr(index.wv, "add_chunks", add_chunks)
+    (tmp_path / "a.txt").write_text("alpha " * 50, encoding="utf-8")
+
+    res = index.scan_and_index([str(tmp_path)])
+    assert res["files_indexed"] == 0 and deleted == [str(tmp_path / "a.txt")]
+    assert {"path": str(tmp_path / "a.txt"), "uuid": "u1", "error": "boom"} in res["errors"]
+
+    fail[0] = False
+    assert index.scan_and_index([str(tmp_path)])["files_indexed"] == 1
+
+
+def test_file_timeout_counts_only_time_in_a_worker(tmp_path, monkeypatch):
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    monkeypatch.setattr(index.settings, "ingest_workers", 1)
+    monkeypatch.setattr(index.settings, "ingest_queue_depth", 3)
+    monkeypatch.setattr(index.settings, "ingest_file_timeout", 1.0)
+    monkeypatch.setattr(index, "_new_pool", lambda workers: ThreadPoolExecutor(workers))
+    monkeypatch.setattr(
+        index, "_extract_timed", lambda fp, sha=None: (time.sleep(0.7) or [fp], 0.7)
+    )
+    files = [str(tmp_path / f"{n}.txt") for n in "abc"]
+
+    # третий файл ждёт в очереди дольше таймаута, но сам укладывается
+    out = list(index._iter_extracted(files))
+    assert sorted(fp for fp, _, _ in out) == files
+    assert all(err is None for _, _, err in out)
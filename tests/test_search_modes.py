@@ -0,0 +1,157 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import Response
+from starlette.requests import Request
+
+from weavelens.api.routers import search
+from weavelens.llm import answer_cache
+from weavelens.llm.answer_cache import AnswerCache
+
+
+@pytest.fixture(autouse=True)
+def fresh_answer_cache(monkeypatch):
+    monkeypatch.setattr(answer_cache, "_cache", AnswerCache(16, 60.0))
+
+
+def _request(headers=None):
+    raw = [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]
+    return Request({"type": "http", "headers": raw})
+
+def test_bm25_mode_skips_embedding(monkeypatch):
+    async def bm25(q, k):
+        return [{"q": q, "k": k}]
+
+    async def hybrid(*a, **kw):
+        raise AssertionError("hybrid must not be called")
+
+    monkeypatch.setattr(search.awv, "search_bm25", bm25)
+    monkeypatch.setattr(search.awv, "search_hybrid", hybrid)
+    body = search.QueryIn(q="отчёт", k=3, mode="bm25")
+    assert asyncio.run(search._retrieve(body)) == [{"q": "отчёт", "k": 3}]
+
+
+
+def test_ask_stream_sends_hits_then_tokens(monkeypatch):
+    hits = [{"path": "a.txt", "text": "x"}]
+
+    async def fake_retrieve(body, prof=None):
+        return hits
+
+    async def fake_stream(prompt, model=None, timeout=None, **kw):
+        for piece in ("о", "к"):
+            yield piece
+
+    monkeypatch.setattr(search, "_retrieve", fake_retrieve)
+    monkeypatch.setattr(search, "ollama_generate_stream", fake_stream)
+
+    async def collect():
+        return [ev async for ev in search._ask_events(search.QueryIn(q="?"))]
+
+    events = asyncio.run(collect())
+    assert [e["type"] for e in events] == ["hits", "token", "token", "done"]
+    assert events[0]["hits"] == hits
+    assert "".join(e["text"] for e in events if e["type"] == "token") == "ок"
+
+
+def test_ask_stream_encodes_weaviate_hits(monkeypatch):
+    from types import SimpleNamespace
+    from uuid import uuid4
+
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    from weavelens.db import weaviate_client as wv
+
+    objs = [
+        SimpleNamespace(uuid=uuid4(), properties={"text": "x", "path": "a.txt"},
+                        metadata=SimpleNamespace(score=1.5, distance=None))
+        for _ in range(2)
+    ]
+
+    async def fake_retrieve(body, prof=None):
+        return wv._to_hits(SimpleNamespace(objects=objs))
+
+    async def fake_stream(prompt, model=None, timeout=None, **kw):
+        yield "ок"
+
+    monkeypatch.setattr(search, "_retrieve", fake_retrieve)
+    monkeypatch.setattr(search, "ollama_generate_stream", fake_stream)
+    app = FastAPI()
+    app.include_router(search.router)
+    resp = TestClient(app).post("/ask/stream", json={"q": "?"})
+    events = [json.loads(line) for line in resp.text.splitlines()]
+    assert [e["type"] for e in events] == ["hits", "token", "done"]
+    assert [h["chunk_id"] for h in events[0]["hits"]] == [str(o.uuid) for o in objs]
+
+
+def test_ask_stream_debug_reports_stage_timings(monkeypatch):
+    async def fake_retrieve(body, prof=None):
+        return [{"chunk_id": "c1", "path": "a.txt", "text": "x"}]
+
+    async def fake_stream(prompt, model=None, timeout=None, stats=None, **kw):
+        yield "ок"
+        if stats is not None:
+            stats.update(queue_ms=0.0, prompt_tokens=42, completion_tokens=1)
+
+    monkeypatch.setattr(search, "_retrieve", fake_retrieve)
+    monkeypatch.setattr(search, "ollama_generate_stream", fake_stream)
+
+    async def done(debug):
+        body = search.QueryIn(q=f"вопрос {debug}?", debug=debug)
+        prof = search._profile(body, _request(), "ask_stream")
+        return [ev async for ev in search._ask_events(body, None, prof)][-1]
+
+    assert "timings" not in asyncio.run(done(False))
+    t = asyncio.run(done(True))["timings"]
+    assert {"retrieval", "cache_lookup", "context_format", "llm_total"} <= set(t["stages_ms"])
+    assert "llm_first_token" in t["marks_ms"]
+    assert t["prompt_tokens"] == 42 and t["prompt_chars"] > 0
+
+
+def test_ask_answer_cached_by_query_and_chunks(monkeypatch):
+    hits = [{"chunk_id": "c1", "text": "x"}, {"chunk_id": "c2", "text": "y"}]
+    calls = []
+
+    async def fake_retrieve(body, prof=None):
+        return list(hits)
+
+    async def fake_generate(prompt, model=None, timeout=None, **kw):
+        calls.append(prompt)
+        return f"ответ {len(calls)}"
+
+    monkeypatch.setattr(search, "_retrieve", fake_retrieve)
+    monkeypatch.setattr(search, "ollama_generate", fake_generate)
+
+    def ask(q):
+        resp = Response()
+        out = asyncio.run(search.ask(search.QueryIn(q=q), resp, _request()))
+        return out, resp.headers["X-Answer-Cache"]
+
+    first, h1 = ask("Что такое RAG?")
+    again, h2 = ask("что  такое rag")
+    assert (h1, h2) == ("miss", "hit-exact")
+    assert again["answer"]["text"] == first["answer"]["text"] == "ответ 1"
+    assert again["cache"]["hit"] and again["cache"]["kind"] == "exact"
+
+    # переиндексация меняет id чанков — старый ответ недостижим
+    hits[1] = {"chunk_id": "c3", "text": "y2"}
+    _, h3 = ask("Что такое RAG?")
+    assert h3 == "miss" and len(calls) == 2
+
+
+def test_semantic_lookup_requires_same_chunks_and_similarity():
+    cache = AnswerCache(16, 60.0, semantic=True, min_sim=0.9)
+    hits = [{"chunk_id": "a"}, {"chunk_id": "b"}]
+    cache.set("как оформить отпуск", hits, "заявление", vector=[1.0, 0.0])
+    found = cache.get("как оформляется отпуск", list(reversed(hits)), vector=[0.96, 0.28])
+    assert found is not None and found[0] == "semantic" and found[1]["text"] == "заявление"
+    assert cache.get("как оформляется отпуск", hits, vector=[0.6, 0.8]) is None
+    assert cache.get("как оформляется отпуск", [{"chunk_id": "a"}], vector=[1.0, 0.0]) is None
+
+
+def test_debug_timings_header_enables_profile():
+    body = search.QueryIn(q="?")
+    assert search._profile(body, _request(), "search") is None
+    assert search._profile(body, _request({"X-Debug-Timings": "1"}), "search") is not None
@@ -0,0 +1,65 @@
+from weavelens.pipeline import watch
+
+
+def test_split_changes_by_current_state(tmp_path):
+    kept = tmp_path / "new.txt"
+    kept.write_text("x", encoding="utf-8")
+    (tmp_path / "note.bin").write_bytes(b"x")
+    gone = tmp_path / "gone.pdf"
+
+    changed, deleted = watch.split_changes(
+        [str(kept), str(tmp_path / "note.bin"), str(gone), str(tmp_path)]
+    )
+
+    assert changed == {str(kept)}
+    assert deleted == {str(gone)}
+
+
+def test_index_changes_routes_to_scan_and_remove(monkeypatch):
+    calls = {}
+    monkeypatch.setattr(
+        watch, "scan_and_index",
+        lambda paths, **kw: calls.setdefault("scan", paths)
+        and {"files_indexed": 1, "chunks_indexed": 4},
+    )
+    monkeypatch.setattr(
+        watch, "remove_paths",
+        lambda paths: calls.setdefault("remove", paths) and {"removed": 1, "renamed": 0},
+    )
+
+    res = watch.index_changes({"/in/b.txt", "/in/a.txt"}, {"/in/c.txt"})
+
+    assert calls == {"scan": ["/in/a.txt", "/in/b.txt"], "remove": ["/in/c.txt"]}
+    assert (res["files_indexed"], res["chunks_indexed"], res["removed"]) == (1, 4, 1)
+
+
+def test_watcher_edit_keeps_document_shared_with_other_file(tmp_path, monkeypatch):
+    from weavelens.pipeline import index
+
+    monkeypatch.setattr(index.settings, "data_processed", str(tmp_path / "processed"))
+    monkeypatch.setattr(index.settings, "ingest_workers", 0)
+    monkeypatch.setattr(index, "_embedder", lambda: None)
+    docs, deleted, moved = {}, [], []
+    monkeypatch.setattr(index.wv, "known_documents", lambda refresh=False: dict(docs))
+    monkeypatch.setattr(index.wv, "find_document_by_sha256", docs.get)
+    monkeypatch.setattr(
+        index.wv, "upsert_document", lambda fp, sha, title, size: docs.setdefault(sha, fp)
+    )
+    monkeypatch.setattr(
+        index.wv, "add_chunks", lambda doc_uuid, path, title, chunks, **kw: len(chunks)
+    )
+    monkeypatch.setattr(index.wv, "delete_document", lambda sha: deleted.append(sha) or True)
+    monkeypatch.setattr(index.wv, "repoint_document", lambda sha, p, t: moved.append(p) or True)
+
+    a, b = tmp_path / "in" / "a.txt", tmp_path / "in" / "b.txt"
+    a.parent.mkdir()
+    a.write_text("same", encoding="utf-8")
+    b.write_text("same", encoding="utf-8")
+    index.scan_and_index([str(a.parent)])
+
+    # пачка watcher'а видит только a.txt; b.txt с тем же содержимым вне скана
+    a.write_text("edited", encoding="utf-8")
+    res = watch.index_changes([str(a)], [])
+
+    assert res["files_indexed"] == 1 and res["errors"] == []
+    assert deleted == [] and moved == [str(b)]
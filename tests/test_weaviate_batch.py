@@ -0,0 +1,194 @@
+from types import SimpleNamespace
+
+from weavelens.db import weaviate_client as wv
+
+
+class _FakeBatch:
+    def __init__(self, failed_uuids=()):
+        self.added = []
+        self.failed_objects = []
+        self._failed_uuids = set(failed_uuids)
+
+    def fixed_size(self, batch_size, concurrent_requests):
+        return self
+
+    def dynamic(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        for uid, _ in self.added:
+            if uid in self._failed_uuids:
+                obj = SimpleNamespace(uuid=uid)
+                self.failed_objects.append(SimpleNamespace(message="boom", object_=obj))
+        return False
+
+    def add_object(self, properties, uuid):
+        self.added.append((uuid, properties))
+
+
+def test_chunk_uuid_is_deterministic():
+    assert wv.chunk_uuid("doc", 3) == wv.chunk_uuid("doc", 3)
+    assert wv.chunk_uuid("doc", 3) != wv.chunk_uuid("doc", 4)
+    assert wv.document_uuid("a" * 64) == wv.document_uuid("a" * 64)
+
+
+def test_batch_insert_reports_failed_objects():
+    bad = wv.chunk_uuid("d", 1)
+    coll = SimpleNamespace(batch=_FakeBatch(failed_uuids={bad}))
+    objs = [(wv.chunk_uuid("d", i), {"order": i}) for i in range(3)]
+    errors = []
+    assert wv.batch_insert(coll, objs, errors) == 2
+    assert errors == [{"uuid": bad, "error": "boom"}]
+
+
+class _FakeDocs:
+    """Коллекция document: fetch_objects по sha256, insert/update по uuid."""
+
+    def __init__(self, objects=None):
+        self.objects = dict(objects or {})  # uuid -> properties
+        self.queries = 0
+        self.query = SimpleNamespace(fetch_objects=self._fetch)
+        self.data = SimpleNamespace(insert=self._insert, update=self._update)
+
+    def _fetch(self, filters, limit, return_properties):
+        self.queries += 1
+        sha = filters.value
+        found = [SimpleNamespace(uuid=u) for u, p in self.objects.items() if p["sha256"] == sha]
+        return SimpleNamespace(objects=found[:limit])
+
+    def _insert(self, properties, uuid):
+        if uuid in self.objects:
+            raise wv.ObjectAlreadyExistsError(f"id '{uuid}' already exists")
+        self.objects[uuid] = properties
+        return uuid
+
+    def _update(self, uuid, properties):
+        self.objects[uuid].update(properties)
+
+
+def _fake_client(monkeypatch, docs):
+    collections = SimpleNamespace(get=lambda name: docs)
+    monkeypatch.setattr(wv, "client", lambda: SimpleNamespace(collections=collections))
+
+
+def test_sha_index_short_circuits_lookup(monkeypatch):
+    docs = _FakeDocs()
+    _fake_client(monkeypatch, docs)
+    monkeypatch.setattr(wv, "_sha_index", {"abc": "uuid-1"})
+    assert wv.find_document_by_sha256("abc") == "uuid-1"
+    assert docs.queries == 0
+    wv._remember_document("def", "uuid-2")
+    assert wv.find_document_by_sha256("def") == "uuid-2"
+
+
+def test_stale_sha_index_falls_back_to_query(monkeypatch):
+    # документ записал другой процесс: в индексе его нет, в Weaviate — есть
+    uid = wv.document_uuid("f" * 64)
+    docs = _FakeDocs({uid: {"sha256": "f" * 64, "path": "a.txt"}})
+    _fake_client(monkeypatch, docs)
+    monkeypatch.setattr(wv, "_sha_index", {})
+    assert wv.find_document_by_sha256("f" * 64) == uid
+    assert wv.find_document_by_sha256("f" * 64) == uid and docs.queries == 1
+    assert wv.find_document_by_sha256("0" * 64) is None
+
+    # гонка: документ появился между lookup и insert — запись становится обновлением
+    monkeypatch.setattr(wv, "find_document_by_sha256", lambda sha: None)
+    assert wv.upsert_document("b.txt", "f" * 64, "b.txt", 1) == uid
+    assert docs.objects[uid]["path"] == "b.txt"
+
+
+def test_repoint_rewrites_chunks_in_one_batch(monkeypatch):
+    uid = wv.document_uuid("a" * 64)
+    monkeypatch.setattr(wv, "find_document_by_sha256", lambda sha: uid)
+    stored = [
+        SimpleNamespace(
+            uuid=wv.chunk_uuid(uid, i),
+            properties={"order": i, "text": f"t{i}", "path": "old"},
+            vector={"default": [float(i)]},
+        )
+        for i in range(5)
+    ]
+    pages = []
+
+    def fetch_objects(filters, sort, limit, include_vector):
+        last = filters.filters[1].value  # order > last
+        page = [o for o in stored if o.properties["order"] > last][:limit]
+        pages.append(len(page))
+        return SimpleNamespace(objects=page)
+
+    batch, vectors = _FakeBatch(), {}
+    batch.add_object = lambda properties, uuid, vector=None: (
+        batch.added.append((uuid, properties)), vectors.__setitem__(uuid, vector)
+    )
+    chunks = SimpleNamespace(query=SimpleNamespace(fetch_objects=fetch_objects), batch=batch)
+    docs = SimpleNamespace(data=SimpleNamespace(update=lambda uuid, properties: None))
+    collections = SimpleNamespace(get=lambda name: chunks if name == wv.CHUNK_COLLECTION else docs)
+    monkeypatch.setattr(wv, "client", lambda: SimpleNamespace(collections=collections))
+
+    assert wv.repoint_document("a" * 64, "new.txt", "new.txt", page_size=2)
+    assert pages == [2, 2, 1]
+    assert [p["path"] for _, p in batch.added] == ["new.txt"] * 5
+    last_uuid, last_props = batch.added[4]
+    assert (last_props["text"], vectors[last_uuid]) == ("t4", [4.0])
+
+
+def test_chunk_pages_use_has_vector_flag_without_loading_vectors(monkeypatch):
+    ids = [wv.chunk_uuid("d", i) for i in range(4)]
+    flags = [True, False, None, None]  # два последних — чанки до флага has_vector
+    stored = [
+        SimpleNamespace(uuid=u, properties={"order": i, "has_vector": f})
+        for i, (u, f) in enumerate(zip(ids, flags))
+    ]
+    fetched = []
+
+    def iterator(after=None, cache_size=None, **kw):
+        assert "include_vector" not in kw
+        return iter(stored)
+
+    def fetch_objects(filters, limit, include_vector, return_properties):
+        fetched.append(limit)
+        return SimpleNamespace(objects=[SimpleNamespace(uuid=ids[2], vector={"default": [0.1]})])
+
+    coll = SimpleNamespace(iterator=iterator, query=SimpleNamespace(fetch_objects=fetch_objects))
+    _fake_client(monkeypatch, coll)
+    pages = list(wv.iter_chunk_pages(page_size=4))
+    assert [has for _, _, has in pages[0]] == [True, False, True, False]
+    assert fetched == [2]
+
+
+def test_hit_score_is_higher_is_better_in_every_mode():
+    def res(**meta):
+        obj = SimpleNamespace(uuid="u", properties={"text": "t"}, metadata=SimpleNamespace(**meta))
+        return SimpleNamespace(objects=[obj])
+
+    near = wv._to_hits(res(score=None, distance=0.1))[0]
+    far = wv._to_hits(res(score=None, distance=0.7))[0]
+    assert near["score"] > far["score"] and near["distance"] == 0.1
+    bm25 = wv._to_hits(res(score=2.5, distance=None))[0]
+    assert (bm25["score"], bm25["distance"]) == (2.5, None)
+
+
+def test_bm25_hits_carry_weaviate_scores(monkeypatch):
+    calls = []
+
+    def bm25(query, limit, return_properties, return_metadata=None):
+        calls.append(return_metadata)
+        objs = [
+            SimpleNamespace(
+                uuid=f"u{i}",
+                properties={"text": t},
+                metadata=SimpleNamespace(score=s if return_metadata else None, distance=None),
+            )
+            for i, (t, s) in enumerate((("best", 3.2), ("worse", 1.1)))
+        ]
+        return SimpleNamespace(objects=objs)
+
+    coll = SimpleNamespace(query=SimpleNamespace(bm25=bm25))
+    _fake_client(monkeypatch, coll)
+    hits = wv.search_bm25("отчёт", k=2)
+    assert calls[0].score
+    assert [h["text"] for h in hits] == ["best", "worse"]
+    assert [h["score"] for h in hits] == [3.2, 1.1]